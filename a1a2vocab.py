@@ -1,9 +1,21 @@
+import os
 import re
+import json
+import base64
+import time
+import tempfile
+import weakref
+import httpx
 import streamlit as st
 import pandas as pd
-from datetime import datetime, date
-from typing import Optional, List, Dict
-from supabase import create_client, Client, AuthApiError
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict, Tuple, Iterator
+from postgrest import SyncPostgrestClient
+from supabase import create_client, Client, ClientOptions, AuthApiError
+
+from pos_queue import SyncWorker, WriteQueue
+from reorder import DemandHistory, reorder_plan
+from query_log import Call, LoggingTransport, QueryLog, otlp_tracer, summarize
 
 # -------------------------------
 # Setup
@@ -12,13 +24,29 @@ st.set_page_config(page_title="Inventory (Supabase)", page_icon="📦", layout="
 
 url = st.secrets.get("SUPABASE_URL", "")
 key = st.secrets.get("SUPABASE_ANON_KEY", "")
-sb: Client = create_client(url, key)
 
 MIN_PASSWORD_LENGTH = 6
-
-# (Optional) quick debug so you can confirm the project pointed to by this app
-st.caption(f"Target project host: {url.split('//')[-1]}")
-st.caption(f"Anon key prefix: {key[:10]}… len={len(key)}")
+CACHE_TTL_SECONDS = 30
+PAGE_SIZE = 50
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+DELTA_POLL_SECONDS = 5
+LATEST_STOCK_LIMIT = 20
+FULL_REFRESH_SECONDS = 900
+REORDER_HISTORY_DAYS = 365
+REORDER_WINDOW_DAYS = 28
+REORDER_LEAD_DAYS = 7
+REORDER_REVIEW_DAYS = 7
+REORDER_SERVICE_Z = 1.65  # ~95% chance of not running out during the lead time
+POS_QUEUE_PATH = st.secrets.get("POS_QUEUE_PATH", "pos_queue.sqlite3")
+# Extra debug output and identity RPCs; set DIAGNOSTICS = true in secrets to enable.
+DIAGNOSTICS = bool(st.secrets.get("DIAGNOSTICS", False))
+# Export every Supabase query as an OpenTelemetry span (needs the opentelemetry SDK + OTLP exporter).
+OTEL_ENDPOINT = st.secrets.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+if DIAGNOSTICS:
+    # Quick debug so you can confirm the project pointed to by this app
+    st.caption(f"Target project host: {url.split('//')[-1]}")
+    st.caption(f"Anon key prefix: {key[:10]}… len={len(key)}")
 
 # -------------------------------
 # Diagnostics & helpers
@@ -55,6 +83,59 @@ def show_supabase_error(stage: str, err: Exception):
     st.error("\n".join(str(p) for p in parts))
     st.exception(err)  # still useful locally
 
+# -------------------------------
+# Clients (shared per process, handle per session)
+# -------------------------------
+@st.cache_resource
+def get_client() -> Client:
+    """
+    Process-wide Supabase client, used only for stateless auth calls
+    (sign-up, sign-in, token checks). Data access goes through db().
+    """
+    return create_client(url, key, options=ClientOptions(auto_refresh_token=False, persist_session=False))
+
+@st.cache_resource
+def http_transport() -> httpx.HTTPTransport:
+    """Keep-alive connection pool shared by every session's PostgREST handle."""
+    return httpx.HTTPTransport(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20), retries=1)
+
+@st.cache_resource
+def otel_tracer():
+    """Process-wide span exporter, or None when OTEL is off or not installed."""
+    return otlp_tracer(OTEL_ENDPOINT) if OTEL_ENDPOINT else None
+
+def query_log() -> QueryLog:
+    """This session's record of Supabase calls, grouped by rerun (see the Settings page)."""
+    log = st.session_state.get("_query_log")
+    if log is None:
+        log = st.session_state["_query_log"] = QueryLog(tracer=otel_tracer())
+    return log
+
+def db() -> SyncPostgrestClient:
+    """
+    This session's PostgREST handle, carrying the user's JWT (anon key before login).
+    Its httpx client holds only this session's headers and sends through the shared
+    transport, logging each call into query_log(). Never close these clients.
+    """
+    token = st.session_state.get("jwt") or key
+    handle = st.session_state.get("_db")
+    if handle is None or st.session_state.get("_db_token") != token:
+        base_url = f"{url}/rest/v1"
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "apikey": key,
+            "Authorization": f"Bearer {token}",
+        }
+        session = httpx.Client(base_url=base_url, headers=headers, timeout=30.0,
+                               follow_redirects=True, transport=LoggingTransport(http_transport(), query_log()))
+        handle = SyncPostgrestClient(base_url, headers=headers, http_client=session)
+        st.session_state["_db"] = handle
+        st.session_state["_db_token"] = token
+    return handle
+
+sb: Client = get_client()
+
 def success_rerun(msg: str):
     st.success(msg)
     st.rerun()
@@ -74,41 +155,70 @@ def is_valid_email(s: str) -> bool:
 # Session helpers
 # -------------------------------
 def attach_tokens(access: str, refresh: str):
-    """Attach tokens to both auth and postgrest clients (RLS needs the bearer)."""
-    sb.auth.set_session(access_token=access, refresh_token=refresh)
-    sb.postgrest.auth(access)
+    """Keep this user's tokens in session state; db() sends the bearer with every query (RLS needs it)."""
+    st.session_state["jwt"] = access
+    st.session_state["rt"] = refresh
+    st.session_state.pop("_db", None)
+
+def jwt_expiry(token: str) -> float:
+    """The `exp` claim (epoch seconds) of a JWT, read locally without verifying; 0 if unreadable."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return 0.0
 
 def reattach_session():
-    """Re-attach tokens on reruns if saved (handle expired sessions)."""
+    """
+    Keep saved tokens usable across reruns. A token that is not close to expiry is
+    used as is (no network); otherwise it is refreshed once with the refresh token.
+    """
     access = st.session_state.get("jwt")
     refresh = st.session_state.get("rt")
-    if access and refresh:
-        try:
-            sb.auth.set_session(access_token=access, refresh_token=refresh)
-            sb.postgrest.auth(access)
-        except AuthApiError:
-            for key in ("user", "jwt", "rt", "org_id", "role"):
-                st.session_state.pop(key, None)
-            st.warning("Session expired. Please log in again.")
-        except Exception:
-            for key in ("user", "jwt", "rt", "org_id", "role"):
-                st.session_state.pop(key, None)
+    if not (access and refresh):
+        return
+    if jwt_expiry(access) - time.time() > TOKEN_REFRESH_MARGIN_SECONDS:
+        return
+    try:
+        res = sb.auth.refresh_session(refresh)
+        attach_tokens(res.session.access_token, res.session.refresh_token)
+    except AuthApiError:
+        for key in ("user", "jwt", "rt", "org_id", "role", "membership_user", "_db"):
+            st.session_state.pop(key, None)
+        st.warning("Session expired. Please log in again.")
+    except Exception:
+        for key in ("user", "jwt", "rt", "org_id", "role", "membership_user", "_db"):
+            st.session_state.pop(key, None)
+
+def current_user_id() -> Optional[str]:
+    return (st.session_state.get("user") or {}).get("id")
 
 def logout():
     """Clear only local state; do not try to unauth PostgREST with None token."""
-    for k in ("user", "jwt", "rt", "org_id", "role"):
+    org_id = st.session_state.get("org_id")
+    if org_id:
+        # The org's worker is shared; take back this session's credentials. The
+        # user's queued writes stay on disk and sync when they next sign in.
+        _org_sync_worker(org_id).release_sender(st.session_state.pop("_sync_send", None), current_user_id())
+    export = st.session_state.pop("sales_export", None)
+    if export:
+        export.remove()
+    for k in ("user", "jwt", "rt", "org_id", "role", "membership_user", "_db", "_data_cache", "_live_stock", "_demand", "basket", "prod_cursors", "sales_cursors", "stocktake"):
         st.session_state.pop(k, None)
     st.rerun()
 
 def check_db_identity():
     """
-    Optional debug: show who the DB thinks we are.
+    Optional debug: show who the DB thinks we are. Only runs with DIAGNOSTICS on.
     Requires two helper RPCs in DB (safe to try even if missing):
       whoami() returns uuid; whoami_role() returns text
     """
+    if not DIAGNOSTICS:
+        return
     try:
-        who = sb.rpc("whoami").execute().data
-        role = sb.rpc("whoami_role").execute().data
+        who = db().rpc("whoami").execute().data
+        role = db().rpc("whoami_role").execute().data
         st.info(f"DB sees user: {who}, role: {role}")
     except Exception:
         pass
@@ -120,7 +230,7 @@ reattach_session()
 # Org & membership
 # -------------------------------
 def get_user_orgs(user_id: str) -> List[Dict]:
-    res = sb.table("org_members").select("org_id, role").eq("user_id", user_id).execute()
+    res = db().table("org_members").select("org_id, role").eq("user_id", user_id).execute()
     return res.data or []
 
 def create_store_for_logged_in_user(store_name: str) -> str:
@@ -128,16 +238,11 @@ def create_store_for_logged_in_user(store_name: str) -> str:
     Creates org (name only) + membership(owner) using the current user's JWT.
     Does NOT require an owner_id column on orgs.
     """
-    # Ensure PostgREST is using the current JWT *now*
-    jwt = st.session_state.get("jwt")
-    if jwt:
-        sb.postgrest.auth(jwt)
-
     user_id = st.session_state["user"]["id"]
 
     # 1) Create the org (no owner_id field assumed)
     try:
-        org = sb.table("orgs").insert({"name": store_name}).execute()
+        org = db().table("orgs").insert({"name": store_name}).execute()
     except Exception as e:
         # Surface useful info from PostgREST/Supabase errors
         msg = code = ""
@@ -153,7 +258,7 @@ def create_store_for_logged_in_user(store_name: str) -> str:
 
     # 2) Create membership for current user (owner)
     try:
-        sb.table("org_members").insert({
+        db().table("org_members").insert({
             "user_id": user_id,
             "org_id": org_id,
             "role": "owner",
@@ -174,12 +279,11 @@ def ensure_membership_and_bootstrap(default_store_name: str = "My Store") -> Non
     """
     Guarantees the logged-in user has an org + membership in session state.
     If none exists, creates one and then sets st.session_state['org_id']/['role'].
+    The result is kept for the whole session, so this only queries once per login.
     """
-    jwt = st.session_state.get("jwt")
-    if jwt:
-        sb.postgrest.auth(jwt)
-
     user_id = st.session_state["user"]["id"]
+    if st.session_state.get("org_id") and st.session_state.get("membership_user") == user_id:
+        return
 
     rows = get_user_orgs(user_id)
     if not rows:
@@ -199,14 +303,71 @@ def ensure_membership_and_bootstrap(default_store_name: str = "My Store") -> Non
 
     st.session_state["org_id"] = rows[0]["org_id"]
     st.session_state["role"] = rows[0]["role"]
+    st.session_state["membership_user"] = user_id
     st.rerun()
 
+# -------------------------------
+# Data cache (per session, short TTL)
+# -------------------------------
+def cached(org_id: str, kind: str, loader, params: tuple = (), ttl: float = CACHE_TTL_SECONDS) -> pd.DataFrame:
+    """
+    Return loader() from the session cache, keyed by (org_id, kind, params),
+    reloading after ttl seconds.
+    Every page in a rerun shares the same entry; writes drop it via invalidate().
+    A copy is returned so pages can add helper columns without touching the cache.
+    """
+    cache = st.session_state.setdefault("_data_cache", {})
+    cache_key = (org_id, kind, params)
+    hit = cache.get(cache_key)
+    now = time.monotonic()
+    if hit is None or now - hit[0] > ttl:
+        hit = (now, loader())
+        cache[cache_key] = hit
+    return hit[1].copy()
+
+def invalidate(org_id: str, *kinds: str):
+    """
+    Drop cached entries of the given kinds for one org (all params).
+    The live stock table and demand history are not dropped; they are asked
+    for a delta on their next read.
+    """
+    cache = st.session_state.get("_data_cache", {})
+    for cache_key in [k for k in cache if k[0] == org_id and k[1] in kinds]:
+        cache.pop(cache_key, None)
+    live = st.session_state.get("_live_stock", {}).get(org_id)
+    if live is not None and ("stock" in kinds or "products" in kinds):
+        live["polled_at"] = float("-inf")
+    demand = st.session_state.get("_demand", {}).get(org_id)
+    if demand is not None and "sales" in kinds:
+        demand["fetched_at"] = float("-inf")
+
 # -------------------------------
 # Data access (Supabase)
 # -------------------------------
-def list_products(org_id: str) -> pd.DataFrame:
-    res = sb.table("products").select("*").eq("org_id", org_id).order("name").execute()
-    return pd.DataFrame(res.data or [])
+def _pgrst_quote(value) -> str:
+    """Quote a value for use inside a PostgREST or=(...) filter."""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+PRODUCT_LIST_COLUMNS = ["id", "sku", "name", "unit", "unit_cost", "price", "min_stock", "category", "updated_at"]
+
+def _fetch_products_page(org_id: str, after: Optional[Tuple], limit: int) -> pd.DataFrame:
+    q = db().table("products").select(",".join(PRODUCT_LIST_COLUMNS)).eq("org_id", org_id)
+    if after:
+        name, pid = (_pgrst_quote(v) for v in after)
+        q = q.or_(f"name.gt.{name},and(name.eq.{name},id.gt.{pid})")
+    # One extra row tells the pager whether a next page exists.
+    res = q.order("name").order("id").limit(limit + 1).execute()
+    return pd.DataFrame(res.data or [], columns=PRODUCT_LIST_COLUMNS)
+
+def list_products_page(org_id: str,
+                       after: Optional[Tuple] = None,
+                       limit: int = PAGE_SIZE) -> Tuple[pd.DataFrame, bool]:
+    """
+    One keyset page of products ordered by (name, id), starting after the
+    (name, id) cursor. Returns the page and whether more rows follow.
+    """
+    df = cached(org_id, "products", lambda: _fetch_products_page(org_id, after, limit), ("page", after, limit))
+    return df.head(limit), len(df) > limit
 
 def upsert_product(org_id: str,
                    pid: Optional[str],
@@ -230,111 +391,755 @@ def upsert_product(org_id: str,
         "updated_at": now,
     }
     if pid:
-        sb.table("products").update(data).eq("id", pid).eq("org_id", org_id).execute()
+        db().table("products").update(data).eq("id", pid).eq("org_id", org_id).execute()
     else:
         data["created_at"] = now
-        ins = sb.table("products").insert(data).execute()
+        ins = db().table("products").insert(data).execute()
         new_id = ins.data[0]["id"]
-        sb.table("stock").upsert({"product_id": new_id, "qty": 0}).execute()
+        db().table("stock").upsert({"product_id": new_id, "qty": 0}).execute()
+    invalidate(org_id, "products", "stock", "dashboard", "search")
+
+SEARCH_LIMIT = 20
+
+def search_products(org_id: str, query: str, limit: int = SEARCH_LIMIT) -> pd.DataFrame:
+    """
+    Up to `limit` products matching `query` (sku/name/category, prefix matches
+    first) with their on-hand qty, from the trigram-indexed search_products RPC.
+    """
+    q = (query or "").strip().lower()
+    def load():
+        rows = db().rpc("search_products", {"p_org_id": org_id, "p_query": q, "p_limit": limit}).execute().data
+        return pd.DataFrame(rows or [])
+    return cached(org_id, "search", load, (q, limit))
+
+def offline_products(org_id: str, query: str, limit: int = SEARCH_LIMIT) -> pd.DataFrame:
+    """
+    search_products over what this session already holds (earlier search
+    results, expired or not, and the live stock table) for when Supabase
+    cannot be reached. Quantities are as of when each was loaded.
+    """
+    seen = [hit[1] for (o, kind, _), hit in st.session_state.get("_data_cache", {}).items()
+            if o == org_id and kind == "search"]
+    live = st.session_state.get("_live_stock", {}).get(org_id)
+    if live is not None:
+        seen.append(live["df"].reset_index())
+    seen = [df for df in seen if not df.empty]
+    if not seen:
+        return pd.DataFrame()
+    df = pd.concat(seen, ignore_index=True).drop_duplicates("id", keep="last")
+    q = (query or "").strip().lower()
+    sku, name = df["sku"].fillna("").str.lower(), df["name"].fillna("").str.lower()
+    text = sku + " " + name + " " + df["category"].fillna("").str.lower()
+    df = df[text.str.contains(q, regex=False)].assign(
+        _prefix=(sku.str.startswith(q) | name.str.startswith(q)), _name=name)
+    return df.sort_values(["_prefix", "_name"], ascending=[False, True]).head(limit).drop(columns=["_prefix", "_name"])
+
+# -------------------------------
+# Bulk product import
+# -------------------------------
+IMPORT_COLUMNS = ["sku", "name", "category", "unit", "unit_cost", "price", "min_stock"]
+IMPORT_CHUNK_SIZE = 500
+
+def read_product_sheet(upload) -> pd.DataFrame:
+    """Read an uploaded CSV or XLSX file (XLSX needs openpyxl) as strings."""
+    if upload.name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(upload, dtype=str)
+    return pd.read_csv(upload, dtype=str)
+
+def validate_product_import(raw: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Normalise an import sheet and split it into (valid rows, errors).
+    Errors carry the 1-based sheet row (header = row 1) so users can fix the file.
+    Missing columns and blank cells stay None, so the import keeps what existing
+    products already have there.
+    """
+    df = raw.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_"))
+    missing = [c for c in ("sku", "name") if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    for col in IMPORT_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df = df[IMPORT_COLUMNS].copy()
+    df["row"] = df.index + 2
+
+    for col in ("sku", "name", "category", "unit"):
+        df[col] = df[col].fillna("").astype(str).str.strip()
+    df[["category", "unit"]] = df[["category", "unit"]].replace({"": None})
+
+    problems = pd.Series("", index=df.index)
+    problems[df["sku"] == ""] += "SKU is required; "
+    problems[df["name"] == ""] += "Name is required; "
+    for col in ("unit_cost", "price", "min_stock"):
+        given = df[col].notna() & (df[col].astype(str).str.strip() != "")
+        num = pd.to_numeric(df[col], errors="coerce")
+        problems[given & num.isna()] += f"{col} is not a number; "
+        problems[num < 0] += f"{col} must be >= 0; "
+        df[col] = num
+    dup = df["sku"].ne("") & df["sku"].duplicated(keep=False)
+    problems[dup] += "SKU appears more than once in the file; "
+
+    bad = problems != ""
+    errors = pd.DataFrame({"row": df.loc[bad, "row"], "sku": df.loc[bad, "sku"],
+                           "error": problems[bad].str.rstrip("; ")})
+    return df.loc[~bad].reset_index(drop=True), errors.reset_index(drop=True)
+
+def bulk_upsert_products(org_id: str, rows: pd.DataFrame, chunk_size: int = IMPORT_CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Insert or update validated rows by SKU with the import_products RPC, one
+    call per chunk. Existing products keep their current value wherever a cell
+    is blank or its column is missing; new ones also get a stock row with qty 0.
+    Returns the rows of chunks that failed, with the error message.
+    """
+    failed = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows.iloc[start:start + chunk_size]
+        payload = chunk[IMPORT_COLUMNS].astype(object)
+        payload = payload.where(payload.notna(), None).to_dict("records")
+        try:
+            db().rpc("import_products", {"p_org_id": org_id, "p_rows": payload}).execute()
+        except Exception as e:
+            msg = getattr(e, "message", None) or str(e)
+            failed.append(pd.DataFrame({"row": chunk["row"], "sku": chunk["sku"], "error": msg}))
+    invalidate(org_id, "products", "stock", "dashboard", "search")
+    return pd.concat(failed, ignore_index=True) if failed else pd.DataFrame(columns=["row", "sku", "error"])
 
 def delete_product(org_id: str, pid: str):
-    sb.table("products").delete().eq("id", pid).eq("org_id", org_id).execute()
-
-def get_stock_df(org_id: str) -> pd.DataFrame:
-    prods = list_products(org_id)
-    if prods.empty:
-        return pd.DataFrame(columns=["id", "sku", "name", "unit", "qty", "min_stock", "category"])
-    ids = prods["id"].tolist()
-    st_rows = sb.table("stock").select("*").in_("product_id", ids).execute().data
-    stock = pd.DataFrame(st_rows or []).rename(columns={"product_id": "id"})
-    merged = prods.merge(stock[["id", "qty"]], on="id", how="left")
-    merged["qty"] = merged["qty"].fillna(0)
-    return merged[["id", "sku", "name", "unit", "qty", "min_stock", "category"]]
-
-def receive_stock(org_id: str, product_id: str, qty: float, unit_cost: float):
-    cur = sb.table("stock").select("qty").eq("product_id", product_id).single().execute().data or {"qty": 0}
-    new_qty = float(cur["qty"] or 0) + float(qty)
-    sb.table("stock").upsert({
-        "product_id": product_id,
-        "qty": new_qty,
-        "updated_at": datetime.utcnow().isoformat()
-    }).execute()
-    sb.table("products").update({"unit_cost": float(unit_cost)}).eq("id", product_id).eq("org_id", org_id).execute()
-
-def sell_items(org_id: str, lines: List[Dict], ref: Optional[str]):
-    total = sum(float(l["qty"]) * float(l["unit_price"]) for l in lines)
-    sale = sb.table("sales").insert({"org_id": org_id, "ref": (ref or None), "total": total}).execute().data[0]
-    sale_id = sale["id"]
-    for l in lines:
-        sb.table("sale_items").insert({
-            "sale_id": sale_id,
-            "product_id": l["product_id"],
-            "qty": float(l["qty"]),
-            "unit_price": float(l["unit_price"]),
-        }).execute()
-        cur = sb.table("stock").select("qty").eq("product_id", l["product_id"]).single().execute().data or {"qty": 0}
-        new_qty = float(cur["qty"] or 0) - float(l["qty"])
-        sb.table("stock").upsert({
-            "product_id": l["product_id"],
-            "qty": new_qty,
-            "updated_at": datetime.utcnow().isoformat()
-        }).execute()
+    db().table("products").delete().eq("id", pid).eq("org_id", org_id).execute()
+    invalidate(org_id, "products", "stock", "dashboard", "search")
+
+STOCK_COLUMNS = ["id", "sku", "name", "unit", "qty", "min_stock", "category"]
+
+def _fetch_stock(org_id: str, low_only: bool = False, category: Optional[str] = None) -> pd.DataFrame:
+    q = db().table("stock_view").select(",".join(STOCK_COLUMNS)).eq("org_id", org_id)
+    if low_only:
+        q = q.eq("low_stock", True)
+    if category:
+        q = q.eq("category", category)
+    res = q.order("name").execute()
+    return pd.DataFrame(res.data or [], columns=STOCK_COLUMNS)
+
+def get_stock_df(org_id: str, low_only: bool = False, category: Optional[str] = None) -> pd.DataFrame:
+    """
+    On-hand stock per product from the stock_view join. Unfiltered reads come
+    from the live table (patched with deltas); filtered ones are done server-side.
+    """
+    if not low_only and not category:
+        return live_stock(org_id).reset_index()[STOCK_COLUMNS]
+    return cached(org_id, "stock", lambda: _fetch_stock(org_id, low_only, category), (low_only, category))
+
+# -------------------------------
+# Live stock (delta updates)
+# -------------------------------
+LIVE_STOCK_COLUMNS = ["id", "sku", "name", "unit", "category", "min_stock", "price", "unit_cost",
+                      "qty", "updated_at", "stock_updated_at"]
+LIVE_STOCK_NUMERIC = ["min_stock", "price", "unit_cost", "qty"]
+
+def _stock_changes(org_id: str, since: Optional[str]) -> Dict:
+    return db().rpc("stock_changes", {"p_org_id": org_id, "p_since": since}).execute().data or {}
+
+def _live_stock_frame(rows: Optional[List[Dict]]) -> pd.DataFrame:
+    """
+    Rows indexed by id, with float64 numeric columns whatever the JSON held,
+    so a fractional qty or price in a later delta fits a whole-number load.
+    """
+    df = pd.DataFrame(rows or [], columns=LIVE_STOCK_COLUMNS).set_index("id")
+    return df.astype({c: "float64" for c in LIVE_STOCK_NUMERIC})
 
-def adjust_stock(product_id: str, new_qty: float):
-    sb.table("stock").upsert({
+def apply_stock_delta(df: pd.DataFrame, rows: Optional[List[Dict]], deleted: Optional[List[str]]) -> pd.DataFrame:
+    """
+    Patch changed rows into df (indexed by id) and drop deleted ids. Known rows
+    are updated in place; only products new to df are appended.
+    """
+    if deleted:
+        df.drop(index=[i for i in deleted if i in df.index], inplace=True)
+    if rows:
+        changed = _live_stock_frame(rows)
+        known = changed.index.intersection(df.index)
+        if len(known):
+            df.loc[known, changed.columns] = changed.loc[known]
+        fresh = changed.index.difference(df.index)
+        if len(fresh):
+            df = pd.concat([df, changed.loc[fresh]])
+    return df
+
+def live_stock(org_id: str) -> pd.DataFrame:
+    """
+    The org's products with on-hand qty, indexed by id. Loaded in full once
+    (and every FULL_REFRESH_SECONDS); otherwise refreshed at most every
+    DELTA_POLL_SECONDS with only the rows changed since the last read, so
+    other users' sales show up at O(changes) cost.
+    """
+    live = st.session_state.setdefault("_live_stock", {})
+    state = live.get(org_id)
+    now = time.monotonic()
+    if state is None or now - state["loaded_at"] > FULL_REFRESH_SECONDS:
+        res = _stock_changes(org_id, None)
+        df = _live_stock_frame(res.get("rows"))
+        version = state["version"] + 1 if state else 0
+        state = live[org_id] = {"df": df, "since": res.get("cursor"), "loaded_at": now, "polled_at": now,
+                                "version": version}
+    elif now - state["polled_at"] > DELTA_POLL_SECONDS:
+        res = _stock_changes(org_id, state["since"])
+        if res.get("rows") or res.get("deleted"):
+            state["df"] = apply_stock_delta(state["df"], res.get("rows"), res.get("deleted"))
+            state["version"] += 1
+        state["since"] = res.get("cursor") or state["since"]
+        state["polled_at"] = now
+    return state["df"]
+
+def receive_stock(org_id: str, product_id: str, qty: float, unit_cost: float) -> str:
+    """
+    Queue a receipt locally and return its idempotency key. The sync worker
+    applies it with the receive_stock RPC (stock increment, weighted-average
+    unit cost and a stock movement in one transaction).
+    """
+    key = pos_queue().enqueue(org_id, "receive", {
         "product_id": product_id,
-        "qty": float(new_qty),
-        "updated_at": datetime.utcnow().isoformat()
+        "qty": float(qty),
+        "unit_cost": float(unit_cost),
+    }, current_user_id())
+    sync_worker(org_id).wake()
+    return key
+
+def sell_items(org_id: str, lines: List[Dict], ref: Optional[str]) -> str:
+    """
+    Queue a multi-line sale locally and return its idempotency key. The sync
+    worker commits it with the commit_sale RPC, which inserts the sale and its
+    items and decrements stock (qty = qty - x) in one transaction.
+    """
+    payload = [{
+        "product_id": line["product_id"],
+        "qty": float(line["qty"]),
+        "unit_price": float(line["unit_price"]),
+    } for line in lines]
+    key = pos_queue().enqueue(org_id, "sale", {"lines": payload, "ref": (ref or None)}, current_user_id())
+    sync_worker(org_id).wake()
+    return key
+
+def adjust_stock(org_id: str, product_id: str, new_qty: float, note: Optional[str] = None):
+    """Set the counted quantity; the adjust_stock RPC also records the difference as a movement."""
+    db().rpc("adjust_stock", {
+        "p_org_id": org_id,
+        "p_product_id": product_id,
+        "p_new_qty": float(new_qty),
+        "p_note": (note or None),
     }).execute()
+    invalidate(org_id, "stock", "dashboard", "search")
+
+# -------------------------------
+# Reorder suggestions (demand velocity)
+# -------------------------------
+def _daily_units(org_id: str, since: date) -> Dict:
+    return db().rpc("daily_units", {"p_org_id": org_id, "p_since": since.isoformat()}).execute().data or {}
+
+def demand_history(org_id: str) -> DemandHistory:
+    """
+    Units sold per product and day over the last REORDER_HISTORY_DAYS, held in
+    session. Loaded in full once; afterwards, at most every CACHE_TTL_SECONDS
+    (or after a sale lands), only the last day read onwards is fetched again.
+    """
+    demand = st.session_state.setdefault("_demand", {})
+    state = demand.get(org_id)
+    now = time.monotonic()
+    if state is None:
+        since = datetime.utcnow().date() - timedelta(days=REORDER_HISTORY_DAYS - 1)
+        payload = _daily_units(org_id, since)
+        history = DemandHistory.empty(date.fromisoformat(payload["today"]), REORDER_HISTORY_DAYS).merge(payload)
+        state = demand[org_id] = {"history": history, "fetched_at": now, "version": 0}
+    elif now - state["fetched_at"] > CACHE_TTL_SECONDS:
+        state["history"].merge(_daily_units(org_id, state["history"].end))
+        state["fetched_at"] = now
+        state["version"] += 1
+    return state["history"]
+
+def reorder_suggestions(org_id: str) -> pd.DataFrame:
+    """
+    Every product with qty, velocity, days of cover, reorder point and
+    suggested order quantity (see reorder.reorder_plan), most urgent first.
+    Recomputed only when the demand history or the live stock table changed.
+    """
+    history = demand_history(org_id)
+    state = st.session_state["_demand"][org_id]
+    stock = live_stock(org_id)
+    live = st.session_state["_live_stock"][org_id]
+    plan_key = (state["version"], live["version"])
+    if state.get("plan_key") != plan_key:
+        plan = reorder_plan(history, stock, REORDER_WINDOW_DAYS, REORDER_LEAD_DAYS,
+                            REORDER_REVIEW_DAYS, REORDER_SERVICE_Z)
+        plan = stock[["sku", "name", "unit", "category", "qty", "min_stock"]].join(plan)
+        state["plan"] = plan.sort_values(["reorder", "days_of_cover"], ascending=[False, True])
+        state["plan_key"] = plan_key
+    return state["plan"].copy()
+
+# -------------------------------
+# Stocktake (bulk counts)
+# -------------------------------
+STOCKTAKE_COLUMNS = ["id", "sku", "name", "unit", "category", "unit_cost", "qty", "stock_updated_at"]
+STOCKTAKE_CHUNK_SIZE = 1000
+
+def stocktake_sheet(org_id: str, category: Optional[str] = None) -> pd.DataFrame:
+    """
+    Snapshot of on-hand stock to count against, with an empty `counted` column.
+    stock_updated_at is kept as the server's string so apply_stocktake can
+    compare it exactly.
+    """
+    df = live_stock(org_id).reset_index()[STOCKTAKE_COLUMNS]
+    if category:
+        df = df[df["category"] == category]
+    df = df.sort_values(["category", "name"], na_position="last").reset_index(drop=True)
+    return df.assign(counted=float("nan"))
+
+def diff_stocktake(sheet: pd.DataFrame, counts: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Match counts (columns sku, counted; e.g. an uploaded sheet) to the snapshot
+    and return (variances, errors). Rows without a count are skipped; rows whose
+    count equals the snapshot qty are not variances. Errors carry the 1-based
+    sheet row (header = row 1).
+    """
+    counts = counts.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_"))
+    missing = [c for c in ("sku", "counted") if c not in counts.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    counts = counts[["sku", "counted"]].copy()
+    counts["row"] = counts.index + 2
+    counts["sku"] = counts["sku"].fillna("").astype(str).str.strip()
+    given = counts["counted"].notna() & (counts["counted"].astype(str).str.strip() != "")
+    num = pd.to_numeric(counts["counted"], errors="coerce")
+
+    merged = counts.drop(columns=["counted"]).assign(counted=num).merge(
+        sheet.drop(columns=["counted"], errors="ignore"), on="sku", how="left", indicator=True)
+    problems = pd.Series("", index=merged.index)
+    problems[merged["_merge"] == "left_only"] += "SKU not in this stocktake; "
+    problems[given.values & merged["counted"].isna()] += "counted is not a number; "
+    problems[merged["counted"] < 0] += "counted must be >= 0; "
+    problems[merged["sku"].ne("") & merged["sku"].duplicated(keep=False)] += "SKU appears more than once in the file; "
+    bad = problems != ""
+    errors = pd.DataFrame({"row": merged.loc[bad, "row"], "sku": merged.loc[bad, "sku"],
+                           "error": problems[bad].str.rstrip("; ")}).reset_index(drop=True)
+    ok = merged.loc[~bad & merged["counted"].notna()].drop(columns=["row", "_merge"])
+    return stocktake_variances(ok), errors
+
+def stocktake_variances(counted: pd.DataFrame) -> pd.DataFrame:
+    """Rows of a counted sheet whose count differs from the snapshot, with unit and value variance."""
+    df = counted[counted["counted"].notna()].copy()
+    df["variance"] = df["counted"] - df["qty"]
+    df["value_variance"] = df["variance"] * df["unit_cost"].fillna(0.0)
+    return df[df["variance"] != 0].reset_index(drop=True)
+
+def apply_stocktake(org_id: str, variances: pd.DataFrame, note: Optional[str] = None,
+                    chunk_size: int = STOCKTAKE_CHUNK_SIZE) -> Tuple[int, pd.DataFrame]:
+    """
+    Commit counted quantities with the apply_stocktake RPC, one call per chunk.
+    Rows whose stock changed since the snapshot are skipped by the server and
+    returned as conflicts (product_id, qty now, stock_updated_at) to recount.
+    """
+    applied, conflicts = 0, []
+    payload = pd.DataFrame({
+        "product_id": variances["id"],
+        "qty": variances["counted"].astype(float),
+        "expected_updated_at": variances["stock_updated_at"].astype(object).where(variances["stock_updated_at"].notna(), None),
+    })
+    try:
+        for start in range(0, len(payload), chunk_size):
+            chunk = payload.iloc[start:start + chunk_size].to_dict("records")
+            res = db().rpc("apply_stocktake", {"p_org_id": org_id, "p_counts": chunk,
+                                               "p_note": (note or None)}).execute().data or {}
+            applied += int(res.get("applied") or 0)
+            conflicts.extend(res.get("conflicts") or [])
+    finally:
+        invalidate(org_id, "stock", "dashboard", "search")
+    return applied, pd.DataFrame(conflicts, columns=["product_id", "qty", "stock_updated_at"])
+
+SALES_LIST_COLUMNS = ["id", "created_at", "ref", "total"]
+
+def _fetch_sales_page(org_id: str, before: Optional[Tuple], limit: int) -> pd.DataFrame:
+    q = db().table("sales").select(",".join(SALES_LIST_COLUMNS)).eq("org_id", org_id)
+    if before:
+        created_at, sid = (_pgrst_quote(v) for v in before)
+        q = q.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{sid})")
+    res = q.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    return pd.DataFrame(res.data or [], columns=SALES_LIST_COLUMNS)
+
+def list_sales_page(org_id: str,
+                    before: Optional[Tuple] = None,
+                    limit: int = PAGE_SIZE) -> Tuple[pd.DataFrame, bool]:
+    """
+    One keyset page of sales ordered newest first by (created_at, id), starting
+    before the (created_at, id) cursor. Returns the page and whether more rows follow.
+    """
+    df = cached(org_id, "sales", lambda: _fetch_sales_page(org_id, before, limit), ("page", before, limit))
+    return df.head(limit), len(df) > limit
+
+LATEST_STOCK_COLUMNS = ["id", "sku", "name", "unit", "qty", "updated_at"]
+
+def _latest_stock_frame(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows or [], columns=LATEST_STOCK_COLUMNS)
+
+def get_dashboard_metrics(org_id: str) -> Dict:
+    """
+    Counts, totals, low-stock rows, recent sales and the latest stock changes
+    from the dashboard_metrics RPC. The stock changes also seed
+    latest_stock_changes(), so the dashboard renders from this one call.
+    """
+    def load() -> Dict:
+        m = db().rpc("dashboard_metrics", {"p_org_id": org_id,
+                                           "p_changes_limit": LATEST_STOCK_LIMIT}).execute().data or {}
+        st.session_state.setdefault("_data_cache", {})[(org_id, "stock", ("latest", LATEST_STOCK_LIMIT))] = (
+            time.monotonic(), _latest_stock_frame(m.get("recent_stock")))
+        return m
+    return cached(org_id, "dashboard", load)
+
+def latest_stock_changes(org_id: str) -> pd.DataFrame:
+    """
+    The LATEST_STOCK_LIMIT most recently changed products with on-hand qty,
+    newest first, re-read at most every DELTA_POLL_SECONDS.
+    """
+    return cached(org_id, "stock",
+                  lambda: _latest_stock_frame(db().rpc("latest_stock_changes", {
+                      "p_org_id": org_id, "p_limit": LATEST_STOCK_LIMIT}).execute().data),
+                  ("latest", LATEST_STOCK_LIMIT), ttl=DELTA_POLL_SECONDS)
 
-def list_sales(org_id: str) -> pd.DataFrame:
-    res = sb.table("sales").select("*").eq("org_id", org_id).order("created_at", desc=True).limit(50).execute()
-    return pd.DataFrame(res.data or [])
+# -------------------------------
+# Sales analytics (rolled up in the database)
+# -------------------------------
+ANALYTICS_GRAINS = ["day", "week", "month"]
+ANALYTICS_BUCKET_COLUMNS = ["bucket", "sale_count", "units", "revenue", "cost", "margin"]
+ANALYTICS_TOP_COLUMNS = ["rank", "product_id", "sku", "name", "units", "revenue", "cost", "margin"]
+
+def get_sales_analytics(org_id: str, start: date, end: date, grain: str = "day",
+                        top: int = 10, order: str = "revenue") -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Revenue/cost/margin per day, week or month and the top products for the
+    inclusive UTC date range, from the daily rollups in one sales_analytics call.
+    """
+    params = {"p_org_id": org_id, "p_from": start.isoformat(), "p_to": end.isoformat(),
+              "p_grain": grain, "p_top": top, "p_order": order}
+    data = cached(org_id, "analytics",
+                  lambda: db().rpc("sales_analytics", params).execute().data or {},
+                  (start, end, grain, top, order))
+    buckets = pd.DataFrame(data.get("buckets") or [], columns=ANALYTICS_BUCKET_COLUMNS)
+    buckets["bucket"] = pd.to_datetime(buckets["bucket"])
+    top_products = pd.DataFrame(data.get("top") or [], columns=ANALYTICS_TOP_COLUMNS)
+    num = ["sale_count", "units", "revenue", "cost", "margin"]
+    buckets[num] = buckets[num].apply(pd.to_numeric)
+    top_products[num[1:]] = top_products[num[1:]].apply(pd.to_numeric)
+    return buckets, top_products
+
+# -------------------------------
+# Sales export (streamed by date range)
+# -------------------------------
+EXPORT_COLUMNS = ["sale_id", "created_at", "ref", "sale_total",
+                  "product_id", "sku", "name", "qty", "unit_price", "line_total"]
+EXPORT_SELECT = "id,created_at,ref,total,sale_items(product_id,qty,unit_price,products(sku,name))"
+EXPORT_MAX_MB = 200  # st.download_button serves the whole file from server memory
+
+def _flatten_sales(rows: List[Dict]) -> pd.DataFrame:
+    """One output row per sale line; sales without items keep a single row."""
+    out = []
+    for sale in rows:
+        for item in (sale.get("sale_items") or [{}]):
+            prod = item.get("products") or {}
+            qty, unit_price = item.get("qty"), item.get("unit_price")
+            out.append({
+                "sale_id": sale["id"],
+                "created_at": sale["created_at"],
+                "ref": sale.get("ref"),
+                "sale_total": sale.get("total"),
+                "product_id": item.get("product_id"),
+                "sku": prod.get("sku"),
+                "name": prod.get("name"),
+                "qty": qty,
+                "unit_price": unit_price,
+                "line_total": (float(qty) * float(unit_price)) if qty is not None and unit_price is not None else None,
+            })
+    return pd.DataFrame(out, columns=EXPORT_COLUMNS)
+
+def iter_sales_export(org_id: str, start: date, end: date, page_size: int = 500) -> Iterator[pd.DataFrame]:
+    """
+    Yield sales with their line items between start and end (inclusive), oldest
+    first, one keyset page at a time so memory stays flat for any range.
+    """
+    lo = start.isoformat()
+    hi = (end + timedelta(days=1)).isoformat()
+    cursor = None
+    while True:
+        q = (db().table("sales").select(EXPORT_SELECT)
+             .eq("org_id", org_id).gte("created_at", lo).lt("created_at", hi))
+        if cursor:
+            created_at, sid = (_pgrst_quote(v) for v in cursor)
+            q = q.or_(f"created_at.gt.{created_at},and(created_at.eq.{created_at},id.gt.{sid})")
+        rows = q.order("created_at").order("id").limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield _flatten_sales(rows)
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+def iter_csv_chunks(frames: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    """Encode a stream of frames as one CSV document, header first."""
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        yield pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(index=False).encode("utf-8")
+
+def write_sales_export(org_id: str, start: date, end: date, fmt: str = "csv",
+                       max_mb: float = EXPORT_MAX_MB) -> str:
+    """
+    Stream the export for a date range into a temp file and return its path.
+    Parquet needs pyarrow; each page becomes one row group. Raises ValueError
+    (and removes the file) when it grows past max_mb.
+    """
+    suffix = ".parquet" if fmt == "parquet" else ".csv"
+    fd, path = tempfile.mkstemp(prefix="sales_export_", suffix=suffix)
+    frames = iter_sales_export(org_id, start, end)
+    try:
+        if fmt == "parquet":
+            os.close(fd)
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([
+                ("sale_id", pa.string()), ("created_at", pa.string()), ("ref", pa.string()),
+                ("sale_total", pa.float64()), ("product_id", pa.string()), ("sku", pa.string()),
+                ("name", pa.string()), ("qty", pa.float64()), ("unit_price", pa.float64()),
+                ("line_total", pa.float64()),
+            ])
+            with pq.ParquetWriter(path, schema) as writer:
+                for frame in frames:
+                    writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+        else:
+            with os.fdopen(fd, "wb") as fh:
+                written = 0
+                for chunk in iter_csv_chunks(frames):
+                    written += fh.write(chunk)
+                    _check_export_size(written, max_mb)
+        _check_export_size(os.path.getsize(path), max_mb)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+def _check_export_size(size: int, max_mb: float):
+    if size > max_mb * 1024 * 1024:
+        raise ValueError(f"The export is over {max_mb:g} MB; pick a shorter date range.")
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class SalesExport:
+    """
+    A built export file owned by one session. The file is removed when the
+    export is replaced, on logout, or once the session's state is dropped after
+    its browser goes away, so abandoned sessions don't leave files behind.
+    """
+
+    def __init__(self, path: str, file_name: str):
+        self.path = path
+        self.file_name = file_name
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as fh:
+            return fh.read()
+
+    def remove(self):
+        self._finalizer()
+
+# -------------------------------
+# Offline write queue (sales & receipts)
+# -------------------------------
+@st.cache_resource
+def pos_queue() -> WriteQueue:
+    """Process-wide durable queue of sales and receipts waiting to reach Supabase."""
+    return WriteQueue(POS_QUEUE_PATH)
+
+def _sync_sender(handle: SyncPostgrestClient):
+    def send(org_id: str, ops: List[Dict]) -> Dict:
+        return handle.rpc("sync_pos_ops", {"p_org_id": org_id, "p_ops": ops}).execute().data
+    return send
+
+@st.cache_resource
+def _org_sync_worker(org_id: str) -> SyncWorker:
+    """One background flusher per org and process, however many tabs are open."""
+    worker = SyncWorker(pos_queue(), org_id, None)
+    worker.start()
+    return worker
+
+def sync_worker(org_id: str) -> SyncWorker:
+    """
+    The org's flusher, handed this session's current JWT on every rerun. It
+    sends each user's queued writes with that user's own JWT, so the server
+    records who made them.
+    """
+    worker = _org_sync_worker(org_id)
+    send = st.session_state["_sync_send"] = _sync_sender(db())
+    worker.set_sender(send, current_user_id())
+    return worker
+
+def sync_status(org_id: str):
+    """Sidebar status of the queue; drops cached reads once queued writes have landed."""
+    worker = sync_worker(org_id)
+    if worker.applied_total != st.session_state.get("_sync_seen", 0):
+        st.session_state["_sync_seen"] = worker.applied_total
+        invalidate(org_id, "products", "stock", "sales", "dashboard", "search", "analytics")
+    queue = pos_queue()
+    counts = queue.counts(org_id)
+    if counts["pending"]:
+        st.sidebar.info(f"⏳ {counts['pending']} change(s) waiting to sync")
+        if worker.last_error:
+            st.sidebar.caption(f"Last sync error: {worker.last_error}")
+    if counts["failed"]:
+        st.sidebar.error(f"⚠️ {counts['failed']} change(s) rejected by the server")
+        with st.sidebar.expander("Rejected changes"):
+            failed = pd.DataFrame(queue.failed(org_id))
+            st.dataframe(failed[["kind", "error", "payload"]], use_container_width=True)
+            c1, c2 = st.columns(2)
+            with c1:
+                if st.button("Retry", key="btn_sync_retry"):
+                    queue.requeue_failed(org_id)
+                    worker.wake()
+                    st.rerun()
+            with c2:
+                if st.button("Discard", key="btn_sync_discard"):
+                    queue.discard_failed(org_id)
+                    st.rerun()
+
+# -------------------------------
+# Pagination controls
+# -------------------------------
+def page_cursor(state_key: str) -> Optional[Tuple]:
+    """Cursor of the page currently shown for a keyset-paginated table."""
+    stack = st.session_state.get(state_key) or []
+    return stack[-1] if stack else None
+
+def keyset_pager(state_key: str, page: pd.DataFrame, has_more: bool, cursor_cols: List[str]):
+    """Previous/Next buttons; the cursor stack lives in st.session_state[state_key]."""
+    stack = st.session_state.setdefault(state_key, [])
+    c1, c2, c3 = st.columns([1, 1, 4])
+    with c1:
+        if st.button("◀ Previous", disabled=not stack, key=f"{state_key}_prev"):
+            stack.pop()
+            st.rerun()
+    with c2:
+        if st.button("Next ▶", disabled=not has_more or page.empty, key=f"{state_key}_next"):
+            stack.append(tuple(page.iloc[-1][cursor_cols]))
+            st.rerun()
+    with c3:
+        st.caption(f"Page {len(stack) + 1}")
 
 # -------------------------------
 # UI Pages
 # -------------------------------
+def product_picker(org_id: str, key: str, label: str = "Product") -> Optional[Dict]:
+    """
+    Type-ahead product selector shared by the pages. Only the top matches are
+    fetched; the chosen product comes back as a dict looked up by id. Without
+    a connection it falls back to the products this session has already seen.
+    """
+    query = st.text_input(f"Find {label.lower()}", key=f"{key}_query", placeholder="Search SKU, name or category")
+    try:
+        results = search_products(org_id, query)
+    except httpx.TransportError:
+        results = offline_products(org_id, query)
+        st.warning("Can't reach the server; showing products already loaded in this session. "
+                   "Sales and receipts are queued and sync when the connection is back.")
+        if results.empty:
+            st.caption("No matching products in this session yet.")
+            return None
+    if results.empty:
+        st.caption("No matching products." if query else "Add products first.")
+        return None
+    rows = {r["id"]: r for r in results.to_dict("records")}
+    pid = st.selectbox(
+        label,
+        list(rows),
+        index=None,
+        format_func=lambda i: f"{rows[i]['sku']} — {rows[i]['name']}  (on hand: {rows[i]['qty']})",
+        key=f"{key}_select",
+    )
+    return rows.get(pid)
+
 def page_dashboard():
     st.markdown("# Dashboard")
     org_id = st.session_state["org_id"]
-    stock = get_stock_df(org_id)
-    c1, c2, c3 = st.columns(3)
-    total_items = len(stock)
-    total_qty = float(stock["qty"].sum()) if not stock.empty else 0
-    low = stock[stock["qty"] < stock["min_stock"]] if not stock.empty else pd.DataFrame()
+    m = get_dashboard_metrics(org_id)
+    c1, c2, c3, c4, c5 = st.columns(5)
     with c1:
-        st.metric("Item count", total_items)
+        st.metric("Item count", int(m.get("item_count", 0)))
     with c2:
-        st.metric("Total stock on hand", f"{total_qty:.2f}")
+        st.metric("Total stock on hand", f"{float(m.get('total_qty', 0)):.2f}")
     with c3:
-        st.metric("Low-stock items", 0 if stock.empty else int((stock["qty"] < stock["min_stock"]).sum()))
+        st.metric("Low-stock items", int(m.get("low_stock_count", 0)))
+    with c4:
+        st.metric("Sales today", f"{float(m.get('sales_today', 0)):.2f}", help=f"{m.get('sales_today_count', 0)} sales")
+    with c5:
+        st.metric("Sales this week", f"{float(m.get('sales_week', 0)):.2f}", help=f"{m.get('sales_week_count', 0)} sales")
     st.subheader("Low stock")
+    low = pd.DataFrame(m.get("low_stock") or [], columns=["sku", "name", "qty", "min_stock", "category"])
     if low.empty:
         st.info("No low-stock items. 🎉")
     else:
-        st.dataframe(low[["sku", "name", "qty", "min_stock", "category"]], use_container_width=True)
+        st.dataframe(low, use_container_width=True)
+        if len(low) < int(m.get("low_stock_count", 0)):
+            st.caption(f"Showing {len(low)} of {m['low_stock_count']} low-stock items.")
+    st.caption("Suggestions based on sales velocity are on the Reorder page.")
     st.subheader("Recent sales")
-    st.dataframe(list_sales(org_id), use_container_width=True)
+    st.dataframe(pd.DataFrame(m.get("recent_sales") or [], columns=SALES_LIST_COLUMNS), use_container_width=True)
+    live_stock_panel(org_id)
+
+@st.fragment(run_every=DELTA_POLL_SECONDS)
+def live_stock_panel(org_id: str):
+    """Most recently changed stock, refreshed in place while the dashboard is open."""
+    # Timed runs log as their own reruns instead of piling onto the Dashboard's.
+    query_log().begin("Dashboard · latest stock changes")
+    st.subheader("Latest stock changes")
+    recent = latest_stock_changes(org_id)
+    if recent.empty:
+        st.info("No products yet.")
+        return
+    st.dataframe(recent[["sku", "name", "qty", "unit", "updated_at"]], use_container_width=True)
+
+def page_reorder():
+    st.markdown("# Reorder suggestions")
+    org_id = st.session_state["org_id"]
+    try:
+        plan = reorder_suggestions(org_id)
+    except Exception as e:
+        show_supabase_error("Loading sales history", e)
+        return
+    due = plan[plan["reorder"]]
+    if due.empty:
+        st.info("Nothing needs reordering at current sales rates.")
+        return
+    st.caption(f"{len(due)} product(s) at or below their reorder point, based on the last "
+               f"{REORDER_WINDOW_DAYS} days of sales, {REORDER_LEAD_DAYS}-day lead time and "
+               f"{REORDER_REVIEW_DAYS}-day review period.")
+    shown = due.head(50).reset_index(drop=True)
+    st.dataframe(shown[["sku", "name", "qty", "velocity", "velocity_7d", "days_of_cover",
+                        "reorder_point", "suggested_qty"]].round(2), use_container_width=True)
+    st.download_button("Download all suggestions (CSV)",
+                       due.drop(columns=["reorder"]).to_csv().encode("utf-8"),
+                       file_name="reorder_suggestions.csv", mime="text/csv", key="btn_reorder_csv")
 
 def page_products():
     st.markdown("# Products")
     org_id = st.session_state["org_id"]
-    items = list_products(org_id)
     with st.expander("➕ Create / Edit product", expanded=True):
         edit = st.checkbox("Edit existing product", key="prod_edit")
-        row = None
-        if edit and not items.empty:
-            items["display"] = items["sku"] + " — " + items["name"]
-            sel = st.selectbox("Select product", items["display"], index=None, key="prod_select")
-            if sel:
-                row = items.loc[items["display"] == sel].iloc[0]
+        row = product_picker(org_id, "prod", "Select product") if edit else None
         sku = st.text_input("SKU", value=(row["sku"] if row is not None else "")).strip()
         name = st.text_input("Name", value=(row["name"] if row is not None else "")).strip()
         unit = st.text_input("Unit", value=(row["unit"] if row is not None else "pcs")).strip()
-        category = st.text_input("Category", value=(row["category"] if row is not None else "")).strip()
-        unit_cost = st.number_input("Unit cost", min_value=0.0, value=float(row["unit_cost"]) if row is not None else 0.0, step=0.01)
-        price = st.number_input("Price", min_value=0.0, value=float(row["price"]) if row is not None else 0.0, step=0.01)
-        min_stock = st.number_input("Min stock", min_value=0.0, value=float(row["min_stock"]) if row is not None else 0.0, step=1.0)
+        category = st.text_input("Category", value=((row["category"] or "") if row is not None else "")).strip()
+        unit_cost = st.number_input("Unit cost", min_value=0.0, value=float(row["unit_cost"] or 0) if row is not None else 0.0, step=0.01)
+        price = st.number_input("Price", min_value=0.0, value=float(row["price"] or 0) if row is not None else 0.0, step=0.01)
+        min_stock = st.number_input("Min stock", min_value=0.0, value=float(row["min_stock"] or 0) if row is not None else 0.0, step=1.0)
         c1, c2 = st.columns(2)
         with c1:
             if st.button("Save product", type="primary", use_container_width=True, key="btn_save_prod"):
@@ -348,26 +1153,47 @@ def page_products():
             if row is not None and st.button("Delete product", use_container_width=True, key="btn_del_prod"):
                 delete_product(org_id, row["id"])
                 success_rerun("Deleted.")
+    with st.expander("📥 Bulk import (CSV / XLSX)"):
+        st.caption("Columns: " + ", ".join(IMPORT_COLUMNS) + ". Rows are matched on SKU; existing products are "
+                   "updated, and blank cells or left-out columns keep their current values.")
+        upload = st.file_uploader("Product sheet", type=["csv", "xlsx"], key="prod_import_file")
+        if upload is not None:
+            try:
+                valid, errors = validate_product_import(read_product_sheet(upload))
+            except ImportError:
+                st.error("Reading XLSX files needs the `openpyxl` package.")
+                valid = None
+            except ValueError as e:
+                st.error(str(e))
+                valid = None
+            if valid is not None:
+                st.write(f"{len(valid)} valid row(s), {len(errors)} with errors.")
+                if not errors.empty:
+                    st.dataframe(errors, use_container_width=True)
+                if not valid.empty and st.button(f"Import {len(valid)} product(s)", type="primary", key="btn_import_prod"):
+                    started = time.monotonic()
+                    failed = bulk_upsert_products(org_id, valid)
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    done = len(valid) - len(failed)
+                    st.success(f"Imported {done} product(s) in {elapsed:.1f}s ({done / elapsed:.0f} rows/s).")
+                    if not failed.empty:
+                        st.error(f"{len(failed)} row(s) failed:")
+                        st.dataframe(failed, use_container_width=True)
     st.divider()
     st.subheader("Products list")
-    items = list_products(org_id)
-    show = ["sku", "name", "unit", "unit_cost", "price", "min_stock", "category", "updated_at"]
-    st.dataframe(items[show] if not items.empty else items, use_container_width=True)
+    page, has_more = list_products_page(org_id, after=page_cursor("prod_cursors"))
+    st.dataframe(page.drop(columns=["id"]), use_container_width=True)
+    keyset_pager("prod_cursors", page, has_more, ["name", "id"])
 
 def page_receive():
     st.markdown("# Receive Stock")
     org_id = st.session_state["org_id"]
-    prods = list_products(org_id)
-    if prods.empty:
-        st.info("Add products first.")
+    row = product_picker(org_id, "recv")
+    if row is None:
         return
-    prods["display"] = prods["sku"] + " — " + prods["name"]
-    sel = st.selectbox("Product", prods["display"], index=None, key="recv_select")
-    if not sel:
-        return
-    row = prods.loc[prods["display"] == sel].iloc[0]
     qty = st.number_input("Quantity received", min_value=0.0, step=1.0, key="recv_qty")
-    unit_cost = st.number_input("Unit cost", min_value=0.0, step=0.01, value=float(row["unit_cost"] or 0), key="recv_cost")
+    unit_cost = st.number_input("Unit cost", min_value=0.0, step=0.01, value=float(row["unit_cost"] or 0), key="recv_cost",
+                                help="Cost of this delivery; the product cost becomes the weighted average with stock on hand.")
     if st.button("Record receipt", type="primary", key="btn_recv"):
         if qty <= 0:
             st.error("Quantity must be > 0")
@@ -378,60 +1204,245 @@ def page_receive():
 def page_sell():
     st.markdown("# Sell / Issue")
     org_id = st.session_state["org_id"]
-    stock = get_stock_df(org_id)
-    if stock.empty:
-        st.info("Add products first.")
-        return
-    stock["display"] = stock["sku"] + " — " + stock["name"] + "  (on hand: " + stock["qty"].astype(str) + ")"
-    sel = st.selectbox("Product", stock["display"], index=None, key="sell_select")
-    if not sel:
+    basket: List[Dict] = st.session_state.setdefault("basket", [])
+
+    row = product_picker(org_id, "sell")
+    if row is not None:
+        st.info(f"On hand: {row['qty']} {row['unit']}")
+        c1, c2 = st.columns(2)
+        with c1:
+            qty = st.number_input("Quantity", min_value=0.0, step=1.0, key="sell_qty")
+        with c2:
+            unit_price = st.number_input("Unit price", min_value=0.0, step=0.01, value=float(row.get("price", 0) or 0), key="sell_price")
+        if st.button("Add to basket", key="btn_add_line"):
+            if qty <= 0:
+                st.error("Quantity must be > 0")
+            else:
+                for line in basket:
+                    if line["product_id"] == row["id"] and line["unit_price"] == unit_price:
+                        line["qty"] += qty
+                        break
+                else:
+                    basket.append({"product_id": row["id"], "sku": row["sku"], "name": row["name"],
+                                   "qty": qty, "unit_price": unit_price, "on_hand": float(row["qty"] or 0)})
+
+    st.subheader("Basket")
+    if not basket:
+        st.caption("Basket is empty.")
         return
-    row = stock.loc[stock["display"] == sel].iloc[0]
-    st.info(f"On hand: {row['qty']} {row['unit']}")
-    qty = st.number_input("Quantity to sell", min_value=0.0, step=1.0, key="sell_qty")
-    unit_price = st.number_input("Unit price", min_value=0.0, step=0.01, value=float(row.get("price", 0) or 0), key="sell_price")
+    lines = pd.DataFrame(basket)
+    lines["line_total"] = lines["qty"] * lines["unit_price"]
+    st.dataframe(lines[["sku", "name", "qty", "unit_price", "line_total"]], use_container_width=True)
+    per_product = lines.groupby("product_id").agg(qty=("qty", "sum"), on_hand=("on_hand", "first"))
+    if (per_product["qty"] > per_product["on_hand"]).any():
+        st.warning("Some lines exceed the quantity on hand; stock will go negative.")
+    st.metric("Total", f"{lines['line_total'].sum():.2f}")
+
     ref = st.text_input("Reference / Order #", key="sell_ref")
-    if st.button("Complete sale", type="primary", key="btn_sell"):
-        if qty <= 0:
-            st.error("Quantity must be > 0")
-        else:
-            sell_items(org_id, [{"product_id": row["id"], "qty": qty, "unit_price": unit_price}], ref)
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("Complete sale", type="primary", use_container_width=True, key="btn_sell"):
+            sell_items(org_id, basket, ref)
+            st.session_state["basket"] = []
             success_rerun("Sale recorded.")
+    with c2:
+        if st.button("Clear basket", use_container_width=True, key="btn_clear_basket"):
+            st.session_state["basket"] = []
+            st.rerun()
 
 def page_adjust():
     st.markdown("# Adjustments")
     org_id = st.session_state["org_id"]
-    stock = get_stock_df(org_id)
-    if stock.empty:
-        st.info("Add products first.")
+    mode = st.radio("Mode", ["Single product", "Stocktake"], horizontal=True, key="adj_mode")
+    if mode == "Stocktake":
+        stocktake_panel(org_id)
         return
-    stock["display"] = stock["sku"] + " — " + stock["name"] + "  (current: " + stock["qty"].astype(str) + ")"
-    sel = st.selectbox("Product", stock["display"], index=None, key="adj_select")
-    if not sel:
+    row = product_picker(org_id, "adj")
+    if row is None:
         return
-    row = stock.loc[stock["display"] == sel].iloc[0]
     st.info(f"Current on hand: {row['qty']} {row['unit']}")
     desired = st.number_input("New counted quantity", min_value=0.0, step=1.0, value=float(row["qty"]), key="adj_qty")
+    note = st.text_input("Reason (optional)", key="adj_note")
     if st.button("Record adjustment", type="primary", key="btn_adj"):
-        adjust_stock(row["id"], desired)
+        adjust_stock(org_id, row["id"], desired, note)
         success_rerun("Adjustment recorded.")
 
+def stocktake_panel(org_id: str):
+    """
+    Count many products against a snapshot taken when the stocktake starts,
+    either in a grid or from an uploaded sheet, then commit only the variances.
+    """
+    take = st.session_state.get("stocktake")
+    if take is None or take["org_id"] != org_id:
+        categories = sorted(live_stock(org_id)["category"].dropna().unique())
+        category = st.selectbox("Category", ["All"] + categories, key="stocktake_category")
+        if st.button("Start stocktake", type="primary", key="btn_stocktake_start"):
+            scope = None if category == "All" else category
+            st.session_state["stocktake"] = {"org_id": org_id, "scope": scope, "started": datetime.now(),
+                                             "sheet": stocktake_sheet(org_id, scope)}
+            st.rerun()
+        return
+
+    sheet = take["sheet"]
+    if take.get("notice"):
+        st.warning(take["notice"])
+    st.caption(f"Stocktake of {len(sheet)} product(s) ({take['scope'] or 'all categories'}), "
+               f"started {take['started']:%H:%M}. Quantities are as of the start; products "
+               "that change meanwhile are flagged for a recount when you commit.")
+    source = st.radio("Enter counts", ["Grid", "Upload count sheet"], horizontal=True, key="stocktake_source")
+    if source == "Grid":
+        edited = st.data_editor(
+            sheet[["sku", "name", "category", "unit", "qty", "counted"]],
+            disabled=["sku", "name", "category", "unit", "qty"],
+            use_container_width=True,
+            key="stocktake_grid",
+        )
+        variances = stocktake_variances(sheet.assign(counted=edited["counted"]))
+    else:
+        st.caption("Columns: sku, counted. Products left out of the sheet are not changed.")
+        upload = st.file_uploader("Count sheet", type=["csv", "xlsx"], key="stocktake_file")
+        if upload is None:
+            variances = stocktake_variances(sheet)
+        else:
+            try:
+                variances, errors = diff_stocktake(sheet, read_product_sheet(upload))
+            except ImportError:
+                st.error("Reading XLSX files needs the `openpyxl` package.")
+                return
+            except ValueError as e:
+                st.error(str(e))
+                return
+            if not errors.empty:
+                st.error(f"{len(errors)} row(s) were skipped:")
+                st.dataframe(errors, use_container_width=True)
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Variances", len(variances))
+    c2.metric("Net units", f"{variances['variance'].sum():+,.0f}")
+    c3.metric("Net value", f"{variances['value_variance'].sum():+,.2f}")
+    if not variances.empty:
+        st.dataframe(variances[["sku", "name", "qty", "counted", "variance", "value_variance"]],
+                     use_container_width=True)
+    note = st.text_input("Note", value=f"Stocktake {take['started']:%Y-%m-%d}", key="stocktake_note")
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button(f"Commit {len(variances)} variance(s)", type="primary", disabled=variances.empty,
+                     key="btn_stocktake_commit"):
+            try:
+                applied, conflicts = apply_stocktake(org_id, variances, note)
+            except Exception as e:
+                show_supabase_error("Stocktake", e)
+                return
+            if conflicts.empty:
+                st.session_state.pop("stocktake", None)
+                success_rerun(f"Stocktake committed: {applied} product(s) updated.")
+            # Keep the session for the conflicting rows only, at their current quantities.
+            conflicts = conflicts.set_index("product_id")
+            recount = sheet[sheet["id"].isin(conflicts.index)].copy()
+            recount["qty"] = recount["id"].map(conflicts["qty"]).astype(float)
+            recount["stock_updated_at"] = recount["id"].map(conflicts["stock_updated_at"])
+            take.update(sheet=recount.assign(counted=float("nan")).reset_index(drop=True), started=datetime.now(),
+                        notice=f"{applied} product(s) updated. {len(recount)} changed since the count started "
+                               "(sales or receipts); please recount them.")
+            st.session_state.pop("stocktake_grid", None)
+            st.rerun()
+    with c2:
+        if st.button("Discard stocktake", key="btn_stocktake_discard"):
+            st.session_state.pop("stocktake", None)
+            st.session_state.pop("stocktake_grid", None)
+            st.rerun()
+
 def page_sales():
     st.markdown("# Sales")
     org_id = st.session_state["org_id"]
-    df = list_sales(org_id)
-    if df.empty:
+    df, has_more = list_sales_page(org_id, before=page_cursor("sales_cursors"))
+    if df.empty and page_cursor("sales_cursors") is None:
         st.info("No sales yet.")
-    else:
-        st.dataframe(df, use_container_width=True)
+        return
+    st.dataframe(df, use_container_width=True)
+    keyset_pager("sales_cursors", df, has_more, ["created_at", "id"])
+
+    st.subheader("Export")
+    today = date.today()
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        start = st.date_input("From", value=today.replace(day=1), key="export_from")
+    with c2:
+        end = st.date_input("To", value=today, key="export_to")
+    with c3:
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key="export_fmt")
+    st.caption(f"Exports are built on the server and held in its memory while they download, "
+               f"so each is limited to {EXPORT_MAX_MB} MB; export a shorter date range for more.")
+    if st.button("Build export", key="btn_build_export"):
+        if start > end:
+            st.error("'From' must be on or before 'To'.")
+        else:
+            old = st.session_state.pop("sales_export", None)
+            if old:
+                old.remove()
+            try:
+                path = write_sales_export(org_id, start, end, fmt)
+                st.session_state["sales_export"] = SalesExport(
+                    path, f"sales_{start.isoformat()}_{end.isoformat()}.{fmt}")
+            except ImportError:
+                st.error("Parquet export needs the `pyarrow` package.")
+            except ValueError as e:
+                st.error(str(e))
+            except Exception as e:
+                show_supabase_error("Export", e)
+    export = st.session_state.get("sales_export")
+    if export and os.path.exists(export.path):
+        # Read on click, not on every rerun of the page.
         st.download_button(
-            "Export CSV",
-            df.to_csv(index=False).encode("utf-8"),
-            file_name=f"sales_{date.today().isoformat()}.csv",
-            mime="text/csv",
+            f"Download {export.file_name}",
+            export.read,
+            file_name=export.file_name,
+            mime="text/csv" if export.file_name.endswith(".csv") else "application/octet-stream",
+            on_click="ignore",
             key="btn_export_sales"
         )
 
+def page_analytics():
+    st.markdown("# Analytics")
+    org_id = st.session_state["org_id"]
+    today = date.today()
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        start = st.date_input("From", value=today - timedelta(days=364), key="analytics_from")
+    with c2:
+        end = st.date_input("To", value=today, key="analytics_to")
+    with c3:
+        grain = st.selectbox("Group by", ANALYTICS_GRAINS, index=1, key="analytics_grain")
+    with c4:
+        order = st.selectbox("Top products by", ["revenue", "margin", "units"], key="analytics_order")
+    if start > end:
+        st.error("'From' must be on or before 'To'.")
+        return
+    try:
+        buckets, top_products = get_sales_analytics(org_id, start, end, grain, 10, order)
+    except Exception as e:
+        show_supabase_error("Loading analytics", e)
+        return
+    if buckets.empty:
+        st.info("No sales in this period.")
+        return
+
+    revenue, margin = buckets["revenue"].sum(), buckets["margin"].sum()
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Revenue", f"{revenue:,.2f}")
+    m2.metric("Margin", f"{margin:,.2f}")
+    m3.metric("Margin %", f"{margin / revenue:.1%}" if revenue else "—")
+    m4.metric("Sales", f"{int(buckets['sale_count'].sum()):,}")
+
+    st.subheader(f"Revenue and margin by {grain}")
+    st.bar_chart(buckets.set_index("bucket")[["revenue", "margin"]])
+
+    st.subheader("Top products")
+    top_products["name"] = top_products["name"].fillna("(deleted product)")
+    top_products["margin_pct"] = (top_products["margin"] / top_products["revenue"].where(top_products["revenue"] != 0)).round(3)
+    st.dataframe(top_products.drop(columns=["product_id"]).set_index("rank"), use_container_width=True)
+    st.caption("Days are UTC. Cost is the product's average unit cost when each sale was recorded.")
+
 def page_settings():
     st.markdown("# Settings")
     st.caption("Supabase-backed, multi-tenant inventory.")
@@ -439,6 +1450,31 @@ def page_settings():
     st.write(f"**Role:** {st.session_state.get('role','')}")
     if st.button("Log out", key="btn_logout"):
         logout()
+    query_log_panel()
+
+def query_log_panel():
+    """Supabase calls of this session's recent reruns: count, time, rows and bytes per table/op."""
+    st.markdown("### Supabase calls")
+    reruns = [r for r in query_log().reruns()[:-1] if r["calls"]]  # the last one is this Settings view
+    if not reruns:
+        st.caption("No queries recorded yet; open another page and come back.")
+        return
+    labels = [f"{datetime.fromtimestamp(r['started']).strftime('%H:%M:%S')} · {r['label']} · {len(r['calls'])} call(s)"
+              for r in reruns]
+    idx = st.selectbox("Rerun", range(len(reruns)), index=len(reruns) - 1,
+                       format_func=lambda i: labels[i], key="query_log_rerun")
+    calls = reruns[idx]["calls"]
+    summary = pd.DataFrame(summarize(calls))
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Calls", len(calls))
+    c2.metric("Time in Supabase", f"{summary['total_ms'].sum():.0f} ms")
+    c3.metric("Downloaded", f"{summary['bytes'].sum() / 1024:.1f} KiB")
+    for row in summary[summary["n_plus_one"]].itertuples():
+        st.warning(f"{row.calls - row.background} × {row.op} on {row.table} in one rerun: likely an N+1 query.")
+    st.dataframe(summary.round({"total_ms": 1, "max_ms": 1}), use_container_width=True)
+    with st.expander("Individual calls"):
+        st.dataframe(pd.DataFrame(calls, columns=Call._fields).round({"duration_ms": 1}),
+                     use_container_width=True)
 
 # -------------------------------
 # Auth screen
@@ -491,12 +1527,9 @@ def auth_screen():
             if not sess or not sess.user:
                 st.error("Auto-login returned no user. If email confirmation is enabled, check your inbox."); st.stop()
 
-            # 3) store tokens and attach (and reattach to be safe)
+            # 3) store tokens; they are fresh, so no reattach is needed
             st.session_state["user"] = {"id": sess.user.id, "email": email}
-            st.session_state["jwt"] = sess.session.access_token
-            st.session_state["rt"] = sess.session.refresh_token
-            attach_tokens(st.session_state["jwt"], st.session_state["rt"])
-            reattach_session()
+            attach_tokens(sess.session.access_token, sess.session.refresh_token)
 
             # (Optional) Show what DB sees
             check_db_identity()
@@ -522,12 +1555,9 @@ def auth_screen():
             if not sess or not sess.user:
                 st.error("Invalid email or password, or email not confirmed."); st.stop()
 
-            # keep session + attach tokens (and reattach)
+            # keep session + attach tokens
             st.session_state["user"] = {"id": sess.user.id, "email": email_l}
-            st.session_state["jwt"] = sess.session.access_token
-            st.session_state["rt"] = sess.session.refresh_token
-            attach_tokens(st.session_state["jwt"], st.session_state["rt"])
-            reattach_session()
+            attach_tokens(sess.session.access_token, sess.session.refresh_token)
 
             # (Optional) DB identity
             check_db_identity()
@@ -539,28 +1569,31 @@ def auth_screen():
 # -------------------------------
 # Main
 # -------------------------------
+# Page registry: only the selected page runs, so only its queries hit Supabase.
+PAGES = {
+    "Dashboard": page_dashboard,
+    "Products": page_products,
+    "Reorder": page_reorder,
+    "Receive": page_receive,
+    "Sell": page_sell,
+    "Adjustments": page_adjust,
+    "Sales": page_sales,
+    "Analytics": page_analytics,
+    "Settings": page_settings,
+}
+
 def main():
+    query_log().begin("auth")
     # If not logged in or no org yet, show auth screen
     if "user" not in st.session_state or ("org_id" not in st.session_state):
         auth_screen()
         return
 
     st.sidebar.success(f"Signed in as {st.session_state['user']['email']}")
-    tabs = st.tabs(["Dashboard", "Products", "Receive", "Sell", "Adjustments", "Sales", "Settings"])
-    with tabs[0]:
-        page_dashboard()
-    with tabs[1]:
-        page_products()
-    with tabs[2]:
-        page_receive()
-    with tabs[3]:
-        page_sell()
-    with tabs[4]:
-        page_adjust()
-    with tabs[5]:
-        page_sales()
-    with tabs[6]:
-        page_settings()
+    sync_status(st.session_state["org_id"])
+    page = st.sidebar.radio("Navigate", list(PAGES), key="nav_page")
+    query_log().relabel(page)
+    PAGES[page]()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,266 @@
+"""
+Pack the clips of audio/ into one bundle file with an on-disk hash index.
+
+Deploying or serving thousands of tiny mp3s costs one file or HTTP operation
+per word; a bundle is one file. Readers memory-map it and look a word up in
+O(1) by probing the hash table in place (nothing is parsed up front), and get
+its audio back as a zero-copy memoryview slice of the map.
+
+Layout (little-endian):
+
+    header   MAGIC, version u32, reserved u32                       16 bytes
+    blobs    clip bytes, each distinct clip stored once
+    index    `capacity` slots of SLOT (open addressing, linear probing)
+    names    UTF-8 words, referenced by the slots
+    trailer  index offset u64, capacity u32, count u32,
+             names offset u64, TRAILER_MAGIC                         32 bytes
+
+Adding words appends their clips and a fresh index after the old one, so an
+update writes only the new audio. The stale index and clips of removed words
+stay behind as dead space until it outweighs the live data, at which point
+the bundle is rewritten from scratch (to a temp file, then renamed). An
+interrupted append leaves no valid trailer at the end: readers refuse the
+file and the next build rewrites it.
+
+    from audio_bundle import AudioBundle
+
+    with AudioBundle("audio/bundle.bin") as bundle:
+        clip = bundle.get("Hund")    # memoryview or None
+
+A slice may outlive the `with` block: the file is closed on exit and the map
+is unmapped once the last slice is released or garbage-collected.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from typing import Dict, Iterator, Optional, Tuple
+
+BUNDLE_NAME = "bundle.bin"
+MAGIC = b"A1A2BNDL"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+TRAILER = struct.Struct("<QIIQ8s")
+TRAILER_MAGIC = b"BNDLIDX1"
+# word hash, audio offset, audio length, name offset, name length, clip digest
+SLOT = struct.Struct("<QQIIH16s6x")
+MAX_LOAD = 0.7
+MAX_DEAD_RATIO = 0.5
+
+
+def word_hash(word: str) -> int:
+    """64-bit key of a word; never 0, which marks an empty slot."""
+    h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return h or 1
+
+
+def _capacity(count: int) -> int:
+    cap = 8
+    while cap * MAX_LOAD < count:
+        cap *= 2
+    return cap
+
+
+class BundleError(ValueError):
+    """The file is not a complete bundle (wrong magic, truncated or half-written)."""
+
+
+# -------------------------------
+# Reader
+# -------------------------------
+class AudioBundle:
+    """
+    Read-only view of a bundle. Slices returned by get() point into the map
+    and keep it mapped after close() until they are released.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._fh.close()
+            raise BundleError(f"{path}: empty file")
+        self._view = memoryview(self._map)
+        try:
+            self._index, self._capacity, self._count, self._names = _read_trailer(self._map)
+        except BundleError:
+            self.close()
+            raise
+
+    def __enter__(self) -> "AudioBundle":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self._view.release()
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # callers still hold slices; the map goes when they do
+        finally:
+            self._fh.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, word: str) -> bool:
+        return self._find(word) is not None
+
+    def __getitem__(self, word: str) -> memoryview:
+        clip = self.get(word)
+        if clip is None:
+            raise KeyError(word)
+        return clip
+
+    def get(self, word: str) -> Optional[memoryview]:
+        """The word's audio as a zero-copy slice of the bundle, or None."""
+        slot = self._find(word)
+        if slot is None:
+            return None
+        return self._view[slot[1]:slot[1] + slot[2]]
+
+    def words(self) -> Iterator[str]:
+        for slot in self._slots():
+            yield self._name(slot)
+
+    def _find(self, word: str) -> Optional[Tuple]:
+        h = word_hash(word)
+        name = word.encode("utf-8")
+        mask = self._capacity - 1
+        i = h & mask
+        while True:
+            slot = SLOT.unpack_from(self._map, self._index + i * SLOT.size)
+            if slot[0] == 0:
+                return None
+            if slot[0] == h and slot[4] == len(name) and \
+                    self._view[self._names + slot[3]:self._names + slot[3] + slot[4]] == name:
+                return slot
+            i = (i + 1) & mask
+
+    def _slots(self) -> Iterator[Tuple]:
+        for i in range(self._capacity):
+            slot = SLOT.unpack_from(self._map, self._index + i * SLOT.size)
+            if slot[0]:
+                yield slot
+
+    def _name(self, slot: Tuple) -> str:
+        start = self._names + slot[3]
+        return bytes(self._view[start:start + slot[4]]).decode("utf-8")
+
+
+def _read_trailer(buf) -> Tuple[int, int, int, int]:
+    if len(buf) < HEADER.size + TRAILER.size:
+        raise BundleError("file too short")
+    magic, version, _ = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise BundleError("not an audio bundle (or an unsupported version)")
+    index, capacity, count, names, tail = TRAILER.unpack_from(buf, len(buf) - TRAILER.size)
+    if tail != TRAILER_MAGIC or capacity & (capacity - 1) or \
+            not HEADER.size <= index <= names <= len(buf) - TRAILER.size or \
+            names - index != capacity * SLOT.size:
+        raise BundleError("missing or damaged index (interrupted write?)")
+    return index, capacity, count, names
+
+
+# -------------------------------
+# Writer
+# -------------------------------
+def _index_bytes(entries: Dict[str, Tuple[int, int, bytes]], index_offset: int) -> bytes:
+    """Slots, names and trailer for word -> (audio offset, length, digest)."""
+    capacity = _capacity(len(entries))
+    slots = bytearray(capacity * SLOT.size)
+    names = bytearray()
+    mask = capacity - 1
+    for word, (offset, length, digest) in entries.items():
+        name = word.encode("utf-8")
+        h = word_hash(word)
+        i = h & mask
+        while int.from_bytes(slots[i * SLOT.size:i * SLOT.size + 8], "little"):
+            i = (i + 1) & mask
+        SLOT.pack_into(slots, i * SLOT.size, h, offset, length, len(names), len(name), digest)
+        names += name
+    names_offset = index_offset + len(slots)
+    trailer = TRAILER.pack(index_offset, capacity, len(entries), names_offset, TRAILER_MAGIC)
+    return bytes(slots) + bytes(names) + trailer
+
+
+def _existing(path: str) -> Tuple[Dict[bytes, Tuple[int, int]], Dict[str, bytes], int]:
+    """(digest -> (offset, length), word -> digest, file size) of a readable bundle."""
+    with AudioBundle(path) as bundle:
+        slots = list(bundle._slots())
+        words = {bundle._name(slot): slot[5] for slot in slots}
+        size = len(bundle._map)
+    return {slot[5]: (slot[1], slot[2]) for slot in slots}, words, size
+
+
+def build_bundle(out_dir: str, entries: Dict[str, Dict[str, str]], path: Optional[str] = None,
+                 rebuild: bool = False) -> Tuple[int, int]:
+    """
+    Bring the bundle in line with `entries` (audio/index.json: word -> {"file",
+    "hash", ...}). Clips already in the bundle are reused and new ones are
+    appended; the bundle is rewritten when asked, when it is missing or
+    unreadable, or when dead space outweighs live data.
+    Returns (clips appended, clips reused).
+    """
+    path = path or os.path.join(out_dir, BUNDLE_NAME)
+    wanted = {word: bytes.fromhex(e["hash"])[:16] for word, e in entries.items()}
+    files = {bytes.fromhex(e["hash"])[:16]: e["file"] for e in entries.values()}
+
+    blobs: Dict[bytes, Tuple[int, int]] = {}
+    if not rebuild and os.path.exists(path):
+        try:
+            blobs, words, size = _existing(path)
+        except BundleError:
+            rebuild = True
+        else:
+            if words == wanted:
+                return 0, len(blobs)
+            live = sum(blobs[d][1] for d in set(wanted.values()) if d in blobs)
+            rebuild = size - HEADER.size - live > live * MAX_DEAD_RATIO
+    if rebuild or not os.path.exists(path):
+        return _write_fresh(out_dir, path, wanted, files)
+
+    appended = 0
+    with open(path, "r+b") as fh:
+        fh.seek(0, os.SEEK_END)
+        for digest in dict.fromkeys(wanted.values()):
+            if digest in blobs:
+                continue
+            with open(os.path.join(out_dir, files[digest]), "rb") as clip:
+                data = clip.read()
+            blobs[digest] = (fh.tell(), len(data))
+            fh.write(data)
+            appended += 1
+        index = {word: (*blobs[d], d) for word, d in wanted.items()}
+        fh.write(_index_bytes(index, fh.tell()))
+        fh.flush()
+        os.fsync(fh.fileno())
+    return appended, len(set(wanted.values())) - appended
+
+
+def _write_fresh(out_dir: str, path: str, wanted: Dict[str, bytes], files: Dict[bytes, str]) -> Tuple[int, int]:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(HEADER.pack(MAGIC, VERSION, 0))
+            blobs: Dict[bytes, Tuple[int, int]] = {}
+            for digest in dict.fromkeys(wanted.values()):
+                with open(os.path.join(out_dir, files[digest]), "rb") as clip:
+                    data = clip.read()
+                blobs[digest] = (fh.tell(), len(data))
+                fh.write(data)
+            fh.write(_index_bytes({word: (*blobs[d], d) for word, d in wanted.items()}, fh.tell()))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return len(blobs), 0
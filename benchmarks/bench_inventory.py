@@ -0,0 +1,522 @@
+"""
+Load and latency benchmark for the inventory data-access layer.
+
+Runs the app's data functions, plus one full main() rerun through Streamlit's
+AppTest, against an in-process PostgREST stand-in. The app's httpx transport
+is patched to serve requests from seeded in-memory data, so no database or
+network is needed. For each catalogue size and number of concurrent users it
+reports, per operation:
+
+  round_trips  HTTP requests the operation made
+  bytes        request + response payload bytes
+  p50 / p95    latency in ms: measured client time plus a modelled network
+               cost (--rtt-ms per round-trip, payload over --mbps)
+
+    python benchmarks/bench_inventory.py                        # 1k, 10k, 100k
+    python benchmarks/bench_inventory.py --sizes 1000 --users 1 8
+    python benchmarks/bench_inventory.py --check                # exit 1 on regressions
+    python benchmarks/bench_inventory.py --update-baseline
+
+--check compares against benchmarks/baseline.json: round-trips may not grow,
+bytes may not grow by more than --tolerance, and (with --check-latency) p95
+may not grow by more than --latency-tolerance.
+"""
+import argparse
+import base64
+import json
+import operator
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+APP_FILE = os.path.join(REPO, "a1a2vocab.py")
+BASELINE_FILE = os.path.join(HERE, "baseline.json")
+
+HOST = "bench.supabase.co"
+ANON_KEY = "bench-anon-key-" + "x" * 32
+ORG_ID = "00000000-0000-0000-0000-00000000000b"
+USER_ID = "00000000-0000-0000-0000-00000000000a"
+
+
+# -------------------------------
+# PostgREST stand-in
+# -------------------------------
+class FakePostgrest:
+    """Answers the REST and RPC calls the app makes from seeded rows."""
+
+    def __init__(self, n_products: int, n_sales: int = 1000):
+        self.products = [{
+            "id": str(uuid.UUID(int=i + 1)),
+            "org_id": ORG_ID,
+            "sku": f"SKU-{i:06d}",
+            "name": f"Product {i:06d}",
+            "unit": "pcs",
+            "category": f"Category {i % 50}",
+            "min_stock": 5.0,
+            "price": 9.99,
+            "unit_cost": 4.5,
+            "qty": float(i % 40),
+            "low_stock": (i % 40) < 5,
+            "updated_at": "2024-04-01T00:00:00+00:00",
+            "stock_updated_at": "2024-04-01T00:00:00+00:00",
+        } for i in range(n_products)]
+        self.sales = [{
+            "id": str(uuid.UUID(int=10 ** 9 + i)),
+            "org_id": ORG_ID,
+            "created_at": f"2024-04-01T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}+00:00",
+            "ref": f"R{i}",
+            "total": 19.98,
+        } for i in range(n_sales)]
+        self._full_changes: Optional[bytes] = None
+        self._sorted: Dict = {}
+        self._daily_units: Optional[Dict] = None
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.startswith("/rest/v1/rpc/"):
+            body = json.loads(request.content or b"{}")
+            return self._rpc(path.rsplit("/", 1)[-1], body)
+        if path.startswith("/rest/v1/"):
+            table = path.rsplit("/", 1)[-1]
+            params = parse_qs(request.url.query.decode())
+            if request.method == "GET":
+                return self._select(table, params)
+            return self._json([])
+        return self._json({})
+
+    def _select(self, table: str, params: Dict[str, List[str]]) -> httpx.Response:
+        """Apply the filters (col=op.value and or=(...)), order and limit the app sends."""
+        order = params.get("order", [""])[0]
+        rows: Iterable[Dict] = self._ordered(table, order)
+        for col, values in params.items():
+            if col in ("select", "order", "limit", "offset"):
+                continue
+            for value in values:
+                term = "or" + value if col == "or" else f"{col}.{value}"
+                rows = self._where(rows, term)
+        if "limit" in params:
+            rows = islice(rows, int(params["limit"][0]))
+        rows = list(rows)
+        cols = [c for c in params.get("select", ["*"])[0].split(",") if c and "(" not in c]
+        if cols and cols != ["*"]:
+            rows = [{c: r.get(c) for c in cols} for r in rows]
+        return self._json(rows)
+
+    def _ordered(self, table: str, order: str) -> List[Dict]:
+        """The table sorted by an order=col.dir,... spec, computed once per spec."""
+        rows = {"products": self.products, "stock_view": self.products, "sales": self.sales}.get(table, [])
+        if not order:
+            return rows
+        if (table, order) not in self._sorted:
+            for spec in reversed(order.split(",")):
+                col, _, direction = spec.partition(".")
+                rows = sorted(rows, key=lambda r: r.get(col), reverse=direction.startswith("desc"))
+            self._sorted[(table, order)] = rows
+        return self._sorted[(table, order)]
+
+    def _where(self, rows: Iterable[Dict], term: str) -> Iterable[Dict]:
+        # Lazy, so a limit after a selective filter stops early like an index scan would.
+        return (r for r in rows if self._match(r, term))
+
+    OPERATORS = {"eq": operator.eq, "neq": operator.ne, "gt": operator.gt, "gte": operator.ge,
+                 "lt": operator.lt, "lte": operator.le}
+
+    @classmethod
+    def _match(cls, row: Dict, term: str) -> bool:
+        """Evaluate one PostgREST filter term: col.op.value, and(...) or or(...)."""
+        for logic, combine in (("and(", all), ("or(", any)):
+            if term.startswith(logic):
+                return combine(cls._match(row, t) for t in cls._split(term[len(logic):-1]))
+        col, op, arg = term.split(".", 2)
+        if arg.startswith('"'):
+            arg = re.sub(r"\\(.)", r"\1", arg[1:-1])
+        value = row.get(col)
+        if op == "is":
+            return value is None if arg == "null" else value is (arg == "true")
+        if value is None:
+            return False
+        if isinstance(value, bool):
+            arg = arg == "true"
+        elif isinstance(value, (int, float)):
+            arg = float(arg)
+        return cls.OPERATORS[op](value, arg)
+
+    @staticmethod
+    def _split(expr: str) -> List[str]:
+        """Split a logic expression on its top-level commas (outside quotes and parentheses)."""
+        parts, depth, quoted, escaped, start = [], 0, False, False, 0
+        for i, c in enumerate(expr):
+            if escaped:
+                escaped = False
+            elif quoted:
+                escaped, quoted = c == "\\", c != '"'
+            elif c == '"':
+                quoted = True
+            elif c in "()":
+                depth += 1 if c == "(" else -1
+            elif c == "," and not depth:
+                parts.append(expr[start:i])
+                start = i + 1
+        parts.append(expr[start:])
+        return parts
+
+    def _rpc(self, fn: str, body: Dict) -> httpx.Response:
+        if fn == "stock_changes":
+            if body.get("p_since") is None:
+                if self._full_changes is None:
+                    self._full_changes = json.dumps({"cursor": "1000", "rows": self.products,
+                                                     "deleted": []}).encode()
+                return httpx.Response(200, content=self._full_changes, headers={"content-type": "application/json"})
+            return self._json({"cursor": "1001", "rows": self.products[:3], "deleted": []})
+        if fn == "search_products":
+            return self._json(self.products[:int(body.get("p_limit") or 20)])
+        if fn == "dashboard_metrics":
+            low = [p for p in self.products[:400] if p["low_stock"]][:50]
+            return self._json({
+                "item_count": len(self.products), "total_qty": 1.0, "low_stock_count": len(low),
+                "sales_today": 0, "sales_today_count": 0, "sales_week": 0, "sales_week_count": 0,
+                "low_stock": [{k: p[k] for k in ("sku", "name", "qty", "min_stock", "category")} for p in low],
+                "recent_sales": [{k: s[k] for k in ("id", "created_at", "ref", "total")} for s in self.sales[:10]],
+                "recent_stock": self._latest(int(body.get("p_changes_limit") or 20)),
+            })
+        if fn == "latest_stock_changes":
+            return self._json(self._latest(int(body.get("p_limit") or 20)))
+        if fn == "sales_analytics":
+            days = [f"2024-{m:02d}-{d:02d}" for m in range(1, 13) for d in range(1, 29)]
+            return self._json({
+                "buckets": [{"bucket": d, "sale_count": 40, "units": 120, "revenue": 1198.8, "cost": 540.0,
+                             "margin": 658.8} for d in days],
+                "top": [{"rank": i + 1, "product_id": p["id"], "sku": p["sku"], "name": p["name"], "units": 50,
+                         "revenue": 499.5, "cost": 225.0, "margin": 274.5}
+                        for i, p in enumerate(self.products[:int(body.get("p_top") or 10)])],
+            })
+        if fn == "daily_units":
+            if self._daily_units is None:
+                # Every 10th product sells on every 7th day of the year.
+                n = (len(self.products) + 9) // 10
+                p = [i for i in range(n) for _ in range(0, 365, 7)]
+                d = [d for _ in range(n) for d in range(0, 365, 7)]
+                self._daily_units = {"product_ids": [self.products[i * 10]["id"] for i in range(n)],
+                                     "p": p, "d": d, "u": [3] * len(p)}
+            return self._json({"since": body["p_since"], "today": date.today().isoformat(), **self._daily_units})
+        if fn == "sync_pos_ops":
+            return self._json({"applied": [op["key"] for op in body.get("p_ops") or []], "failed": []})
+        return self._json(None)
+
+    def _latest(self, n: int) -> List[Dict]:
+        return [{k: p[k] for k in ("id", "sku", "name", "unit", "qty", "updated_at")} for p in self.products[:n]]
+
+    @staticmethod
+    def _json(data) -> httpx.Response:
+        return httpx.Response(200, json=data)
+
+
+class Recorder:
+    """Collects (request bytes, response bytes) per measured operation, thread by thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.fallback: Optional[List] = None  # for requests made on threads we don't own (AppTest)
+
+    @contextmanager
+    def measure(self):
+        calls: List = []
+        self._local.calls = calls
+        try:
+            yield calls
+        finally:
+            self._local.calls = None
+
+    def record(self, req_bytes: int, resp_bytes: int):
+        calls = getattr(self._local, "calls", None)
+        if calls is None:
+            calls = self.fallback
+        if calls is not None:
+            with self._lock:
+                calls.append((req_bytes, resp_bytes))
+
+
+def install_fake_transport(fake: FakePostgrest, recorder: Recorder):
+    """Route every httpx request for the bench host to the fake, recording sizes."""
+    real = httpx.HTTPTransport.handle_request
+
+    def handle_request(transport, request):
+        if request.url.host != HOST:
+            return real(transport, request)
+        request.read()
+        response = fake(request)
+        response.read()
+        recorder.record(len(request.content) + len(str(request.url)), len(response.content))
+        return response
+
+    httpx.HTTPTransport.handle_request = handle_request
+
+
+# -------------------------------
+# App setup
+# -------------------------------
+def fake_jwt() -> str:
+    def enc(obj) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    return ".".join((enc({"alg": "HS256", "typ": "JWT"}),
+                     enc({"sub": USER_ID, "exp": int(time.time()) + 24 * 3600}), "sig"))
+
+
+SESSION = {
+    "user": {"id": USER_ID, "email": "bench@example.com"},
+    "org_id": ORG_ID,
+    "role": "owner",
+    "membership_user": USER_ID,
+    "rt": "bench-refresh-token",
+}
+
+
+def secrets(workdir: str) -> Dict[str, str]:
+    return {
+        "SUPABASE_URL": f"https://{HOST}",
+        "SUPABASE_ANON_KEY": ANON_KEY,
+        "POS_QUEUE_PATH": os.path.join(workdir, "pos_queue.sqlite3"),
+    }
+
+
+def import_app(workdir: str):
+    """Import a1a2vocab in Streamlit bare mode with bench secrets."""
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as fh:
+        for k, v in secrets(workdir).items():
+            fh.write(f"{k} = {json.dumps(v)}\n")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO)
+    import a1a2vocab as app
+    app.st = PerUserStreamlit(app.st)
+    return app
+
+
+class PerUserStreamlit:
+    """
+    Stands in for the app's `st` module: everything is forwarded to streamlit
+    except session_state, which is a plain dict per thread, so each simulated
+    user gets its own session (bare mode only has one).
+    """
+
+    def __init__(self, st):
+        self._st = st
+        self._local = threading.local()
+
+    @property
+    def session_state(self) -> Dict:
+        if not hasattr(self._local, "state"):
+            self._local.state = {}
+        return self._local.state
+
+    def __getattr__(self, name):
+        return getattr(self._st, name)
+
+
+def reset_session(app, jwt: str):
+    """
+    Sign in and drop the per-session data caches so every call goes to the
+    server. The pooled connection (_db) is kept, as it would be within a session.
+    """
+    state = app.st.session_state
+    for k in ("_data_cache", "_live_stock", "_demand", "basket"):
+        state.pop(k, None)
+    state.update(SESSION)
+    state["jwt"] = jwt
+
+
+# -------------------------------
+# Operations
+# -------------------------------
+def make_ops(app, workdir: str) -> Dict[str, Callable[[], None]]:
+    from pos_queue import SyncWorker
+
+    def flushed(write: Callable[[], None]) -> Callable[[], None]:
+        # Enqueue through the app, then flush synchronously instead of on a thread.
+        def op():
+            worker = SyncWorker(app.pos_queue(), ORG_ID)
+            worker.set_sender(app._sync_sender(app.db()), USER_ID)
+            original = app.sync_worker
+            app.sync_worker = lambda org_id: worker
+            try:
+                write()
+            finally:
+                app.sync_worker = original
+            worker.flush()
+        return op
+
+    first = str(uuid.UUID(int=1))
+    return {
+        "list_products_page": lambda: app.list_products_page(ORG_ID),
+        "list_products_next_page": lambda: app.list_products_page(ORG_ID, ("Product 000049", str(uuid.UUID(int=50)))),
+        "list_sales_page": lambda: app.list_sales_page(ORG_ID),
+        "get_stock_df": lambda: app.get_stock_df(ORG_ID),
+        "low_stock_df": lambda: app.get_stock_df(ORG_ID, low_only=True),
+        "search_products": lambda: app.search_products(ORG_ID, "product 00"),
+        "dashboard_metrics": lambda: app.get_dashboard_metrics(ORG_ID),
+        "reorder_suggestions": lambda: app.reorder_suggestions(ORG_ID),
+        "sales_analytics": lambda: app.get_sales_analytics(ORG_ID, date(2024, 1, 1), date(2024, 12, 31)),
+        "sell_items": flushed(lambda: app.sell_items(
+            ORG_ID, [{"product_id": first, "qty": 1, "unit_price": 9.99}] * 3, "bench")),
+        "receive_stock": flushed(lambda: app.receive_stock(ORG_ID, first, 10, 4.5)),
+        "main_rerun": lambda: run_main(workdir),
+    }
+
+
+def run_main(workdir: str):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_FILE, default_timeout=120)
+    for k, v in secrets(workdir).items():
+        at.secrets[k] = v
+    for k, v in SESSION.items():
+        at.session_state[k] = v
+    at.session_state["jwt"] = fake_jwt()
+    at.run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+
+# -------------------------------
+# Runner
+# -------------------------------
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def bench_op(app, recorder: Recorder, name: str, op: Callable[[], None], users: int, repeat: int,
+             rtt_ms: float, mbps: float) -> Dict[str, float]:
+    samples: List[Dict[str, float]] = []
+    lock = threading.Lock()
+
+    jwt = fake_jwt()
+
+    def one():
+        reset_session(app, jwt)
+        with recorder.measure() as calls:
+            if name == "main_rerun":
+                recorder.fallback = calls
+            started = time.perf_counter()
+            op()
+            wall_ms = (time.perf_counter() - started) * 1000
+            recorder.fallback = None
+        nbytes = sum(a + b for a, b in calls)
+        latency = wall_ms + len(calls) * rtt_ms + nbytes * 8 / (mbps * 1e6) * 1000
+        with lock:
+            samples.append({"round_trips": len(calls), "bytes": nbytes, "latency_ms": latency})
+
+    one()  # warm-up (imports, cache_resource)
+    samples.clear()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        for fut in [pool.submit(one) for _ in range(repeat * users)]:
+            fut.result()
+    lat = [s["latency_ms"] for s in samples]
+    return {
+        "round_trips": max(s["round_trips"] for s in samples),
+        "bytes": int(sum(s["bytes"] for s in samples) / len(samples)),
+        "p50_ms": round(percentile(lat, 0.50), 2),
+        "p95_ms": round(percentile(lat, 0.95), 2),
+    }
+
+
+def check(results: Dict, baseline: Dict, tolerance: float, latency_tolerance: Optional[float]) -> List[str]:
+    problems = []
+    for key, ops in results.items():
+        for name, got in ops.items():
+            want = baseline.get(key, {}).get(name)
+            if not want:
+                continue
+            if got["round_trips"] > want["round_trips"]:
+                problems.append(f"{key} {name}: round_trips {got['round_trips']} > {want['round_trips']}")
+            if got["bytes"] > want["bytes"] * (1 + tolerance):
+                problems.append(f"{key} {name}: bytes {got['bytes']} > {want['bytes']} (+{tolerance:.0%})")
+            if latency_tolerance is not None and got["p95_ms"] > want["p95_ms"] * (1 + latency_tolerance):
+                problems.append(f"{key} {name}: p95 {got['p95_ms']}ms > {want['p95_ms']}ms (+{latency_tolerance:.0%})")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark the inventory data-access functions.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="catalogue sizes")
+    ap.add_argument("--users", type=int, nargs="+", default=[1, 8], help="concurrent users")
+    ap.add_argument("--ops", nargs="+", help="only these operations")
+    ap.add_argument("--repeat", type=int, default=10, help="measured runs per user")
+    ap.add_argument("--rtt-ms", type=float, default=30.0, help="modelled round-trip time")
+    ap.add_argument("--mbps", type=float, default=20.0, help="modelled bandwidth")
+    ap.add_argument("--check", action="store_true", help="fail on regressions against the baseline")
+    ap.add_argument("--check-latency", action="store_true", help="also compare p95 latency")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed growth of bytes")
+    ap.add_argument("--latency-tolerance", type=float, default=0.50, help="allowed growth of p95")
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--json", help="also write results to this file")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="inventory_bench_")
+    recorder = Recorder()
+    app = import_app(workdir)
+    ops = make_ops(app, workdir)
+    names = args.ops or list(ops)
+
+    results: Dict[str, Dict[str, Dict]] = {}
+    for size in args.sizes:
+        install_fake_transport(FakePostgrest(size), recorder)
+        for users in args.users:
+            key = f"{size}x{users}"
+            results[key] = {}
+            print(f"\n== {size} products, {users} concurrent user(s) ==")
+            print(f"{'operation':<24} {'round_trips':>11} {'bytes':>12} {'p50_ms':>10} {'p95_ms':>10}")
+            for name in names:
+                if name == "main_rerun" and users > 1:
+                    continue  # AppTest drives one script run at a time
+                repeat = max(2, args.repeat // 5) if name == "main_rerun" else args.repeat
+                r = bench_op(app, recorder, name, ops[name], users, repeat, args.rtt_ms, args.mbps)
+                results[key][name] = r
+                print(f"{name:<24} {r['round_trips']:>11} {r['bytes']:>12} {r['p50_ms']:>10.1f} {r['p95_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE) as fh:
+                baseline = json.load(fh)
+        for key, ops in results.items():
+            baseline.setdefault(key, {}).update(ops)
+        with open(BASELINE_FILE, "w") as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"\nBaseline written to {BASELINE_FILE}")
+    if args.check:
+        if not os.path.exists(BASELINE_FILE):
+            print("\nNo baseline to check against; run with --update-baseline first.")
+            return 1
+        with open(BASELINE_FILE) as fh:
+            problems = check(results, json.load(fh), args.tolerance,
+                             args.latency_tolerance if args.check_latency else None)
+        if problems:
+            print("\nRegressions:")
+            for p in problems:
+                print(f"  {p}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
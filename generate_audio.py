@@ -1,16 +1,281 @@
-from gtts import gTTS
-import os
-from a1a2vocab import a1_vocab, a2_vocab  # ✅ import both
-
-# Combine both lists
-all_vocab = a1_vocab + a2_vocab
-
-os.makedirs("audio", exist_ok=True)
-
-for word, _ in all_vocab:
-    filename = word.replace(" ", "_").replace(".", "").replace("/", "").replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("ß", "ss") + ".mp3"
-    path = os.path.join("audio", filename)
-    if not os.path.exists(path):
-        tts = gTTS(word, lang="de")
-        tts.save(path)
-        print(f"✅ Saved: {path}")
+"""
+Generate one mp3 per vocab word into audio/.
+
+Clips are content-addressed: the file name is a hash of (text, lang, voice),
+so different words can never share or overwrite each other's audio, and
+audio/index.json maps each word to its clip (and vocab level). Only words
+whose hash changed are synthesized; clips no longer referenced are
+garbage-collected, within the levels of the run only.
+
+Words are synthesized concurrently under a shared rate limit and retried with
+backoff. Each clip is written to a temp file and renamed into place, so an
+interrupted run never leaves a truncated mp3.
+
+    python generate_audio.py --workers 8 --rate 4
+    python generate_audio.py --backend stub     # offline, placeholder audio
+    python generate_audio.py --bundle           # also pack audio/bundle.bin
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from audio_bundle import build_bundle
+from vocab import LEVELS, iter_vocab
+
+AUDIO_DIR = "audio"
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+INDEX_SAVE_EVERY = 25
+
+# A synthesizer turns (text, lang, voice) into encoded audio bytes.
+Synthesizer = Callable[[str, str, str], bytes]
+
+
+# -------------------------------
+# TTS backends
+# -------------------------------
+def gtts_synthesizer(text: str, lang: str, voice: str) -> bytes:
+    """gTTS; the voice is the Google host TLD that selects the accent (e.g. "de", "com")."""
+    from gtts import gTTS  # imported lazily so the stub backend works without it
+    buf = io.BytesIO()
+    gTTS(text, lang=lang, tld=voice or "com").write_to_fp(buf)
+    return buf.getvalue()
+
+
+def stub_synthesizer(text: str, lang: str, voice: str) -> bytes:
+    """Offline stand-in: deterministic bytes per (text, lang, voice), no network."""
+    return f"STUB-TTS [{lang}/{voice}] {text}\n".encode("utf-8")
+
+
+BACKENDS: Dict[str, Synthesizer] = {
+    "gtts": gtts_synthesizer,
+    "stub": stub_synthesizer,
+}
+
+
+# -------------------------------
+# Rate limiting & retries
+# -------------------------------
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads (rate <= 0: no limit)."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def synthesize_with_retry(synth: Synthesizer, text: str, lang: str, voice: str, limiter: RateLimiter,
+                          retries: int = 4, backoff: float = 1.0) -> bytes:
+    """Call synth under the rate limit, retrying with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return synth(text, lang, voice)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+    raise AssertionError("unreachable")
+
+
+# -------------------------------
+# Content-addressed files & index
+# -------------------------------
+def clip_hash(text: str, lang: str, voice: str) -> str:
+    """Stable key of one clip; text is NFC-normalised so equal spellings share audio."""
+    raw = "\x00".join((unicodedata.normalize("NFC", text), lang, voice))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def clip_filename(digest: str) -> str:
+    return digest + ".mp3"
+
+
+def atomic_write(path: str, data: bytes):
+    """Write to a temp file in the same directory, then rename over path."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_index(out_dir: str) -> Dict[str, Dict[str, str]]:
+    """word -> {"file", "hash", "lang", "voice"[, "level"]} for every clip of earlier runs."""
+    try:
+        with open(os.path.join(out_dir, INDEX_NAME), encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION:
+        return {}
+    return data.get("entries", {})
+
+
+def save_index(out_dir: str, entries: Dict[str, Dict[str, str]]):
+    data = json.dumps({"version": INDEX_VERSION, "entries": entries},
+                      ensure_ascii=False, indent=0, sort_keys=True).encode("utf-8")
+    atomic_write(os.path.join(out_dir, INDEX_NAME), data)
+
+
+def collect_garbage(out_dir: str, entries: Dict[str, Dict[str, str]]) -> int:
+    """Delete clips (and stale .part files) that no index entry points to."""
+    keep = {e["file"] for e in entries.values()}
+    removed = 0
+    for name in os.listdir(out_dir):
+        if (name.endswith(".mp3") and name not in keep) or name.endswith(".part"):
+            os.remove(os.path.join(out_dir, name))
+            removed += 1
+    return removed
+
+
+# -------------------------------
+# Pipeline
+# -------------------------------
+def generate(words: Iterable[Union[str, Tuple[str, str]]],
+             out_dir: str = AUDIO_DIR,
+             synth: Synthesizer = gtts_synthesizer,
+             lang: str = "de",
+             voice: str = "",
+             workers: int = 4,
+             rate: float = 4.0,
+             retries: int = 4,
+             backoff: float = 1.0,
+             gc: bool = True) -> Tuple[int, int, List[Tuple[str, str]]]:
+    """
+    Bring out_dir in line with `words` (plain words or (word, level) pairs):
+    synthesize clips whose hash is not on disk yet, re-point the index, and
+    (with gc) drop entries and files for words that are gone. Only entries of
+    the levels in this run are collected, so `--levels A1` leaves A2 alone.
+    Returns (generated, up_to_date, [(word, error), ...]).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    entries = load_index(out_dir)
+    levels: Dict[str, Optional[str]] = {}
+    for item in words:
+        word, level = (item, None) if isinstance(item, str) else item
+        levels[word] = level
+    wanted = {word: clip_hash(word, lang, voice) for word in levels}
+
+    def entry(word: str, digest: str) -> Dict[str, str]:
+        e = {"file": clip_filename(digest), "hash": digest, "lang": lang, "voice": voice}
+        if levels[word]:
+            e["level"] = levels[word]
+        return e
+
+    # An empty word list is almost certainly a data problem; never GC everything.
+    gc = gc and bool(wanted)
+
+    # hash -> words that need it; clips already on disk are just (re)indexed.
+    todo: Dict[str, List[str]] = {}
+    up_to_date = 0
+    for word, digest in wanted.items():
+        old = entries.get(word)
+        if old and old.get("hash") == digest and os.path.exists(os.path.join(out_dir, old["file"])):
+            entries[word] = entry(word, digest)  # picks up the level for entries of older runs
+            up_to_date += 1
+            continue
+        # Never leave a word pointing at audio for different text.
+        entries.pop(word, None)
+        if os.path.exists(os.path.join(out_dir, clip_filename(digest))):
+            entries[word] = entry(word, digest)
+            up_to_date += 1
+        else:
+            todo.setdefault(digest, []).append(word)
+
+    limiter = RateLimiter(rate)
+    lock = threading.Lock()
+    failed: List[Tuple[str, str]] = []
+    done = 0
+
+    def work(digest: str, text: str) -> str:
+        name = clip_filename(digest)
+        atomic_write(os.path.join(out_dir, name), synthesize_with_retry(synth, text, lang, voice, limiter, retries, backoff))
+        return name
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(work, digest, group[0]): digest for digest, group in todo.items()}
+            for fut in as_completed(futures):
+                digest = futures[fut]
+                group = todo[digest]
+                try:
+                    name = fut.result()
+                except Exception as e:
+                    failed.extend((word, str(e)) for word in group)
+                    print(f"❌ Failed: {group[0]} ({e})")
+                    continue
+                with lock:
+                    for word in group:
+                        entries[word] = entry(word, digest)
+                    done += 1
+                    if done % INDEX_SAVE_EVERY == 0:
+                        save_index(out_dir, entries)
+                print(f"✅ Saved: {group[0]} -> {os.path.join(out_dir, name)}")
+    finally:
+        if gc:
+            scope = set(levels.values())
+            for word in [w for w, e in entries.items() if w not in wanted and e.get("level") in scope]:
+                del entries[word]
+        save_index(out_dir, entries)
+    if gc:
+        removed = collect_garbage(out_dir, entries)
+        if removed:
+            print(f"🧹 Removed {removed} orphaned file(s).")
+    return done, up_to_date, failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Generate vocab audio clips.")
+    ap.add_argument("--out", default=AUDIO_DIR, help="output directory (default: audio)")
+    ap.add_argument("--backend", choices=sorted(BACKENDS), default="gtts")
+    ap.add_argument("--levels", nargs="+", default=list(LEVELS), help="vocab levels to include (default: all)")
+    ap.add_argument("--lang", default="de")
+    ap.add_argument("--voice", default="", help="backend voice/accent (gtts: host TLD, e.g. de)")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent synth calls")
+    ap.add_argument("--rate", type=float, default=4.0, help="max synth calls per second (0 = unlimited)")
+    ap.add_argument("--retries", type=int, default=4)
+    ap.add_argument("--no-gc", action="store_true", help="keep clips of words no longer in the vocab")
+    ap.add_argument("--bundle", action="store_true",
+                    help="also pack the clips into one bundle file (default: <out>/bundle.bin)")
+    ap.add_argument("--bundle-path", help="where to write the bundle")
+    ap.add_argument("--rebuild-bundle", action="store_true", help="rewrite the bundle instead of appending")
+    args = ap.parse_args(argv)
+
+    started = time.monotonic()
+    words = ((entry.word, entry.level) for entry in iter_vocab(args.levels))
+    done, skipped, failed = generate(words, args.out, BACKENDS[args.backend], args.lang, args.voice,
+                                     args.workers, args.rate, args.retries, gc=not args.no_gc)
+    print(f"Done in {time.monotonic() - started:.1f}s: {done} generated, {skipped} up to date, {len(failed)} failed.")
+    if args.bundle or args.bundle_path or args.rebuild_bundle:
+        appended, reused = build_bundle(args.out, load_index(args.out), args.bundle_path, args.rebuild_bundle)
+        print(f"📦 Bundle: {appended} clip(s) added, {reused} reused.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
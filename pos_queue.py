@@ -0,0 +1,227 @@
+"""
+Durable local write queue for the point of sale.
+
+Sales and receipts are recorded in a local SQLite file first, each under a
+client-generated idempotency key, and a background worker pushes them to
+Supabase in batches. The till never waits on the network, and because the
+server skips keys it has already applied, retrying a batch is always safe.
+
+This module has no Streamlit or Supabase imports; the worker is given a
+`send(org_id, ops)` callable per signed-in user that returns the server's
+verdict per key. Each operation is sent by the user who recorded it, so the
+server credits it to them.
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# send(org_id, ops) -> {"applied": [key, ...], "failed": [{"key": ..., "error": ...}, ...]}
+Sender = Callable[[str, List[Dict]], Dict]
+# pending() without a user filter.
+ANY_USER = object()
+
+
+class WriteQueue:
+    """SQLite-backed queue of operations; safe to share between threads."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ops (
+                key TEXT PRIMARY KEY,
+                org_id TEXT NOT NULL,
+                user_id TEXT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        if "user_id" not in [c[1] for c in self._conn.execute("PRAGMA table_info(ops)")]:
+            self._conn.execute("ALTER TABLE ops ADD COLUMN user_id TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ops_status_org_idx ON ops (status, org_id, created_at)")
+
+    def enqueue(self, org_id: str, kind: str, payload: Dict, user_id: Optional[str] = None) -> str:
+        """Durably record one operation by `user_id` and return its idempotency key."""
+        key = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ops (key, org_id, user_id, kind, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, org_id, user_id, kind, json.dumps(payload), time.time()),
+            )
+        return key
+
+    def pending(self, org_id: str, limit: int = 50, user_id: Optional[str] = ANY_USER) -> List[Dict]:
+        """
+        Oldest pending operations of one org, in the order they were recorded;
+        with `user_id`, only that user's (plus any recorded without a user).
+        """
+        sql = "SELECT key, kind, payload FROM ops WHERE status = ? AND org_id = ?"
+        args: List = [PENDING, org_id]
+        if user_id is not ANY_USER:
+            sql += " AND (user_id = ? OR user_id IS NULL)"
+            args.append(user_id)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY created_at LIMIT ?", (*args, limit)).fetchall()
+        return [{"key": k, "kind": kind, "payload": json.loads(p)} for k, kind, p in rows]
+
+    def failed(self, org_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, kind, payload, last_error, created_at FROM ops WHERE status = ? AND org_id = ? ORDER BY created_at",
+                (FAILED, org_id),
+            ).fetchall()
+        return [{"key": k, "kind": kind, "payload": json.loads(p), "error": e, "created_at": c}
+                for k, kind, p, e, c in rows]
+
+    def counts(self, org_id: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM ops WHERE org_id = ? AND status != ? GROUP BY status",
+                (org_id, DONE),
+            ).fetchall()
+        return {PENDING: 0, FAILED: 0, **dict(rows)}
+
+    def mark_done(self, keys: List[str]):
+        self._set_status(keys, DONE, None)
+
+    def mark_failed(self, keys: List[str], error: str):
+        """Rejected by the server: keep the operation for review, stop retrying it."""
+        self._set_status(keys, FAILED, error)
+
+    def mark_retry(self, keys: List[str], error: str):
+        """Transient error (network, auth): stays pending for the next flush."""
+        self._set_status(keys, PENDING, error)
+
+    def requeue_failed(self, org_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE ops SET status = ? WHERE status = ? AND org_id = ?", (PENDING, FAILED, org_id))
+
+    def discard_failed(self, org_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM ops WHERE status = ? AND org_id = ?", (FAILED, org_id))
+
+    def _set_status(self, keys: List[str], status: str, error: Optional[str]):
+        if not keys:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE ops SET status = ?, last_error = ?, attempts = attempts + 1 WHERE key = ?",
+                [(status, error, k) for k in keys],
+            )
+
+
+class SyncWorker(threading.Thread):
+    """
+    Background thread that flushes one org's pending operations in batches.
+    It wakes every `interval` seconds or when wake() is called, and backs off
+    exponentially (up to `max_backoff`) while the server is unreachable.
+    Operations go out through the sender of the user who recorded them; those
+    of a user with no signed-in session wait until that user signs in again.
+    `send` is the sender for operations recorded without a user.
+    """
+
+    def __init__(self, queue: WriteQueue, org_id: str, send: Optional[Sender] = None,
+                 batch_size: int = 50, interval: float = 5.0, max_backoff: float = 60.0):
+        super().__init__(name=f"pos-sync-{org_id}", daemon=True)
+        self.queue = queue
+        self.org_id = org_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.applied_total = 0
+        self.last_error: Optional[str] = None
+        self._senders: Dict[Optional[str], Sender] = {}
+        if send is not None:
+            self._senders[None] = send
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+
+    def set_sender(self, send: Optional[Sender], user_id: Optional[str] = None):
+        """Swap in `user_id`'s sender with fresh credentials (e.g. after a token refresh)."""
+        if send is None:
+            self._senders.pop(user_id, None)
+        else:
+            self._senders[user_id] = send
+
+    def release_sender(self, send: Optional[Sender], user_id: Optional[str] = None):
+        """Drop `user_id`'s `send` (e.g. on logout) unless another session has replaced it since."""
+        if send is not None and self._senders.get(user_id) is send:
+            self._senders.pop(user_id, None)
+
+    def sender(self, user_id: Optional[str] = None) -> Optional[Sender]:
+        return self._senders.get(user_id)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def flush(self) -> int:
+        """
+        Push pending operations of every user with a sender until none are
+        left; returns how many were applied.
+        """
+        applied = 0
+        with self._flush_lock:
+            for user_id in list(self._senders):
+                applied += self._flush_user(user_id)
+        return applied
+
+    def _flush_user(self, user_id: Optional[str]) -> int:
+        applied = 0
+        while True:
+            send = self._senders.get(user_id)
+            if send is None:
+                break
+            ops = self.queue.pending(self.org_id, self.batch_size, user_id)
+            if not ops:
+                break
+            keys = [op["key"] for op in ops]
+            try:
+                result = send(self.org_id, ops) or {}
+            except Exception as e:
+                self.last_error = str(e)
+                self.queue.mark_retry(keys, self.last_error)
+                raise
+            ok = list(result.get("applied") or [])
+            self.queue.mark_done(ok)
+            for item in result.get("failed") or []:
+                self.queue.mark_failed([item["key"]], item.get("error") or "rejected")
+            # Anything the server did not mention is retried next time.
+            answered = set(ok) | {item["key"] for item in result.get("failed") or []}
+            self.queue.mark_retry([k for k in keys if k not in answered], "no result from server")
+            applied += len(ok)
+            self.applied_total += len(ok)
+            self.last_error = None
+            if len(ops) < self.batch_size or not answered:
+                break
+        return applied
+
+    def run(self):
+        delay = self.interval
+        while not self._stopping.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.flush()
+                delay = self.interval
+            except Exception:
+                delay = min(max(delay * 2, self.interval), self.max_backoff)
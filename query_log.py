@@ -0,0 +1,206 @@
+"""
+Per-session log of the HTTP calls the app makes to PostgREST.
+
+db() sends every query through a LoggingTransport, which times each request
+and records the table (or RPC), operation, duration, rows and bytes into the
+session's QueryLog. Calls are grouped by script rerun so the Settings page can
+show how many queries a page made and which ones were slow; the same table
+and operation showing up many times in one rerun is the N+1 signature.
+Calls made off the script thread (the sync worker) are tagged as background
+and never count towards it.
+
+When an OpenTelemetry tracer is given, each call is also exported as a span.
+This module has no Streamlit imports; the log is shared with the background
+sync thread, so it is guarded by a lock.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+
+# Same table/op this many times in one rerun is flagged as a likely N+1.
+N_PLUS_ONE_THRESHOLD = 5
+
+_OPS = {"GET": "select", "HEAD": "count", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+class Call(NamedTuple):
+    table: str
+    op: str
+    duration_ms: float
+    rows: Optional[int]
+    bytes: int
+    status: int  # 0 when the request never got a response
+    background: bool  # made off the script thread (e.g. the sync worker)
+
+
+def describe(request: httpx.Request) -> Tuple[str, str]:
+    """(table, operation) of a PostgREST request; RPCs are reported as ("rpc:<name>", "rpc")."""
+    path = request.url.path.rstrip("/")
+    name = path.rsplit("/", 1)[-1]
+    if "/rpc/" in path:
+        return f"rpc:{name}", "rpc"
+    op = _OPS.get(request.method, request.method.lower())
+    if op == "insert" and "resolution=" in request.headers.get("prefer", ""):
+        op = "upsert"
+    return name, op
+
+
+def row_count(response: httpx.Response) -> Optional[int]:
+    """Rows returned, from PostgREST's Content-Range header ("0-49/*"); None when absent."""
+    span = response.headers.get("content-range", "").split("/", 1)[0]
+    if "-" in span:
+        first, last = span.split("-", 1)
+        try:
+            return int(last) - int(first) + 1
+        except ValueError:
+            return None
+    return 0 if span == "*" else None
+
+
+class QueryLog:
+    """Calls of the last `keep` reruns of one session, newest last."""
+
+    def __init__(self, keep: int = 20, tracer=None):
+        self._lock = threading.Lock()
+        self._reruns: deque = deque(maxlen=keep)
+        self._script_thread: Optional[int] = None
+        self._tracer = tracer
+        self.begin("startup")
+
+    def begin(self, label: str):
+        """Start a new rerun bucket; calls made from this thread count as foreground."""
+        with self._lock:
+            self._script_thread = threading.get_ident()
+            self._reruns.append({"label": label, "started": time.time(), "calls": []})
+
+    def relabel(self, label: str):
+        with self._lock:
+            self._reruns[-1]["label"] = label
+
+    def record(self, request: httpx.Request, response: Optional[httpx.Response], started: float,
+               nbytes: int = 0):
+        elapsed = time.perf_counter() - started
+        table, op = describe(request)
+        call = Call(
+            table=table,
+            op=op,
+            duration_ms=elapsed * 1000,
+            rows=row_count(response) if response is not None else None,
+            bytes=nbytes,
+            status=response.status_code if response is not None else 0,
+            background=threading.get_ident() != self._script_thread,
+        )
+        with self._lock:
+            self._reruns[-1]["calls"].append(call)
+        if self._tracer is not None:
+            self._export(call, elapsed)
+
+    def reruns(self) -> List[Dict]:
+        """Snapshot of the kept reruns, oldest first: [{"label", "started", "calls"}, ...]."""
+        with self._lock:
+            return [{**r, "calls": list(r["calls"])} for r in self._reruns]
+
+    def _export(self, call: Call, elapsed: float):
+        end_ns = time.time_ns()
+        span = self._tracer.start_span(
+            f"{call.op} {call.table}",
+            start_time=end_ns - int(elapsed * 1e9),
+            attributes={
+                "db.system": "postgresql",
+                "db.operation": call.op,
+                "db.sql.table": call.table,
+                "db.response.rows": call.rows if call.rows is not None else -1,
+                "http.response.status_code": call.status,
+                "http.response.body.size": call.bytes,
+                "app.background": call.background,
+            },
+        )
+        span.end(end_time=end_ns)
+
+
+def summarize(calls: List[Call]) -> List[Dict]:
+    """
+    One row per (table, op): calls, total/max ms, rows, bytes and an N+1 flag
+    (foreground calls only); slowest first.
+    """
+    groups: Dict[Tuple[str, str], Dict] = {}
+    for c in calls:
+        g = groups.setdefault((c.table, c.op), {"table": c.table, "op": c.op, "calls": 0, "background": 0,
+                                                "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "bytes": 0,
+                                                "errors": 0})
+        g["calls"] += 1
+        g["background"] += c.background
+        g["total_ms"] += c.duration_ms
+        g["max_ms"] = max(g["max_ms"], c.duration_ms)
+        g["rows"] += c.rows or 0
+        g["bytes"] += c.bytes
+        g["errors"] += c.status == 0 or c.status >= 400
+    for g in groups.values():
+        g["n_plus_one"] = g["calls"] - g["background"] >= N_PLUS_ONE_THRESHOLD
+    return sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+
+
+class _LoggedStream(httpx.SyncByteStream):
+    """Response body that counts its bytes and reports once when closed."""
+
+    def __init__(self, stream: httpx.SyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._bytes = 0
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+        if self._on_close is not None:
+            self._on_close(self._bytes)
+            self._on_close = None
+
+
+class LoggingTransport(httpx.BaseTransport):
+    """
+    Wraps a (shared) transport and records every request into a QueryLog once
+    its body has been read, so the duration covers the whole download.
+    """
+
+    def __init__(self, inner: httpx.BaseTransport, log: QueryLog):
+        self._inner = inner
+        self._log = log
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = self._inner.handle_request(request)
+        except Exception:
+            self._log.record(request, None, started)
+            raise
+        stream = _LoggedStream(response.stream,
+                               lambda nbytes: self._log.record(request, response, started, nbytes))
+        return httpx.Response(response.status_code, headers=response.headers, stream=stream,
+                              extensions=response.extensions)
+
+    def close(self):
+        """The inner transport is shared between sessions; leave it open."""
+
+
+def otlp_tracer(endpoint: str, service_name: str = "inventory"):
+    """
+    Tracer exporting spans over OTLP/HTTP to `endpoint`, or None when the
+    OpenTelemetry SDK and exporter packages are not installed.
+    """
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+    return provider.get_tracer("query_log")
@@ -0,0 +1,127 @@
+"""
+Demand velocity, days of cover and reorder suggestions for the whole catalogue.
+
+Units sold per product and day arrive from the daily_units RPC as sparse
+columnar triples (product index, day offset, units) and are kept as a dense
+products x days float32 matrix. Velocity, variability and reorder quantities
+for every SKU are then a handful of NumPy reductions over that matrix.
+
+History is refreshed incrementally: after the first load only the days from
+the last one read (which may have been partial) onwards are fetched again and
+written over the matrix in place; it is only reallocated when the window
+rolls over to a new day or products appear.
+
+This module has no Streamlit or Supabase imports.
+"""
+from datetime import date, timedelta
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+PLAN_COLUMNS = ["velocity", "velocity_7d", "days_of_cover", "reorder_point", "order_up_to",
+                "suggested_qty", "reorder"]
+
+
+class DemandHistory:
+    """Units sold per product (rows, `product_ids`) and UTC day (columns, from `start`)."""
+
+    def __init__(self, start: date, product_ids: pd.Index, units: np.ndarray):
+        self.start = start
+        self.product_ids = product_ids
+        self.units = units
+
+    @classmethod
+    def empty(cls, end: date, days: int) -> "DemandHistory":
+        return cls(end - timedelta(days=days - 1), pd.Index([], dtype=object),
+                   np.zeros((0, days), dtype=np.float32))
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.units.shape[1] - 1)
+
+    def merge(self, payload: Dict) -> "DemandHistory":
+        """
+        Apply a daily_units payload ({"since", "today", "product_ids", "p", "d", "u"}):
+        days from `since` on are replaced by the payload, and the window is
+        moved so that it ends on the server's `today`.
+        """
+        since = date.fromisoformat(payload["since"])
+        today = date.fromisoformat(payload["today"])
+        incoming = pd.Index(payload.get("product_ids") or [], dtype=object)
+        days = self.units.shape[1]
+
+        new_ids = incoming.difference(self.product_ids)
+        if today != self.end or len(new_ids):
+            self._reshape(today - timedelta(days=days - 1), self.product_ids.append(new_ids))
+
+        first = max((since - self.start).days, 0)
+        self.units[:, first:] = 0
+        if len(incoming):
+            rows = self.product_ids.get_indexer(incoming)[np.asarray(payload["p"], dtype=np.int64)]
+            cols = np.asarray(payload["d"], dtype=np.int64) + (since - self.start).days
+            keep = (cols >= 0) & (cols < days)
+            self.units[rows[keep], cols[keep]] = np.asarray(payload["u"], dtype=np.float32)[keep]
+        return self
+
+    def _reshape(self, start: date, product_ids: pd.Index):
+        days = self.units.shape[1]
+        units = np.zeros((len(product_ids), days), dtype=np.float32)
+        shift = (self.start - start).days  # < 0 when the window moved forward
+        if -days < shift < days and len(self.product_ids):
+            src, dst = max(-shift, 0), max(shift, 0)
+            width = days - abs(shift)
+            # Existing products keep their row numbers; new ones are appended.
+            units[:len(self.product_ids), dst:dst + width] = self.units[:, src:src + width]
+        self.start, self.product_ids, self.units = start, product_ids, units
+
+
+def reorder_plan(history: DemandHistory,
+                 stock: pd.DataFrame,
+                 window_days: int = 28,
+                 lead_time_days: float = 7,
+                 review_days: float = 7,
+                 service_z: float = 1.65) -> pd.DataFrame:
+    """
+    Per-product reorder figures for `stock` (indexed by product id, with qty
+    and min_stock), computed over the last `window_days` complete days:
+
+      velocity       mean units/day; velocity_7d is the same over 7 days
+      days_of_cover  qty / velocity (inf when nothing sells)
+      reorder_point  velocity * lead time + service_z * sd * sqrt(lead time),
+                     never below the product's min_stock
+      order_up_to    the same over lead time + review period
+      suggested_qty  order_up_to - qty, rounded up, when qty <= reorder_point
+
+    Products without sales history get velocity 0 and fall back to min_stock.
+    """
+    window = history.units[:, -(window_days + 1):-1]  # today is still partial
+    rows = history.product_ids.get_indexer(stock.index)
+    known = rows >= 0
+
+    velocity = np.zeros(len(stock))
+    velocity_7d = np.zeros(len(stock))
+    sd = np.zeros(len(stock))
+    if window.size:
+        velocity[known] = window.mean(axis=1)[rows[known]]
+        velocity_7d[known] = window[:, -7:].mean(axis=1)[rows[known]]
+        sd[known] = window.std(axis=1)[rows[known]]
+
+    qty = stock["qty"].to_numpy(dtype=float)
+    min_stock = stock["min_stock"].fillna(0).to_numpy(dtype=float)
+    safety = service_z * sd * np.sqrt(lead_time_days)
+    reorder_point = np.maximum(velocity * lead_time_days + safety, min_stock)
+    order_up_to = np.maximum(velocity * (lead_time_days + review_days) + safety, min_stock)
+    reorder = (qty <= reorder_point) & (order_up_to > 0)
+    suggested = np.where(reorder, np.ceil(np.maximum(order_up_to - qty, 0)), 0)
+    days_of_cover = np.divide(np.maximum(qty, 0), velocity, out=np.full(len(stock), np.inf), where=velocity > 0)
+
+    return pd.DataFrame({
+        "velocity": velocity,
+        "velocity_7d": velocity_7d,
+        "days_of_cover": days_of_cover,
+        "reorder_point": reorder_point,
+        "order_up_to": order_up_to,
+        "suggested_qty": suggested,
+        "reorder": reorder,
+    }, index=stock.index)[PLAN_COLUMNS]
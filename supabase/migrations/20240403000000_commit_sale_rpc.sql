@@ -0,0 +1,57 @@
+-- Commit a whole sale (header, line items and stock decrements) in a single
+-- transaction. Stock is decremented in place (qty = qty - x) so two tills
+-- selling the same SKU at once can no longer overwrite each other.
+--
+-- p_lines is a JSON array of {"product_id", "qty", "unit_price"} objects.
+CREATE OR REPLACE FUNCTION public.commit_sale(
+  p_org_id uuid,
+  p_lines jsonb,
+  p_ref text DEFAULT NULL
+)
+RETURNS public.sales
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_sale public.sales;
+BEGIN
+  IF p_lines IS NULL OR jsonb_typeof(p_lines) <> 'array' OR jsonb_array_length(p_lines) = 0 THEN
+    RAISE EXCEPTION 'commit_sale: at least one line is required';
+  END IF;
+
+  IF EXISTS (
+    SELECT 1
+    FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric)
+    LEFT JOIN public.products p ON p.id = l.product_id AND p.org_id = p_org_id
+    WHERE p.id IS NULL OR l.qty IS NULL OR l.qty <= 0 OR l.unit_price IS NULL OR l.unit_price < 0
+  ) THEN
+    RAISE EXCEPTION 'commit_sale: every line needs a product of this org, qty > 0 and unit_price >= 0';
+  END IF;
+
+  INSERT INTO public.sales (org_id, ref, total)
+  SELECT p_org_id, NULLIF(p_ref, ''), SUM(l.qty * l.unit_price)
+  FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric)
+  RETURNING * INTO v_sale;
+
+  INSERT INTO public.sale_items (sale_id, product_id, qty, unit_price)
+  SELECT v_sale.id, l.product_id, l.qty, l.unit_price
+  FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric);
+
+  -- One row per product, locked in a stable order to avoid deadlocks between
+  -- concurrent multi-line sales.
+  INSERT INTO public.stock (product_id, qty, updated_at)
+  SELECT l.product_id, -SUM(l.qty), now()
+  FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric)
+  GROUP BY l.product_id
+  ORDER BY l.product_id
+  ON CONFLICT (product_id) DO UPDATE
+    SET qty = public.stock.qty + EXCLUDED.qty,
+        updated_at = EXCLUDED.updated_at;
+
+  RETURN v_sale;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.commit_sale(uuid, jsonb, text) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.commit_sale(uuid, jsonb, text) TO authenticated;
@@ -0,0 +1,136 @@
+-- Append-only ledger of stock movements plus RPCs that apply a movement and
+-- its stock delta atomically. Receipts and adjustments previously did a
+-- read-modify-write on stock.qty from the client and lost concurrent writes.
+CREATE TABLE IF NOT EXISTS public.stock_movements (
+  id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  org_id uuid NOT NULL REFERENCES public.orgs(id) ON DELETE CASCADE,
+  product_id uuid REFERENCES public.products(id) ON DELETE SET NULL,
+  kind text NOT NULL CHECK (kind IN ('receive', 'adjust')),
+  qty_delta numeric NOT NULL,
+  qty_after numeric NOT NULL,
+  unit_cost numeric,
+  note text,
+  created_by uuid DEFAULT auth.uid(),
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS stock_movements_org_product_created_idx
+  ON public.stock_movements (org_id, product_id, created_at DESC);
+
+ALTER TABLE public.stock_movements ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Select stock_movements of own org" ON public.stock_movements;
+CREATE POLICY "Select stock_movements of own org" ON public.stock_movements
+  FOR SELECT
+  TO authenticated
+  USING (org_id IN (SELECT org_id FROM public.org_members WHERE user_id = auth.uid()));
+
+DROP POLICY IF EXISTS "Insert stock_movements of own org" ON public.stock_movements;
+CREATE POLICY "Insert stock_movements of own org" ON public.stock_movements
+  FOR INSERT
+  TO authenticated
+  WITH CHECK (org_id IN (SELECT org_id FROM public.org_members WHERE user_id = auth.uid()));
+
+-- The ledger is append-only: no update/delete policies and no grants.
+REVOKE UPDATE, DELETE, TRUNCATE ON public.stock_movements FROM anon, authenticated;
+
+-- Receive p_qty units at p_unit_cost. Increments stock in place, keeps
+-- products.unit_cost as a weighted average of what is on hand and what was
+-- received, and records a 'receive' movement.
+CREATE OR REPLACE FUNCTION public.receive_stock(
+  p_org_id uuid,
+  p_product_id uuid,
+  p_qty numeric,
+  p_unit_cost numeric
+)
+RETURNS public.stock
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_old_cost numeric;
+  v_old_qty numeric;
+  v_stock public.stock;
+BEGIN
+  IF p_qty IS NULL OR p_qty <= 0 THEN
+    RAISE EXCEPTION 'receive_stock: qty must be > 0';
+  END IF;
+
+  -- Lock the product so concurrent receipts average against each other.
+  SELECT unit_cost INTO v_old_cost
+  FROM public.products
+  WHERE id = p_product_id AND org_id = p_org_id
+  FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'receive_stock: product % not found in org %', p_product_id, p_org_id;
+  END IF;
+
+  INSERT INTO public.stock (product_id, qty, updated_at)
+  VALUES (p_product_id, p_qty, now())
+  ON CONFLICT (product_id) DO UPDATE
+    SET qty = public.stock.qty + EXCLUDED.qty,
+        updated_at = EXCLUDED.updated_at
+  RETURNING * INTO v_stock;
+
+  -- Oversold (negative) stock carries no cost into the average.
+  v_old_qty := GREATEST(v_stock.qty - p_qty, 0);
+  UPDATE public.products
+  SET unit_cost = (v_old_qty * COALESCE(v_old_cost, 0)
+                   + p_qty * COALESCE(p_unit_cost, v_old_cost, 0)) / (v_old_qty + p_qty),
+      updated_at = now()
+  WHERE id = p_product_id;
+
+  INSERT INTO public.stock_movements (org_id, product_id, kind, qty_delta, qty_after, unit_cost)
+  VALUES (p_org_id, p_product_id, 'receive', p_qty, v_stock.qty, p_unit_cost);
+
+  RETURN v_stock;
+END;
+$$;
+
+-- Set the counted quantity for a product and record the difference as an
+-- 'adjust' movement.
+CREATE OR REPLACE FUNCTION public.adjust_stock(
+  p_org_id uuid,
+  p_product_id uuid,
+  p_new_qty numeric,
+  p_note text DEFAULT NULL
+)
+RETURNS public.stock
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_old_qty numeric;
+  v_stock public.stock;
+BEGIN
+  IF p_new_qty IS NULL OR p_new_qty < 0 THEN
+    RAISE EXCEPTION 'adjust_stock: new qty must be >= 0';
+  END IF;
+
+  PERFORM 1 FROM public.products WHERE id = p_product_id AND org_id = p_org_id;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'adjust_stock: product % not found in org %', p_product_id, p_org_id;
+  END IF;
+
+  SELECT qty INTO v_old_qty FROM public.stock WHERE product_id = p_product_id FOR UPDATE;
+
+  INSERT INTO public.stock (product_id, qty, updated_at)
+  VALUES (p_product_id, p_new_qty, now())
+  ON CONFLICT (product_id) DO UPDATE
+    SET qty = EXCLUDED.qty,
+        updated_at = EXCLUDED.updated_at
+  RETURNING * INTO v_stock;
+
+  INSERT INTO public.stock_movements (org_id, product_id, kind, qty_delta, qty_after, note)
+  VALUES (p_org_id, p_product_id, 'adjust', p_new_qty - COALESCE(v_old_qty, 0), p_new_qty, NULLIF(p_note, ''));
+
+  RETURN v_stock;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.receive_stock(uuid, uuid, numeric, numeric) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.receive_stock(uuid, uuid, numeric, numeric) TO authenticated;
+REVOKE ALL ON FUNCTION public.adjust_stock(uuid, uuid, numeric, text) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.adjust_stock(uuid, uuid, numeric, text) TO authenticated;
@@ -0,0 +1,22 @@
+-- Products joined to their stock row, so the app can read on-hand quantities
+-- in one query instead of sending every product id back in an IN (...) filter.
+-- security_invoker keeps the RLS policies of products/stock in force.
+CREATE OR REPLACE VIEW public.stock_view
+WITH (security_invoker = true) AS
+SELECT
+  p.id,
+  p.org_id,
+  p.sku,
+  p.name,
+  p.unit,
+  COALESCE(s.qty, 0) AS qty,
+  p.min_stock,
+  p.category,
+  COALESCE(COALESCE(s.qty, 0) < p.min_stock, false) AS low_stock
+FROM public.products p
+LEFT JOIN public.stock s ON s.product_id = p.id;
+
+GRANT SELECT ON public.stock_view TO authenticated;
+
+CREATE INDEX IF NOT EXISTS products_org_name_idx ON public.products (org_id, name);
+CREATE INDEX IF NOT EXISTS products_org_category_idx ON public.products (org_id, category);
@@ -0,0 +1,10 @@
+-- Indexes that match the keyset pagination order used by the app:
+-- products by (name, id) and sales newest first by (created_at, id).
+CREATE INDEX IF NOT EXISTS products_org_name_id_idx
+  ON public.products (org_id, name, id);
+
+CREATE INDEX IF NOT EXISTS sales_org_created_id_idx
+  ON public.sales (org_id, created_at DESC, id DESC);
+
+-- Superseded by products_org_name_id_idx.
+DROP INDEX IF EXISTS public.products_org_name_idx;
@@ -0,0 +1,66 @@
+-- Everything the dashboard shows, aggregated in the database and returned as
+-- one small JSON document regardless of catalogue size.
+-- Low stock uses the same rule as the app: qty < min_stock (missing stock = 0).
+CREATE OR REPLACE FUNCTION public.dashboard_metrics(
+  p_org_id uuid,
+  p_low_limit integer DEFAULT 50,
+  p_recent_limit integer DEFAULT 10
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+  WITH stock_totals AS (
+    SELECT
+      count(*) AS item_count,
+      COALESCE(sum(qty), 0) AS total_qty,
+      count(*) FILTER (WHERE low_stock) AS low_stock_count
+    FROM public.stock_view
+    WHERE org_id = p_org_id
+  ),
+  sales_totals AS (
+    SELECT
+      COALESCE(sum(total) FILTER (WHERE created_at >= date_trunc('day', now())), 0) AS sales_today,
+      count(*) FILTER (WHERE created_at >= date_trunc('day', now())) AS sales_today_count,
+      COALESCE(sum(total), 0) AS sales_week,
+      count(*) AS sales_week_count
+    FROM public.sales
+    WHERE org_id = p_org_id
+      AND created_at >= date_trunc('week', now())
+  )
+  SELECT jsonb_build_object(
+    'item_count', st.item_count,
+    'total_qty', st.total_qty,
+    'low_stock_count', st.low_stock_count,
+    'sales_today', sa.sales_today,
+    'sales_today_count', sa.sales_today_count,
+    'sales_week', sa.sales_week,
+    'sales_week_count', sa.sales_week_count,
+    'low_stock', COALESCE((
+      SELECT jsonb_agg(l ORDER BY l.name)
+      FROM (
+        SELECT sku, name, qty, min_stock, category
+        FROM public.stock_view
+        WHERE org_id = p_org_id AND low_stock
+        ORDER BY name
+        LIMIT p_low_limit
+      ) l
+    ), '[]'::jsonb),
+    'recent_sales', COALESCE((
+      SELECT jsonb_agg(r ORDER BY r.created_at DESC, r.id DESC)
+      FROM (
+        SELECT id, created_at, ref, total
+        FROM public.sales
+        WHERE org_id = p_org_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT p_recent_limit
+      ) r
+    ), '[]'::jsonb)
+  )
+  FROM stock_totals st, sales_totals sa;
+$$;
+
+REVOKE ALL ON FUNCTION public.dashboard_metrics(uuid, integer, integer) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.dashboard_metrics(uuid, integer, integer) TO authenticated;
@@ -0,0 +1,7 @@
+-- Bulk product import upserts on (org_id, sku) and relies on column defaults
+-- for timestamps, so batched payloads do not have to carry them.
+CREATE UNIQUE INDEX IF NOT EXISTS products_org_sku_key
+  ON public.products (org_id, sku);
+
+ALTER TABLE public.products ALTER COLUMN created_at SET DEFAULT now();
+ALTER TABLE public.products ALTER COLUMN updated_at SET DEFAULT now();
@@ -0,0 +1,62 @@
+-- Type-ahead product search. A trigram index over sku/name/category serves
+-- substring matches without scanning the catalogue; prefix matches rank first.
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA extensions;
+
+CREATE INDEX IF NOT EXISTS products_search_trgm_idx
+  ON public.products
+  USING gin ((lower(coalesce(sku, '') || ' ' || coalesce(name, '') || ' ' || coalesce(category, ''))) extensions.gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION public.search_products(
+  p_org_id uuid,
+  p_query text DEFAULT '',
+  p_limit integer DEFAULT 20
+)
+RETURNS TABLE (
+  id uuid,
+  sku text,
+  name text,
+  category text,
+  unit text,
+  unit_cost numeric,
+  price numeric,
+  min_stock numeric,
+  qty numeric
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public, extensions
+AS $$
+  WITH q AS (
+    -- Escape LIKE wildcards so user input is matched literally.
+    SELECT
+      lower(trim(coalesce(p_query, ''))) AS raw,
+      replace(replace(replace(lower(trim(coalesce(p_query, ''))), '\', '\\'), '%', '\%'), '_', '\_') AS pat
+  )
+  SELECT
+    p.id,
+    p.sku::text,
+    p.name::text,
+    p.category::text,
+    p.unit::text,
+    p.unit_cost::numeric,
+    p.price::numeric,
+    p.min_stock::numeric,
+    COALESCE(s.qty, 0)::numeric
+  FROM public.products p
+  LEFT JOIN public.stock s ON s.product_id = p.id
+  CROSS JOIN q
+  WHERE p.org_id = p_org_id
+    AND (q.raw = ''
+         OR lower(coalesce(p.sku, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.category, ''))
+            LIKE '%' || q.pat || '%')
+  ORDER BY
+    (lower(p.sku) LIKE q.pat || '%' OR lower(p.name) LIKE q.pat || '%') DESC,
+    similarity(lower(p.sku || ' ' || p.name), q.raw) DESC,
+    p.name,
+    p.id
+  LIMIT LEAST(GREATEST(coalesce(p_limit, 20), 1), 100);
+$$;
+
+REVOKE ALL ON FUNCTION public.search_products(uuid, text, integer) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.search_products(uuid, text, integer) TO authenticated;
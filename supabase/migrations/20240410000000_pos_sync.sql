@@ -0,0 +1,179 @@
+-- Idempotent writes for the offline point-of-sale queue. Every queued sale or
+-- receipt carries a client-generated key; applying the same key twice is a
+-- no-op, so the client can retry a batch after any network failure.
+ALTER TABLE public.sales ADD COLUMN IF NOT EXISTS client_key uuid;
+CREATE UNIQUE INDEX IF NOT EXISTS sales_client_key_key ON public.sales (client_key);
+
+ALTER TABLE public.stock_movements ADD COLUMN IF NOT EXISTS client_key uuid;
+CREATE UNIQUE INDEX IF NOT EXISTS stock_movements_client_key_key ON public.stock_movements (client_key);
+
+-- commit_sale gains an optional idempotency key.
+DROP FUNCTION IF EXISTS public.commit_sale(uuid, jsonb, text);
+CREATE OR REPLACE FUNCTION public.commit_sale(
+  p_org_id uuid,
+  p_lines jsonb,
+  p_ref text DEFAULT NULL,
+  p_client_key uuid DEFAULT NULL
+)
+RETURNS public.sales
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_sale public.sales;
+BEGIN
+  IF p_client_key IS NOT NULL THEN
+    -- Serialise retries of the same key, then return the earlier result.
+    PERFORM pg_advisory_xact_lock(hashtextextended(p_client_key::text, 0));
+    SELECT * INTO v_sale FROM public.sales WHERE client_key = p_client_key;
+    IF FOUND THEN
+      RETURN v_sale;
+    END IF;
+  END IF;
+
+  IF p_lines IS NULL OR jsonb_typeof(p_lines) <> 'array' OR jsonb_array_length(p_lines) = 0 THEN
+    RAISE EXCEPTION 'commit_sale: at least one line is required';
+  END IF;
+
+  IF EXISTS (
+    SELECT 1
+    FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric)
+    LEFT JOIN public.products p ON p.id = l.product_id AND p.org_id = p_org_id
+    WHERE p.id IS NULL OR l.qty IS NULL OR l.qty <= 0 OR l.unit_price IS NULL OR l.unit_price < 0
+  ) THEN
+    RAISE EXCEPTION 'commit_sale: every line needs a product of this org, qty > 0 and unit_price >= 0';
+  END IF;
+
+  INSERT INTO public.sales (org_id, ref, total, client_key)
+  SELECT p_org_id, NULLIF(p_ref, ''), SUM(l.qty * l.unit_price), p_client_key
+  FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric)
+  RETURNING * INTO v_sale;
+
+  INSERT INTO public.sale_items (sale_id, product_id, qty, unit_price)
+  SELECT v_sale.id, l.product_id, l.qty, l.unit_price
+  FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric);
+
+  INSERT INTO public.stock (product_id, qty, updated_at)
+  SELECT l.product_id, -SUM(l.qty), now()
+  FROM jsonb_to_recordset(p_lines) AS l(product_id uuid, qty numeric, unit_price numeric)
+  GROUP BY l.product_id
+  ORDER BY l.product_id
+  ON CONFLICT (product_id) DO UPDATE
+    SET qty = public.stock.qty + EXCLUDED.qty,
+        updated_at = EXCLUDED.updated_at;
+
+  RETURN v_sale;
+END;
+$$;
+
+-- receive_stock gains an optional idempotency key.
+DROP FUNCTION IF EXISTS public.receive_stock(uuid, uuid, numeric, numeric);
+CREATE OR REPLACE FUNCTION public.receive_stock(
+  p_org_id uuid,
+  p_product_id uuid,
+  p_qty numeric,
+  p_unit_cost numeric,
+  p_client_key uuid DEFAULT NULL
+)
+RETURNS public.stock
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_old_cost numeric;
+  v_old_qty numeric;
+  v_stock public.stock;
+BEGIN
+  IF p_client_key IS NOT NULL THEN
+    PERFORM pg_advisory_xact_lock(hashtextextended(p_client_key::text, 0));
+    IF EXISTS (SELECT 1 FROM public.stock_movements WHERE client_key = p_client_key) THEN
+      SELECT * INTO v_stock FROM public.stock WHERE product_id = p_product_id;
+      RETURN v_stock;
+    END IF;
+  END IF;
+
+  IF p_qty IS NULL OR p_qty <= 0 THEN
+    RAISE EXCEPTION 'receive_stock: qty must be > 0';
+  END IF;
+
+  SELECT unit_cost INTO v_old_cost
+  FROM public.products
+  WHERE id = p_product_id AND org_id = p_org_id
+  FOR UPDATE;
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'receive_stock: product % not found in org %', p_product_id, p_org_id;
+  END IF;
+
+  INSERT INTO public.stock (product_id, qty, updated_at)
+  VALUES (p_product_id, p_qty, now())
+  ON CONFLICT (product_id) DO UPDATE
+    SET qty = public.stock.qty + EXCLUDED.qty,
+        updated_at = EXCLUDED.updated_at
+  RETURNING * INTO v_stock;
+
+  v_old_qty := GREATEST(v_stock.qty - p_qty, 0);
+  UPDATE public.products
+  SET unit_cost = (v_old_qty * COALESCE(v_old_cost, 0)
+                   + p_qty * COALESCE(p_unit_cost, v_old_cost, 0)) / (v_old_qty + p_qty),
+      updated_at = now()
+  WHERE id = p_product_id;
+
+  INSERT INTO public.stock_movements (org_id, product_id, kind, qty_delta, qty_after, unit_cost, client_key)
+  VALUES (p_org_id, p_product_id, 'receive', p_qty, v_stock.qty, p_unit_cost, p_client_key);
+
+  RETURN v_stock;
+END;
+$$;
+
+-- Apply a batch of queued operations. Each op runs in its own subtransaction:
+-- a rejected op is reported back without undoing the rest of the batch.
+-- p_ops: [{"key": uuid, "kind": "sale"|"receive", "payload": {...}}, ...]
+-- Returns {"applied": [key, ...], "failed": [{"key": ..., "error": ...}, ...]}.
+CREATE OR REPLACE FUNCTION public.sync_pos_ops(p_org_id uuid, p_ops jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_op jsonb;
+  v_applied jsonb := '[]'::jsonb;
+  v_failed jsonb := '[]'::jsonb;
+BEGIN
+  FOR v_op IN SELECT value FROM jsonb_array_elements(COALESCE(p_ops, '[]'::jsonb))
+  LOOP
+    BEGIN
+      CASE v_op->>'kind'
+        WHEN 'sale' THEN
+          PERFORM public.commit_sale(
+            p_org_id,
+            v_op->'payload'->'lines',
+            v_op->'payload'->>'ref',
+            (v_op->>'key')::uuid);
+        WHEN 'receive' THEN
+          PERFORM public.receive_stock(
+            p_org_id,
+            (v_op->'payload'->>'product_id')::uuid,
+            (v_op->'payload'->>'qty')::numeric,
+            (v_op->'payload'->>'unit_cost')::numeric,
+            (v_op->>'key')::uuid);
+        ELSE
+          RAISE EXCEPTION 'sync_pos_ops: unknown kind %', v_op->>'kind';
+      END CASE;
+      v_applied := v_applied || to_jsonb(v_op->>'key');
+    EXCEPTION WHEN OTHERS THEN
+      v_failed := v_failed || jsonb_build_object('key', v_op->>'key', 'error', SQLERRM);
+    END;
+  END LOOP;
+  RETURN jsonb_build_object('applied', v_applied, 'failed', v_failed);
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.commit_sale(uuid, jsonb, text, uuid) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.commit_sale(uuid, jsonb, text, uuid) TO authenticated;
+REVOKE ALL ON FUNCTION public.receive_stock(uuid, uuid, numeric, numeric, uuid) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.receive_stock(uuid, uuid, numeric, numeric, uuid) TO authenticated;
+REVOKE ALL ON FUNCTION public.sync_pos_ops(uuid, jsonb) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.sync_pos_ops(uuid, jsonb) TO authenticated;
@@ -0,0 +1,135 @@
+-- Delta reads for the app's live stock table: instead of refetching the whole
+-- catalogue after every write, the client asks for rows changed since the
+-- server timestamp of its previous read and patches them in.
+
+-- Keep updated_at honest no matter which code path writes the row.
+CREATE OR REPLACE FUNCTION public.touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS products_touch_updated_at ON public.products;
+CREATE TRIGGER products_touch_updated_at
+  BEFORE INSERT OR UPDATE ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.touch_updated_at();
+
+DROP TRIGGER IF EXISTS stock_touch_updated_at ON public.stock;
+CREATE TRIGGER stock_touch_updated_at
+  BEFORE INSERT OR UPDATE ON public.stock
+  FOR EACH ROW EXECUTE FUNCTION public.touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS products_org_updated_idx ON public.products (org_id, updated_at);
+CREATE INDEX IF NOT EXISTS stock_updated_idx ON public.stock (updated_at);
+
+-- Deleted products leave a tombstone so clients can drop them from their copy.
+CREATE TABLE IF NOT EXISTS public.product_tombstones (
+  product_id uuid PRIMARY KEY,
+  org_id uuid NOT NULL REFERENCES public.orgs(id) ON DELETE CASCADE,
+  deleted_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS product_tombstones_org_deleted_idx
+  ON public.product_tombstones (org_id, deleted_at);
+
+ALTER TABLE public.product_tombstones ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Select product_tombstones of own org" ON public.product_tombstones;
+CREATE POLICY "Select product_tombstones of own org" ON public.product_tombstones
+  FOR SELECT
+  TO authenticated
+  USING (org_id IN (SELECT org_id FROM public.org_members WHERE user_id = auth.uid()));
+
+CREATE OR REPLACE FUNCTION public.record_product_tombstone()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO public.product_tombstones (product_id, org_id)
+  VALUES (OLD.id, OLD.org_id)
+  ON CONFLICT (product_id) DO UPDATE SET deleted_at = now();
+  RETURN OLD;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS products_record_tombstone ON public.products;
+CREATE TRIGGER products_record_tombstone
+  AFTER DELETE ON public.products
+  FOR EACH ROW EXECUTE FUNCTION public.record_product_tombstone();
+
+-- stock_view gains the product fields the pages edit and the change stamps.
+CREATE OR REPLACE VIEW public.stock_view
+WITH (security_invoker = true) AS
+SELECT
+  p.id,
+  p.org_id,
+  p.sku,
+  p.name,
+  p.unit,
+  COALESCE(s.qty, 0) AS qty,
+  p.min_stock,
+  p.category,
+  COALESCE(COALESCE(s.qty, 0) < p.min_stock, false) AS low_stock,
+  p.price,
+  p.unit_cost,
+  GREATEST(p.updated_at, s.updated_at) AS updated_at,
+  s.updated_at AS stock_updated_at
+FROM public.products p
+LEFT JOIN public.stock s ON s.product_id = p.id;
+
+-- Rows changed since p_since (all rows when NULL) plus ids deleted since then.
+-- "now" is the timestamp to pass next time; a small overlap covers writes
+-- that committed just after this read started. Re-applying a row is harmless.
+CREATE OR REPLACE FUNCTION public.stock_changes(
+  p_org_id uuid,
+  p_since timestamptz DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_since timestamptz := p_since - interval '5 seconds';
+  v_rows jsonb;
+  v_deleted jsonb := '[]'::jsonb;
+BEGIN
+  IF p_since IS NULL THEN
+    SELECT COALESCE(jsonb_agg(to_jsonb(r)), '[]'::jsonb) INTO v_rows
+    FROM (
+      SELECT id, sku, name, unit, category, min_stock, price, unit_cost, qty, updated_at, stock_updated_at
+      FROM public.stock_view
+      WHERE org_id = p_org_id
+    ) r;
+  ELSE
+    SELECT COALESCE(jsonb_agg(to_jsonb(r)), '[]'::jsonb) INTO v_rows
+    FROM (
+      SELECT v.id, v.sku, v.name, v.unit, v.category, v.min_stock, v.price, v.unit_cost, v.qty,
+             v.updated_at, v.stock_updated_at
+      FROM public.stock_view v
+      WHERE v.org_id = p_org_id
+        AND v.id IN (
+          SELECT id FROM public.products WHERE org_id = p_org_id AND updated_at > v_since
+          UNION
+          SELECT product_id FROM public.stock WHERE updated_at > v_since
+        )
+    ) r;
+
+    SELECT COALESCE(jsonb_agg(product_id), '[]'::jsonb) INTO v_deleted
+    FROM public.product_tombstones
+    WHERE org_id = p_org_id AND deleted_at > v_since;
+  END IF;
+
+  RETURN jsonb_build_object('now', now(), 'rows', v_rows, 'deleted', v_deleted);
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.stock_changes(uuid, timestamptz) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.stock_changes(uuid, timestamptz) TO authenticated;
@@ -0,0 +1,230 @@
+-- Daily sales rollups for the analytics page. Charts over a year read at most
+-- 366 pre-aggregated rows per org instead of every sale_items row.
+--
+--   sales_daily          org_id, day: sale_count, units, revenue, cost
+--   sales_product_daily  org_id, day, product_id: units, revenue, cost
+--
+-- Days are UTC dates of sales.created_at. cost is products.unit_cost at the
+-- time the line was recorded (the weighted average kept by receive_stock), so
+-- margin = revenue - cost does not move when later receipts change the cost.
+-- Rollups are maintained incrementally by statement-level triggers on
+-- sales/sale_items inserts; sales are never updated or deleted by the app.
+CREATE TABLE IF NOT EXISTS public.sales_daily (
+  org_id uuid NOT NULL REFERENCES public.orgs(id) ON DELETE CASCADE,
+  day date NOT NULL,
+  sale_count integer NOT NULL DEFAULT 0,
+  units numeric NOT NULL DEFAULT 0,
+  revenue numeric NOT NULL DEFAULT 0,
+  cost numeric NOT NULL DEFAULT 0,
+  PRIMARY KEY (org_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS public.sales_product_daily (
+  org_id uuid NOT NULL REFERENCES public.orgs(id) ON DELETE CASCADE,
+  day date NOT NULL,
+  product_id uuid NOT NULL,  -- no FK: history outlives deleted products
+  units numeric NOT NULL DEFAULT 0,
+  revenue numeric NOT NULL DEFAULT 0,
+  cost numeric NOT NULL DEFAULT 0,
+  PRIMARY KEY (org_id, day, product_id)
+);
+
+ALTER TABLE public.sales_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.sales_product_daily ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Select sales_daily of own org" ON public.sales_daily;
+CREATE POLICY "Select sales_daily of own org" ON public.sales_daily
+  FOR SELECT
+  TO authenticated
+  USING (org_id IN (SELECT org_id FROM public.org_members WHERE user_id = auth.uid()));
+
+DROP POLICY IF EXISTS "Select sales_product_daily of own org" ON public.sales_product_daily;
+CREATE POLICY "Select sales_product_daily of own org" ON public.sales_product_daily
+  FOR SELECT
+  TO authenticated
+  USING (org_id IN (SELECT org_id FROM public.org_members WHERE user_id = auth.uid()));
+
+-- Only the triggers below write the rollups.
+REVOKE INSERT, UPDATE, DELETE, TRUNCATE ON public.sales_daily FROM anon, authenticated;
+REVOKE INSERT, UPDATE, DELETE, TRUNCATE ON public.sales_product_daily FROM anon, authenticated;
+
+-- One upsert per statement (commit_sale inserts a whole sale in one statement).
+-- SECURITY DEFINER because users cannot write the rollups themselves; the
+-- rows come from the inserted sales, which RLS has already checked.
+CREATE OR REPLACE FUNCTION public.rollup_sales()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO public.sales_daily (org_id, day, sale_count)
+  SELECT s.org_id, (s.created_at AT TIME ZONE 'UTC')::date, count(*)
+  FROM new_sales s
+  GROUP BY 1, 2
+  ORDER BY 1, 2
+  ON CONFLICT (org_id, day) DO UPDATE
+    SET sale_count = public.sales_daily.sale_count + EXCLUDED.sale_count;
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.rollup_sale_items()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  WITH lines AS (
+    SELECT s.org_id,
+           (s.created_at AT TIME ZONE 'UTC')::date AS day,
+           i.product_id,
+           sum(i.qty) AS units,
+           sum(i.qty * i.unit_price) AS revenue,
+           sum(i.qty * COALESCE(p.unit_cost, 0)) AS cost
+    FROM new_items i
+    JOIN public.sales s ON s.id = i.sale_id
+    LEFT JOIN public.products p ON p.id = i.product_id
+    WHERE i.product_id IS NOT NULL
+    GROUP BY 1, 2, 3
+  ),
+  per_product AS (
+    INSERT INTO public.sales_product_daily (org_id, day, product_id, units, revenue, cost)
+    SELECT org_id, day, product_id, units, revenue, cost
+    FROM lines
+    ORDER BY 1, 2, 3
+    ON CONFLICT (org_id, day, product_id) DO UPDATE
+      SET units = public.sales_product_daily.units + EXCLUDED.units,
+          revenue = public.sales_product_daily.revenue + EXCLUDED.revenue,
+          cost = public.sales_product_daily.cost + EXCLUDED.cost
+  )
+  INSERT INTO public.sales_daily (org_id, day, units, revenue, cost)
+  SELECT org_id, day, sum(units), sum(revenue), sum(cost)
+  FROM lines
+  GROUP BY 1, 2
+  ORDER BY 1, 2
+  ON CONFLICT (org_id, day) DO UPDATE
+    SET units = public.sales_daily.units + EXCLUDED.units,
+        revenue = public.sales_daily.revenue + EXCLUDED.revenue,
+        cost = public.sales_daily.cost + EXCLUDED.cost;
+  RETURN NULL;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.rollup_sales() FROM PUBLIC;
+REVOKE ALL ON FUNCTION public.rollup_sale_items() FROM PUBLIC;
+
+DROP TRIGGER IF EXISTS sales_rollup ON public.sales;
+CREATE TRIGGER sales_rollup
+  AFTER INSERT ON public.sales
+  REFERENCING NEW TABLE AS new_sales
+  FOR EACH STATEMENT EXECUTE FUNCTION public.rollup_sales();
+
+DROP TRIGGER IF EXISTS sale_items_rollup ON public.sale_items;
+CREATE TRIGGER sale_items_rollup
+  AFTER INSERT ON public.sale_items
+  REFERENCING NEW TABLE AS new_items
+  FOR EACH STATEMENT EXECUTE FUNCTION public.rollup_sale_items();
+
+-- Backfill from existing history. Historical cost uses today's unit_cost, the
+-- best figure available for sales recorded before this migration.
+TRUNCATE public.sales_daily, public.sales_product_daily;
+
+INSERT INTO public.sales_product_daily (org_id, day, product_id, units, revenue, cost)
+SELECT s.org_id,
+       (s.created_at AT TIME ZONE 'UTC')::date,
+       i.product_id,
+       sum(i.qty),
+       sum(i.qty * i.unit_price),
+       sum(i.qty * COALESCE(p.unit_cost, 0))
+FROM public.sale_items i
+JOIN public.sales s ON s.id = i.sale_id
+LEFT JOIN public.products p ON p.id = i.product_id
+WHERE i.product_id IS NOT NULL
+GROUP BY 1, 2, 3;
+
+INSERT INTO public.sales_daily (org_id, day, sale_count, units, revenue, cost)
+SELECT c.org_id, c.day, c.sale_count,
+       COALESCE(l.units, 0), COALESCE(l.revenue, 0), COALESCE(l.cost, 0)
+FROM (
+  SELECT org_id, (created_at AT TIME ZONE 'UTC')::date AS day, count(*) AS sale_count
+  FROM public.sales
+  GROUP BY 1, 2
+) c
+LEFT JOIN (
+  SELECT org_id, day, sum(units) AS units, sum(revenue) AS revenue, sum(cost) AS cost
+  FROM public.sales_product_daily
+  GROUP BY 1, 2
+) l ON l.org_id = c.org_id AND l.day = c.day;
+
+-- Revenue buckets and top products for [p_from, p_to] (inclusive UTC dates)
+-- as one JSON document: {"buckets": [...], "top": [...]}.
+-- p_grain is 'day', 'week' (ISO, Monday) or 'month'; p_order ranks the top
+-- products by 'revenue', 'margin' or 'units'.
+CREATE OR REPLACE FUNCTION public.sales_analytics(
+  p_org_id uuid,
+  p_from date,
+  p_to date,
+  p_grain text DEFAULT 'day',
+  p_top integer DEFAULT 10,
+  p_order text DEFAULT 'revenue'
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+BEGIN
+  IF p_grain NOT IN ('day', 'week', 'month') THEN
+    RAISE EXCEPTION 'sales_analytics: grain must be day, week or month';
+  END IF;
+  IF p_order NOT IN ('revenue', 'margin', 'units') THEN
+    RAISE EXCEPTION 'sales_analytics: order must be revenue, margin or units';
+  END IF;
+
+  RETURN jsonb_build_object(
+    'buckets', COALESCE((
+      SELECT jsonb_agg(b ORDER BY b.bucket)
+      FROM (
+        SELECT date_trunc(p_grain, day)::date AS bucket,
+               sum(sale_count) AS sale_count,
+               sum(units) AS units,
+               sum(revenue) AS revenue,
+               sum(cost) AS cost,
+               sum(revenue) - sum(cost) AS margin
+        FROM public.sales_daily
+        WHERE org_id = p_org_id AND day BETWEEN p_from AND p_to
+        GROUP BY 1
+      ) b
+    ), '[]'::jsonb),
+    'top', COALESCE((
+      SELECT jsonb_agg(t ORDER BY t.rank)
+      FROM (
+        SELECT row_number() OVER (
+                 ORDER BY CASE p_order
+                            WHEN 'margin' THEN a.revenue - a.cost
+                            WHEN 'units' THEN a.units
+                            ELSE a.revenue
+                          END DESC, a.product_id) AS rank,
+               a.product_id, p.sku, p.name,
+               a.units, a.revenue, a.cost,
+               a.revenue - a.cost AS margin
+        FROM (
+          SELECT product_id, sum(units) AS units, sum(revenue) AS revenue, sum(cost) AS cost
+          FROM public.sales_product_daily
+          WHERE org_id = p_org_id AND day BETWEEN p_from AND p_to
+          GROUP BY product_id
+        ) a
+        LEFT JOIN public.products p ON p.id = a.product_id
+        ORDER BY rank
+        LIMIT p_top
+      ) t
+    ), '[]'::jsonb)
+  );
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.sales_analytics(uuid, date, date, text, integer, text) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.sales_analytics(uuid, date, date, text, integer, text) TO authenticated;
@@ -0,0 +1,94 @@
+-- Bulk stocktake: apply a whole count sheet in one call, with optimistic
+-- concurrency. Each counted row carries the stock.updated_at the client saw
+-- when the count started; rows whose stock changed since then (a sale, a
+-- receipt, another count) are not applied but returned as conflicts to recount.
+ALTER TABLE public.stock_movements DROP CONSTRAINT IF EXISTS stock_movements_kind_check;
+ALTER TABLE public.stock_movements ADD CONSTRAINT stock_movements_kind_check
+  CHECK (kind IN ('receive', 'adjust', 'stocktake'));
+
+-- p_counts: [{"product_id": uuid, "qty": numeric, "expected_updated_at": timestamptz|null}, ...]
+-- (null expected_updated_at = the product had no stock row yet).
+-- Returns {"applied": n, "conflicts": [{"product_id", "qty", "stock_updated_at"}, ...]}.
+CREATE OR REPLACE FUNCTION public.apply_stocktake(
+  p_org_id uuid,
+  p_counts jsonb,
+  p_note text DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_result jsonb;
+BEGIN
+  IF p_counts IS NULL OR jsonb_typeof(p_counts) <> 'array' THEN
+    RAISE EXCEPTION 'apply_stocktake: counts must be a JSON array';
+  END IF;
+
+  IF EXISTS (
+    SELECT 1
+    FROM jsonb_to_recordset(p_counts) AS c(product_id uuid, qty numeric, expected_updated_at timestamptz)
+    LEFT JOIN public.products p ON p.id = c.product_id AND p.org_id = p_org_id
+    WHERE p.id IS NULL OR c.qty IS NULL OR c.qty < 0
+  ) THEN
+    RAISE EXCEPTION 'apply_stocktake: every row needs a product of this org and qty >= 0';
+  END IF;
+
+  IF (SELECT count(*) <> count(DISTINCT product_id)
+      FROM jsonb_to_recordset(p_counts) AS c(product_id uuid)) THEN
+    RAISE EXCEPTION 'apply_stocktake: a product appears more than once';
+  END IF;
+
+  -- Lock in a stable order (products, then stock) so concurrent receipts,
+  -- sales and counts of the same products wait for us instead of deadlocking.
+  PERFORM 1 FROM public.products
+  WHERE id IN (SELECT (value->>'product_id')::uuid FROM jsonb_array_elements(p_counts))
+  ORDER BY id
+  FOR UPDATE;
+  PERFORM 1 FROM public.stock
+  WHERE product_id IN (SELECT (value->>'product_id')::uuid FROM jsonb_array_elements(p_counts))
+  ORDER BY product_id
+  FOR UPDATE;
+
+  WITH counts AS (
+    SELECT c.product_id, c.qty, c.expected_updated_at, s.qty AS old_qty, s.updated_at AS current_updated_at
+    FROM jsonb_to_recordset(p_counts) AS c(product_id uuid, qty numeric, expected_updated_at timestamptz)
+    LEFT JOIN public.stock s ON s.product_id = c.product_id
+  ),
+  ok AS (
+    SELECT * FROM counts WHERE current_updated_at IS NOT DISTINCT FROM expected_updated_at
+  ),
+  written AS (
+    INSERT INTO public.stock (product_id, qty, updated_at)
+    SELECT product_id, qty, now() FROM ok
+    ORDER BY product_id
+    ON CONFLICT (product_id) DO UPDATE
+      SET qty = EXCLUDED.qty,
+          updated_at = EXCLUDED.updated_at
+    RETURNING product_id
+  ),
+  moved AS (
+    INSERT INTO public.stock_movements (org_id, product_id, kind, qty_delta, qty_after, note)
+    SELECT p_org_id, product_id, 'stocktake', qty - COALESCE(old_qty, 0), qty, NULLIF(p_note, '')
+    FROM ok
+    WHERE qty IS DISTINCT FROM COALESCE(old_qty, 0)
+  )
+  SELECT jsonb_build_object(
+    'applied', (SELECT count(*) FROM written),
+    'conflicts', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+               'product_id', product_id,
+               'qty', COALESCE(old_qty, 0),
+               'stock_updated_at', current_updated_at))
+      FROM counts
+      WHERE current_updated_at IS DISTINCT FROM expected_updated_at
+    ), '[]'::jsonb)
+  ) INTO v_result;
+
+  RETURN v_result;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.apply_stocktake(uuid, jsonb, text) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.apply_stocktake(uuid, jsonb, text) TO authenticated;
@@ -0,0 +1,41 @@
+-- Units sold per product and UTC day since p_since, read from the
+-- sales_product_daily rollup, for the reorder engine. Only non-zero days are
+-- returned, as columnar arrays so a year of history for a large catalogue
+-- stays compact:
+--   {"since": date, "today": date, "product_ids": [uuid, ...],
+--    "p": [index into product_ids, ...], "d": [days since p_since, ...], "u": [units, ...]}
+CREATE OR REPLACE FUNCTION public.daily_units(p_org_id uuid, p_since date)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+  WITH r AS (
+    SELECT product_id, day, units
+    FROM public.sales_product_daily
+    WHERE org_id = p_org_id AND day >= p_since AND units <> 0
+  ),
+  ids AS (
+    SELECT product_id, row_number() OVER (ORDER BY product_id) - 1 AS idx
+    FROM (SELECT DISTINCT product_id FROM r) d
+  ),
+  cols AS (
+    SELECT jsonb_agg(i.idx ORDER BY r.product_id, r.day) AS p,
+           jsonb_agg(r.day - p_since ORDER BY r.product_id, r.day) AS d,
+           jsonb_agg(r.units ORDER BY r.product_id, r.day) AS u
+    FROM r JOIN ids i USING (product_id)
+  )
+  SELECT jsonb_build_object(
+    'since', p_since,
+    'today', (now() AT TIME ZONE 'UTC')::date,
+    'product_ids', COALESCE((SELECT jsonb_agg(product_id ORDER BY idx) FROM ids), '[]'::jsonb),
+    'p', COALESCE(cols.p, '[]'::jsonb),
+    'd', COALESCE(cols.d, '[]'::jsonb),
+    'u', COALESCE(cols.u, '[]'::jsonb)
+  )
+  FROM cols;
+$$;
+
+REVOKE ALL ON FUNCTION public.daily_units(uuid, date) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.daily_units(uuid, date) TO authenticated;
@@ -0,0 +1,71 @@
+-- Bulk product import that only writes what the sheet gives. A plain upsert on
+-- (org_id, sku) overwrote existing products with defaults for every column the
+-- sheet left out or blank (cost, price and min_stock reset to 0, the weighted
+-- average unit_cost kept by receive_stock lost).
+--
+-- p_rows: [{"sku", "name", "category", "unit", "unit_cost", "price", "min_stock"}, ...]
+-- with null for missing or blank cells. Existing products keep their current
+-- value where a cell is null; new products get unit 'pcs' and 0 for numbers,
+-- plus a stock row with qty 0. Returns {"inserted": n, "updated": n}.
+CREATE OR REPLACE FUNCTION public.import_products(
+  p_org_id uuid,
+  p_rows jsonb
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_result jsonb;
+BEGIN
+  IF p_rows IS NULL OR jsonb_typeof(p_rows) <> 'array' THEN
+    RAISE EXCEPTION 'import_products: rows must be a JSON array';
+  END IF;
+
+  WITH src AS (
+    SELECT DISTINCT ON (r.sku) r.*
+    FROM jsonb_to_recordset(p_rows) AS r(
+      sku text, name text, category text, unit text,
+      unit_cost numeric, price numeric, min_stock numeric)
+    WHERE r.sku IS NOT NULL
+  ),
+  updated AS (
+    UPDATE public.products p
+    SET name = COALESCE(src.name, p.name),
+        category = COALESCE(src.category, p.category),
+        unit = COALESCE(src.unit, p.unit),
+        unit_cost = COALESCE(src.unit_cost, p.unit_cost),
+        price = COALESCE(src.price, p.price),
+        min_stock = COALESCE(src.min_stock, p.min_stock),
+        updated_at = now()
+    FROM src
+    WHERE p.org_id = p_org_id AND p.sku = src.sku
+    RETURNING p.id
+  ),
+  inserted AS (
+    INSERT INTO public.products (org_id, sku, name, category, unit, unit_cost, price, min_stock)
+    SELECT p_org_id, src.sku, src.name, src.category, COALESCE(src.unit, 'pcs'),
+           COALESCE(src.unit_cost, 0), COALESCE(src.price, 0), COALESCE(src.min_stock, 0)
+    FROM src
+    WHERE NOT EXISTS (SELECT 1 FROM public.products p WHERE p.org_id = p_org_id AND p.sku = src.sku)
+    ORDER BY src.sku
+    ON CONFLICT (org_id, sku) DO NOTHING
+    RETURNING id
+  ),
+  seeded AS (
+    INSERT INTO public.stock (product_id, qty)
+    SELECT id, 0 FROM inserted
+    ON CONFLICT (product_id) DO NOTHING
+  )
+  SELECT jsonb_build_object(
+    'inserted', (SELECT count(*) FROM inserted),
+    'updated', (SELECT count(*) FROM updated)
+  ) INTO v_result;
+
+  RETURN v_result;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.import_products(uuid, jsonb) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.import_products(uuid, jsonb) TO authenticated;
@@ -0,0 +1,80 @@
+-- Pickers first render with an empty query. search_products used to match
+-- the whole org for it and rank every row by similarity() before the LIMIT,
+-- a full scan and sort of the catalogue on each Receive/Sell/Adjust render.
+-- An empty query now returns the first products by (name, id), which
+-- products_org_name_id_idx serves without touching the rest of the org.
+CREATE OR REPLACE FUNCTION public.search_products(
+  p_org_id uuid,
+  p_query text DEFAULT '',
+  p_limit integer DEFAULT 20
+)
+RETURNS TABLE (
+  id uuid,
+  sku text,
+  name text,
+  category text,
+  unit text,
+  unit_cost numeric,
+  price numeric,
+  min_stock numeric,
+  qty numeric
+)
+LANGUAGE plpgsql
+STABLE
+SECURITY INVOKER
+SET search_path = public, extensions
+AS $$
+#variable_conflict use_column
+DECLARE
+  v_raw text := lower(trim(coalesce(p_query, '')));
+  -- Escape LIKE wildcards so user input is matched literally.
+  v_pat text := replace(replace(replace(lower(trim(coalesce(p_query, ''))), '\', '\\'), '%', '\%'), '_', '\_');
+  v_limit integer := LEAST(GREATEST(coalesce(p_limit, 20), 1), 100);
+BEGIN
+  IF v_raw = '' THEN
+    RETURN QUERY
+    SELECT
+      p.id,
+      p.sku::text,
+      p.name::text,
+      p.category::text,
+      p.unit::text,
+      p.unit_cost::numeric,
+      p.price::numeric,
+      p.min_stock::numeric,
+      COALESCE(s.qty, 0)::numeric
+    FROM public.products p
+    LEFT JOIN public.stock s ON s.product_id = p.id
+    WHERE p.org_id = p_org_id
+    ORDER BY p.name, p.id
+    LIMIT v_limit;
+    RETURN;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    p.id,
+    p.sku::text,
+    p.name::text,
+    p.category::text,
+    p.unit::text,
+    p.unit_cost::numeric,
+    p.price::numeric,
+    p.min_stock::numeric,
+    COALESCE(s.qty, 0)::numeric
+  FROM public.products p
+  LEFT JOIN public.stock s ON s.product_id = p.id
+  WHERE p.org_id = p_org_id
+    AND lower(coalesce(p.sku, '') || ' ' || coalesce(p.name, '') || ' ' || coalesce(p.category, ''))
+        LIKE '%' || v_pat || '%'
+  ORDER BY
+    (lower(p.sku) LIKE v_pat || '%' OR lower(p.name) LIKE v_pat || '%') DESC,
+    similarity(lower(p.sku || ' ' || p.name), v_raw) DESC,
+    p.name,
+    p.id
+  LIMIT v_limit;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.search_products(uuid, text, integer) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.search_products(uuid, text, integer) TO authenticated;
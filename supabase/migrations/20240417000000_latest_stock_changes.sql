@@ -0,0 +1,114 @@
+-- The dashboard's "Latest stock changes" panel only shows the most recently
+-- changed rows, but loaded them by pulling the whole catalogue through
+-- stock_changes(p_since => NULL). latest_stock_changes returns just those
+-- rows, and dashboard_metrics includes them so the dashboard stays one small
+-- call; the panel polls latest_stock_changes while it is open.
+
+-- Newest first by stock_view.updated_at = GREATEST(products.updated_at,
+-- stock.updated_at). The top n by that are always among the top n products
+-- by their own updated_at plus the top n stock rows by theirs, so both sides
+-- are read newest-first from their indexes and cut at n before joining.
+CREATE OR REPLACE FUNCTION public.latest_stock_changes(
+  p_org_id uuid,
+  p_limit integer DEFAULT 20
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+  SELECT COALESCE(jsonb_agg(r ORDER BY r.updated_at DESC, r.id), '[]'::jsonb)
+  FROM (
+    SELECT v.id, v.sku, v.name, v.unit, v.qty, v.updated_at
+    FROM public.stock_view v
+    WHERE v.org_id = p_org_id
+      AND v.id IN (
+        (SELECT p.id
+         FROM public.products p
+         WHERE p.org_id = p_org_id
+         ORDER BY p.updated_at DESC NULLS LAST
+         LIMIT p_limit)
+        UNION
+        (SELECT s.product_id
+         FROM public.stock s
+         JOIN public.products p ON p.id = s.product_id
+         WHERE p.org_id = p_org_id
+         ORDER BY s.updated_at DESC NULLS LAST
+         LIMIT p_limit)
+      )
+    ORDER BY v.updated_at DESC NULLS LAST, v.id
+    LIMIT p_limit
+  ) r;
+$$;
+
+REVOKE ALL ON FUNCTION public.latest_stock_changes(uuid, integer) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.latest_stock_changes(uuid, integer) TO authenticated;
+
+-- dashboard_metrics gains 'recent_stock'.
+DROP FUNCTION IF EXISTS public.dashboard_metrics(uuid, integer, integer);
+CREATE OR REPLACE FUNCTION public.dashboard_metrics(
+  p_org_id uuid,
+  p_low_limit integer DEFAULT 50,
+  p_recent_limit integer DEFAULT 10,
+  p_changes_limit integer DEFAULT 20
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+  WITH stock_totals AS (
+    SELECT
+      count(*) AS item_count,
+      COALESCE(sum(qty), 0) AS total_qty,
+      count(*) FILTER (WHERE low_stock) AS low_stock_count
+    FROM public.stock_view
+    WHERE org_id = p_org_id
+  ),
+  sales_totals AS (
+    SELECT
+      COALESCE(sum(total) FILTER (WHERE created_at >= date_trunc('day', now())), 0) AS sales_today,
+      count(*) FILTER (WHERE created_at >= date_trunc('day', now())) AS sales_today_count,
+      COALESCE(sum(total), 0) AS sales_week,
+      count(*) AS sales_week_count
+    FROM public.sales
+    WHERE org_id = p_org_id
+      AND created_at >= date_trunc('week', now())
+  )
+  SELECT jsonb_build_object(
+    'item_count', st.item_count,
+    'total_qty', st.total_qty,
+    'low_stock_count', st.low_stock_count,
+    'sales_today', sa.sales_today,
+    'sales_today_count', sa.sales_today_count,
+    'sales_week', sa.sales_week,
+    'sales_week_count', sa.sales_week_count,
+    'low_stock', COALESCE((
+      SELECT jsonb_agg(l ORDER BY l.name)
+      FROM (
+        SELECT sku, name, qty, min_stock, category
+        FROM public.stock_view
+        WHERE org_id = p_org_id AND low_stock
+        ORDER BY name
+        LIMIT p_low_limit
+      ) l
+    ), '[]'::jsonb),
+    'recent_sales', COALESCE((
+      SELECT jsonb_agg(r ORDER BY r.created_at DESC, r.id DESC)
+      FROM (
+        SELECT id, created_at, ref, total
+        FROM public.sales
+        WHERE org_id = p_org_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT p_recent_limit
+      ) r
+    ), '[]'::jsonb),
+    'recent_stock', public.latest_stock_changes(p_org_id, p_changes_limit)
+  )
+  FROM stock_totals st, sales_totals sa;
+$$;
+
+REVOKE ALL ON FUNCTION public.dashboard_metrics(uuid, integer, integer, integer) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.dashboard_metrics(uuid, integer, integer, integer) TO authenticated;
@@ -0,0 +1,46 @@
+-- latest_stock_changes ordered by updated_at DESC NULLS LAST, which an
+-- ascending index scanned backwards cannot return (that order is DESC NULLS
+-- FIRST), so Postgres sorted every product of the org and every stock row.
+-- updated_at is always set by the touch triggers; make that a constraint and
+-- order by plain DESC, which products_org_updated_idx (org_id, updated_at)
+-- and stock_updated_idx (updated_at) serve newest-first, stopping after n rows.
+UPDATE public.products SET updated_at = now() WHERE updated_at IS NULL;
+ALTER TABLE public.products ALTER COLUMN updated_at SET NOT NULL;
+
+UPDATE public.stock SET updated_at = now() WHERE updated_at IS NULL;
+ALTER TABLE public.stock ALTER COLUMN updated_at SET DEFAULT now();
+ALTER TABLE public.stock ALTER COLUMN updated_at SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.latest_stock_changes(
+  p_org_id uuid,
+  p_limit integer DEFAULT 20
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+  SELECT COALESCE(jsonb_agg(r ORDER BY r.updated_at DESC, r.id), '[]'::jsonb)
+  FROM (
+    SELECT v.id, v.sku, v.name, v.unit, v.qty, v.updated_at
+    FROM public.stock_view v
+    WHERE v.org_id = p_org_id
+      AND v.id IN (
+        (SELECT p.id
+         FROM public.products p
+         WHERE p.org_id = p_org_id
+         ORDER BY p.updated_at DESC
+         LIMIT p_limit)
+        UNION
+        (SELECT s.product_id
+         FROM public.stock s
+         JOIN public.products p ON p.id = s.product_id
+         WHERE p.org_id = p_org_id
+         ORDER BY s.updated_at DESC
+         LIMIT p_limit)
+      )
+    ORDER BY v.updated_at DESC, v.id
+    LIMIT p_limit
+  ) r;
+$$;
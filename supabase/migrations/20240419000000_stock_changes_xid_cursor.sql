@@ -0,0 +1,102 @@
+-- stock_changes handed out now() as the next "since" and re-read 5 seconds
+-- before it. updated_at is the writer's transaction start, so a writer that
+-- ran longer than that (an import, a stocktake chunk, a sync_pos_ops batch)
+-- committed rows already behind the reader's watermark, and clients missed
+-- them until their next full refresh.
+--
+-- Rows now record the id of the transaction that last wrote them, and the
+-- cursor is the xmin of the reading snapshot: every transaction below it had
+-- finished when the read ran, so its rows were either seen or rolled back.
+-- The next read takes change_xid >= cursor, which re-reads the transactions
+-- that were still running (harmless) and can't skip a late commit.
+
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE public.stock ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE public.product_tombstones ADD COLUMN IF NOT EXISTS deleted_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS products_org_change_xid_idx ON public.products (org_id, change_xid);
+CREATE INDEX IF NOT EXISTS stock_change_xid_idx ON public.stock (change_xid);
+CREATE INDEX IF NOT EXISTS product_tombstones_org_deleted_xid_idx
+  ON public.product_tombstones (org_id, deleted_xid);
+
+CREATE OR REPLACE FUNCTION public.touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := now();
+  NEW.change_xid := pg_current_xact_id();
+  RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.record_product_tombstone()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO public.product_tombstones (product_id, org_id)
+  VALUES (OLD.id, OLD.org_id)
+  ON CONFLICT (product_id) DO UPDATE
+    SET deleted_at = now(),
+        deleted_xid = pg_current_xact_id();
+  RETURN OLD;
+END;
+$$;
+
+-- Rows changed since the p_since cursor (all rows when NULL) plus ids
+-- deleted since then. "cursor" is the value to pass next time; treat it as
+-- opaque. STABLE, so the reads and the cursor come from one snapshot.
+DROP FUNCTION IF EXISTS public.stock_changes(uuid, timestamptz);
+CREATE OR REPLACE FUNCTION public.stock_changes(
+  p_org_id uuid,
+  p_since xid8 DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SECURITY INVOKER
+SET search_path = public
+AS $$
+DECLARE
+  v_rows jsonb;
+  v_deleted jsonb := '[]'::jsonb;
+BEGIN
+  IF p_since IS NULL THEN
+    SELECT COALESCE(jsonb_agg(to_jsonb(r)), '[]'::jsonb) INTO v_rows
+    FROM (
+      SELECT id, sku, name, unit, category, min_stock, price, unit_cost, qty, updated_at, stock_updated_at
+      FROM public.stock_view
+      WHERE org_id = p_org_id
+    ) r;
+  ELSE
+    SELECT COALESCE(jsonb_agg(to_jsonb(r)), '[]'::jsonb) INTO v_rows
+    FROM (
+      SELECT v.id, v.sku, v.name, v.unit, v.category, v.min_stock, v.price, v.unit_cost, v.qty,
+             v.updated_at, v.stock_updated_at
+      FROM public.stock_view v
+      WHERE v.org_id = p_org_id
+        AND v.id IN (
+          SELECT id FROM public.products WHERE org_id = p_org_id AND change_xid >= p_since
+          UNION
+          SELECT product_id FROM public.stock WHERE change_xid >= p_since
+        )
+    ) r;
+
+    SELECT COALESCE(jsonb_agg(product_id), '[]'::jsonb) INTO v_deleted
+    FROM public.product_tombstones
+    WHERE org_id = p_org_id AND deleted_xid >= p_since;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'cursor', pg_snapshot_xmin(pg_current_snapshot())::text,
+    'rows', v_rows,
+    'deleted', v_deleted
+  );
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.stock_changes(uuid, xid8) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.stock_changes(uuid, xid8) TO authenticated;
@@ -0,0 +1,105 @@
+"""audio_bundle: lookup, in-place appends, rebuilds and damaged files, on clips in a temp dir."""
+import hashlib
+import os
+
+import pytest
+
+from audio_bundle import BUNDLE_NAME, TRAILER, AudioBundle, BundleError, build_bundle
+
+# Clips well above the index size, so the old index alone never counts as much dead space.
+SIZE = 1000
+
+
+def clips(out_dir, audio):
+    """Write word -> bytes as clip files and return index.json-style entries."""
+    entries = {}
+    for word, data in audio.items():
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        with open(os.path.join(out_dir, f"{digest}.mp3"), "wb") as fh:
+            fh.write(data)
+        entries[word] = {"file": f"{digest}.mp3", "hash": digest}
+    return entries
+
+
+def contents(path):
+    with AudioBundle(path) as bundle:
+        return {word: bytes(bundle[word]) for word in bundle.words()}
+
+
+def test_lookup(tmp_path):
+    audio = {"Hund": b"wuff" * 10, "Katze": b"miau" * 7, "Straße": b"street", "Strasse": b"street"}
+    assert build_bundle(str(tmp_path), clips(tmp_path, audio)) == (3, 0)  # equal clips stored once
+
+    with AudioBundle(str(tmp_path / BUNDLE_NAME)) as bundle:
+        assert len(bundle) == 4
+        assert bytes(bundle.get("Hund")) == b"wuff" * 10
+        assert bundle["Straße"] == bundle["Strasse"] == b"street"
+        assert bundle.get("Maus") is None and "Maus" not in bundle and "Katze" in bundle
+        with pytest.raises(KeyError):
+            bundle["Maus"]
+        assert sorted(bundle.words()) == sorted(audio)
+
+
+def test_slices_outlive_the_with_block(tmp_path):
+    build_bundle(str(tmp_path), clips(tmp_path, {"Hund": b"wuff"}))
+    with AudioBundle(str(tmp_path / BUNDLE_NAME)) as bundle:
+        clip = bundle.get("Hund")
+    assert bundle._fh.closed
+    assert bytes(clip) == b"wuff"
+    clip.release()
+    bundle.close()  # closing twice is harmless
+
+
+def test_new_words_are_appended_in_place(tmp_path):
+    path = str(tmp_path / BUNDLE_NAME)
+    audio = {"Hund": b"wuff" * SIZE, "Katze": b"miau" * SIZE}
+    build_bundle(str(tmp_path), clips(tmp_path, audio))
+    with open(path, "rb") as fh:
+        before = fh.read()
+
+    assert build_bundle(str(tmp_path), clips(tmp_path, audio)) == (0, 2)  # unchanged: not touched
+    audio["Maus"] = b"piep" * SIZE
+    assert build_bundle(str(tmp_path), clips(tmp_path, audio)) == (1, 2)
+
+    with open(path, "rb") as fh:
+        after = fh.read()
+    assert after[:len(before) - TRAILER.size] == before[:-TRAILER.size]  # old clips not rewritten
+    assert contents(path) == audio
+
+
+def test_rewritten_once_dead_space_outweighs_live_data(tmp_path):
+    path = str(tmp_path / BUNDLE_NAME)
+    audio = {w: w.encode() * SIZE for w in ["Hund", "Katze", "Maus", "Vogel", "Fisch"]}
+    build_bundle(str(tmp_path), clips(tmp_path, audio))
+    size = os.path.getsize(path)
+
+    # One clip of five dropped: dead space is below half the live data, so only a new index is appended.
+    del audio["Fisch"]
+    assert build_bundle(str(tmp_path), clips(tmp_path, audio)) == (0, 4)
+    assert os.path.getsize(path) > size
+
+    # Two more dropped: dead space now outweighs half the live data and the file is rewritten.
+    del audio["Vogel"], audio["Maus"]
+    assert build_bundle(str(tmp_path), clips(tmp_path, audio)) == (2, 0)
+    assert os.path.getsize(path) < size
+    assert contents(path) == audio
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".part")]
+
+
+def test_truncated_trailer_is_refused_and_rebuilt(tmp_path):
+    path = str(tmp_path / BUNDLE_NAME)
+    audio = {"Hund": b"wuff" * SIZE, "Katze": b"miau" * SIZE}
+    build_bundle(str(tmp_path), clips(tmp_path, audio))
+    with open(path, "r+b") as fh:
+        fh.truncate(os.path.getsize(path) - 5)  # an append cut short
+
+    with pytest.raises(BundleError):
+        AudioBundle(path)
+    assert build_bundle(str(tmp_path), clips(tmp_path, audio)) == (2, 0)
+    assert contents(path) == audio
+
+
+def test_empty_file_is_not_a_bundle(tmp_path):
+    (tmp_path / BUNDLE_NAME).write_bytes(b"")
+    with pytest.raises(BundleError):
+        AudioBundle(str(tmp_path / BUNDLE_NAME))
@@ -0,0 +1,46 @@
+"""The benchmark's PostgREST stand-in answers filtered, ordered and paged reads like PostgREST."""
+import httpx
+from postgrest import SyncPostgrestClient
+
+from benchmarks.bench_inventory import ORG_ID, FakePostgrest
+
+
+def client(fake):
+    return SyncPostgrestClient("https://bench.supabase.co/rest/v1",
+                               http_client=httpx.Client(transport=httpx.MockTransport(fake)))
+
+
+def test_keyset_pages_follow_the_order():
+    fake = FakePostgrest(120, n_sales=120)
+    db = client(fake)
+
+    first = (db.table("products").select("id,name").eq("org_id", ORG_ID)
+             .order("name").order("id").limit(50).execute().data)
+    last = first[-1]
+    second = (db.table("products").select("id,name").eq("org_id", ORG_ID)
+              .or_(f'name.gt."{last["name"]}",and(name.eq."{last["name"]}",id.gt."{last["id"]}")')
+              .order("name").order("id").limit(50).execute().data)
+    names = [r["name"] for r in first + second]
+    assert names == sorted(names) and len(set(names)) == 100
+
+    sales = (db.table("sales").select("id,created_at").eq("org_id", ORG_ID)
+             .order("created_at", desc=True).order("id", desc=True).limit(5).execute().data)
+    cursor = sales[-1]
+    older = (db.table("sales").select("id,created_at").eq("org_id", ORG_ID)
+             .or_(f'created_at.lt."{cursor["created_at"]}",'
+                  f'and(created_at.eq."{cursor["created_at"]}",id.lt."{cursor["id"]}")')
+             .order("created_at", desc=True).order("id", desc=True).limit(5).execute().data)
+    stamps = [r["created_at"] for r in sales + older]
+    assert stamps == sorted(stamps, reverse=True) and len(set(stamps)) == 10
+
+
+def test_eq_filters_apply():
+    fake = FakePostgrest(200)
+    db = client(fake)
+
+    low = db.table("stock_view").select("qty,low_stock").eq("org_id", ORG_ID).eq("low_stock", True).execute().data
+    assert low and all(r["low_stock"] for r in low)
+    assert len(low) == sum(p["low_stock"] for p in fake.products)
+    assert db.table("stock_view").select("id").eq("category", "Category 3").execute().data == \
+        [{"id": p["id"]} for p in fake.products if p["category"] == "Category 3"]
+    assert db.table("products").select("id").eq("org_id", "someone-else").execute().data == []
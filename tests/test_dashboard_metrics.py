@@ -0,0 +1,131 @@
+"""
+dashboard_metrics must report the same item count, stock total and low-stock
+count as the pandas code it replaced (products left-joined to stock, missing
+qty = 0, low stock = qty.fillna(0) < min_stock).
+
+The SQLite test runs the migrations' own stock_view and stock_totals SQL on
+every CI run; the database test runs the real RPC (see the `pg` fixture).
+"""
+import os
+import re
+import sqlite3
+import uuid
+
+import pandas as pd
+import pytest
+
+from conftest import ORG_ID, REPO
+
+MIGRATIONS = os.path.join(REPO, "supabase", "migrations")
+
+# Edge cases of the low-stock rule: no stock row, NULL min_stock, qty equal
+# to min_stock, negative and fractional quantities.
+PRODUCTS = [
+    # sku, min_stock, qty (None = no stock row)
+    ("A", 5, 10),
+    ("B", 5, 4),
+    ("C", 5, 5),
+    ("D", 5, None),
+    ("E", None, 0),
+    ("F", 0, None),
+    ("G", 2.5, 2.25),
+    ("H", 1, -3),
+    ("I", None, None),
+]
+
+
+def seeded_frames():
+    products = pd.DataFrame([{"id": str(uuid.uuid4()), "sku": sku, "name": f"Product {sku}",
+                              "min_stock": min_stock} for sku, min_stock, _ in PRODUCTS])
+    stock = pd.DataFrame([{"product_id": pid, "qty": qty}
+                          for pid, (_, _, qty) in zip(products["id"], PRODUCTS) if qty is not None])
+    return products, stock
+
+
+def pandas_totals(products: pd.DataFrame, stock: pd.DataFrame) -> dict:
+    """The pre-RPC dashboard: get_stock_df's merge, then the page's pandas sums."""
+    merged = products.merge(stock.rename(columns={"product_id": "id"})[["id", "qty"]], on="id", how="left")
+    merged["qty"] = merged["qty"].fillna(0)
+    return {
+        "item_count": len(merged),
+        "total_qty": float(merged["qty"].sum()),
+        "low_stock_count": int((merged["qty"] < merged["min_stock"]).sum()),
+    }
+
+
+def latest_sql(pattern: str) -> str:
+    """Group 1 of `pattern` in the last migration (by file name) that matches it."""
+    for name in sorted(os.listdir(MIGRATIONS), reverse=True):
+        with open(os.path.join(MIGRATIONS, name)) as fh:
+            m = re.search(pattern, fh.read(), re.S)
+        if m:
+            return m.group(1)
+    raise AssertionError(f"no migration matches {pattern!r}")
+
+
+def for_sqlite(sql: str) -> str:
+    """The few Postgres spellings in these statements that SQLite lacks."""
+    return sql.replace("public.", "").replace("GREATEST(", "MAX(").replace("p_org_id", ":org_id")
+
+
+def sqlite_totals(products: pd.DataFrame, stock: pd.DataFrame, org_id: str) -> dict:
+    """dashboard_metrics' stock totals, from the current migrations' SQL, run on SQLite."""
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE products (id TEXT PRIMARY KEY, org_id TEXT, sku TEXT, name TEXT, unit TEXT, "
+               "min_stock REAL, category TEXT, price REAL, unit_cost REAL, updated_at TEXT)")
+    db.execute("CREATE TABLE stock (product_id TEXT PRIMARY KEY, qty REAL, updated_at TEXT)")
+    db.executemany("INSERT INTO products (id, org_id, sku, name, min_stock) VALUES (?, ?, ?, ?, ?)",
+                   [(r.id, org_id, r.sku, r.name, None if pd.isna(r.min_stock) else r.min_stock)
+                    for r in products.itertuples()])
+    db.executemany("INSERT INTO stock (product_id, qty) VALUES (?, ?)",
+                   [(r.product_id, r.qty) for r in stock.itertuples()])
+    db.execute("INSERT INTO products (id, org_id, sku, name, min_stock) VALUES ('x', 'other', 'X', 'Other', 10)")
+
+    view = latest_sql(r"CREATE OR REPLACE VIEW public\.stock_view\b.*?\bAS\s*(SELECT\b.*?);")
+    totals = latest_sql(r"(stock_totals AS \(\s*SELECT.*?WHERE org_id = p_org_id\s*\))")
+    db.execute("CREATE VIEW stock_view AS " + for_sqlite(view))
+    row = db.execute(for_sqlite(f"WITH {totals} SELECT item_count, total_qty, low_stock_count FROM stock_totals"),
+                     {"org_id": org_id}).fetchone()
+    return dict(zip(["item_count", "total_qty", "low_stock_count"], row))
+
+
+def test_sql_rule_matches_pandas():
+    products, stock = seeded_frames()
+    got = sqlite_totals(products, stock, ORG_ID)
+    want = pandas_totals(products, stock)
+    assert got["item_count"] == want["item_count"]
+    assert got["total_qty"] == pytest.approx(want["total_qty"])
+    assert got["low_stock_count"] == want["low_stock_count"]
+
+
+def test_rpc_matches_pandas(pg):
+    products, stock = seeded_frames()
+    with pg.cursor() as cur:
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('dashboard test') RETURNING id")
+        org_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('other org') RETURNING id")
+        other_org = cur.fetchone()[0]
+        for r in products.itertuples():
+            cur.execute("INSERT INTO public.products (id, org_id, sku, name, min_stock) VALUES (%s, %s, %s, %s, %s)",
+                        (r.id, org_id, r.sku, r.name, None if pd.isna(r.min_stock) else r.min_stock))
+        for r in stock.itertuples():
+            cur.execute("INSERT INTO public.stock (product_id, qty) VALUES (%s, %s)", (r.product_id, r.qty))
+        # Another org's low-stock product must not be counted.
+        cur.execute("INSERT INTO public.products (org_id, sku, name, min_stock) VALUES (%s, 'X', 'Other', 10)",
+                    (other_org,))
+        cur.execute("SELECT public.dashboard_metrics(%s)", (org_id,))
+        got = cur.fetchone()[0]
+
+    want = pandas_totals(products, stock)
+    assert got["item_count"] == want["item_count"]
+    assert float(got["total_qty"]) == pytest.approx(want["total_qty"])
+    assert got["low_stock_count"] == want["low_stock_count"]
+    assert sorted(r["sku"] for r in got["low_stock"]) == ["B", "D", "G", "H"]
+
+
+def test_dashboard_page_is_one_call(app, rest):
+    rest.rpcs["dashboard_metrics"] = lambda body: {"item_count": 1, "low_stock": [], "recent_sales": [],
+                                                   "recent_stock": [{"sku": "A", "qty": 1}]}
+    app.page_dashboard()
+    # No full stock table or sales history behind the landing page.
+    assert [c[1] for c in rest.calls] == ["/rest/v1/rpc/dashboard_metrics"]
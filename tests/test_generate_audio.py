@@ -0,0 +1,155 @@
+"""generate_audio against the offline stub synthesizer in a temp directory."""
+import os
+import threading
+
+import pytest
+
+import generate_audio as ga
+from generate_audio import RateLimiter, generate, load_index, stub_synthesizer
+from vocab import VocabEntry
+
+
+class CountingSynth:
+    """stub_synthesizer that counts calls per text and can fail given texts."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, text, lang, voice):
+        with self._lock:
+            self.calls[text] = self.calls.get(text, 0) + 1
+        if text in self.fail:
+            raise RuntimeError(f"tts down for {text}")
+        return stub_synthesizer(text, lang, voice)
+
+
+def run(out, words, synth, **kw):
+    return generate(words, str(out), synth, workers=4, rate=0, retries=0, backoff=0, **kw)
+
+
+def clip(out, word):
+    with open(os.path.join(out, load_index(str(out))[word]["file"]), "rb") as fh:
+        return fh.read()
+
+
+def test_resume_only_synthesizes_missing_words(tmp_path):
+    words = ["Hund", "Katze", "Haus", "Baum"]
+    first = CountingSynth(fail={"Katze"})
+    done, up_to_date, failed = run(tmp_path, words, first)
+    assert (done, up_to_date) == (3, 0)
+    assert [w for w, _ in failed] == ["Katze"]
+    assert set(load_index(str(tmp_path))) == {"Hund", "Haus", "Baum"}
+
+    second = CountingSynth()
+    done, up_to_date, failed = run(tmp_path, words, second)
+    assert (done, up_to_date, failed) == (1, 3, [])
+    assert second.calls == {"Katze": 1}
+    assert clip(tmp_path, "Katze") == stub_synthesizer("Katze", "de", "")
+
+
+def test_rerun_with_clips_but_no_index_reindexes_without_synthesizing(tmp_path):
+    run(tmp_path, ["Hund", "Katze"], CountingSynth())
+    os.remove(tmp_path / ga.INDEX_NAME)
+
+    synth = CountingSynth()
+    assert run(tmp_path, ["Hund", "Katze"], synth)[:2] == (0, 2)
+    assert synth.calls == {}
+
+
+def test_atomic_write_keeps_old_file_on_failure(tmp_path, monkeypatch):
+    path = tmp_path / "clip.mp3"
+    ga.atomic_write(str(path), b"old audio")
+
+    def broken_fsync(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(ga.os, "fsync", broken_fsync)
+    with pytest.raises(OSError):
+        ga.atomic_write(str(path), b"new audio that never lands")
+
+    assert path.read_bytes() == b"old audio"
+    assert os.listdir(tmp_path) == ["clip.mp3"]
+
+
+def test_stale_part_files_are_collected(tmp_path):
+    (tmp_path / "abc.part").write_bytes(b"half a clip")
+    run(tmp_path, ["Hund"], CountingSynth())
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".part")]
+
+
+def test_retry_backs_off_exponentially(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ga.time, "sleep", sleeps.append)
+    attempts = []
+
+    def flaky(text, lang, voice):
+        attempts.append(text)
+        if len(attempts) < 3:
+            raise RuntimeError("429")
+        return b"ok"
+
+    assert ga.synthesize_with_retry(flaky, "Hund", "de", "", RateLimiter(0), retries=4, backoff=0.5) == b"ok"
+    assert len(attempts) == 3
+    assert len(sleeps) == 2
+    assert 0.5 <= sleeps[0] <= 1.0
+    assert 1.0 <= sleeps[1] <= 1.5
+
+
+def test_retry_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(ga.time, "sleep", lambda s: None)
+    synth = CountingSynth(fail={"Hund"})
+    with pytest.raises(RuntimeError):
+        ga.synthesize_with_retry(synth, "Hund", "de", "", RateLimiter(0), retries=2, backoff=0.1)
+    assert synth.calls == {"Hund": 3}
+
+
+def test_similar_spellings_get_their_own_clips(tmp_path):
+    # Straße and Strasse used to map to the same file name and overwrite each other.
+    done, _, failed = run(tmp_path, ["Straße", "Strasse"], CountingSynth())
+    assert (done, failed) == (2, [])
+
+    index = load_index(str(tmp_path))
+    assert index["Straße"]["file"] != index["Strasse"]["file"]
+    assert clip(tmp_path, "Straße") == stub_synthesizer("Straße", "de", "")
+    assert clip(tmp_path, "Strasse") == stub_synthesizer("Strasse", "de", "")
+
+
+def test_changed_voice_resynthesizes(tmp_path):
+    run(tmp_path, ["Hund"], CountingSynth())
+    synth = CountingSynth()
+    generate(["Hund"], str(tmp_path), synth, voice="de", workers=1, rate=0, retries=0, backoff=0)
+    assert synth.calls == {"Hund": 1}
+    assert load_index(str(tmp_path))["Hund"]["voice"] == "de"
+
+
+def test_gc_only_collects_levels_of_the_run(tmp_path):
+    words = [("Hund", "A1"), ("Katze", "A1"), ("Bahnhof", "A2"), ("Rechnung", "A2")]
+    run(tmp_path, words, CountingSynth())
+
+    # An A1-only run where Katze left the list: A2 stays, Katze goes.
+    done, up_to_date, _ = run(tmp_path, [("Hund", "A1")], CountingSynth())
+    assert (done, up_to_date) == (0, 1)
+    index = load_index(str(tmp_path))
+    assert set(index) == {"Hund", "Bahnhof", "Rechnung"}
+    assert index["Bahnhof"]["level"] == "A2"
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".mp3")]) == 3
+
+
+def test_plain_word_runs_leave_levelled_entries_alone(tmp_path):
+    run(tmp_path, [("Hund", "A1"), ("Bahnhof", "A2")], CountingSynth())
+    run(tmp_path, ["Katze"], CountingSynth())
+    assert set(load_index(str(tmp_path))) == {"Hund", "Bahnhof", "Katze"}
+
+
+def test_cli_levels_keeps_other_levels(tmp_path, monkeypatch):
+    vocab = [VocabEntry("A1", "Hund", "dog"), VocabEntry("A1", "Katze", "cat"),
+             VocabEntry("A2", "Bahnhof", "station"), VocabEntry("A2", "Rechnung", "bill")]
+    monkeypatch.setattr(ga, "iter_vocab", lambda levels: (e for e in vocab if e.level in levels))
+    out = str(tmp_path / "audio")
+    assert ga.main(["--out", out, "--backend", "stub", "--rate", "0"]) == 0
+    before = load_index(out)
+    assert {e["level"] for e in before.values()} == {"A1", "A2"}
+
+    assert ga.main(["--out", out, "--backend", "stub", "--rate", "0", "--levels", "A1"]) == 0
+    assert load_index(out) == before
@@ -0,0 +1,59 @@
+"""The dashboard's latest stock changes come from a small RPC, never the full stock table."""
+from conftest import ORG_ID
+
+ROWS = [{"id": f"p{i}", "sku": f"S{i}", "name": f"Item {i}", "unit": "pcs", "qty": i,
+         "updated_at": f"2024-04-17T00:00:{59 - i:02d}+00:00"} for i in range(3)]
+
+
+def expire(app, key):
+    cache = app.st.session_state["_data_cache"]
+    cache[key] = (cache[key][0] - app.DELTA_POLL_SECONDS - 1, cache[key][1])
+
+
+def test_dashboard_call_seeds_the_panel(app, rest):
+    rest.rpcs["dashboard_metrics"] = lambda body: {"item_count": 3, "recent_stock": ROWS}
+    rest.rpcs["latest_stock_changes"] = lambda body: ROWS[:1]
+
+    app.get_dashboard_metrics(ORG_ID)
+    assert app.latest_stock_changes(ORG_ID)["sku"].tolist() == ["S0", "S1", "S2"]
+    assert rest.rpc_calls("latest_stock_changes") == []
+    assert rest.rpc_calls("stock_changes") == []
+
+    # The panel polls the small RPC once the seeded rows are older than the poll interval.
+    expire(app, (ORG_ID, "stock", ("latest", app.LATEST_STOCK_LIMIT)))
+    assert app.latest_stock_changes(ORG_ID)["sku"].tolist() == ["S0"]
+    assert rest.rpc_calls("latest_stock_changes") == [{"p_org_id": ORG_ID, "p_limit": app.LATEST_STOCK_LIMIT}]
+
+
+def test_writes_drop_the_latest_changes(app, rest):
+    rest.rpcs["latest_stock_changes"] = lambda body: ROWS
+    app.latest_stock_changes(ORG_ID)
+    app.invalidate(ORG_ID, "stock")
+    app.latest_stock_changes(ORG_ID)
+    assert len(rest.rpc_calls("latest_stock_changes")) == 2
+
+
+def test_rpc_returns_newest_product_or_stock_change(pg):
+    with pg.cursor() as cur:
+        # Backdate rows by hand; the touch triggers would stamp now().
+        cur.execute("ALTER TABLE public.products DISABLE TRIGGER products_touch_updated_at")
+        cur.execute("ALTER TABLE public.stock DISABLE TRIGGER stock_touch_updated_at")
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('latest test') RETURNING id")
+        org_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('other org') RETURNING id")
+        other_org = cur.fetchone()[0]
+        ids = {}
+        for i, sku in enumerate(["A", "B", "C", "D"]):
+            cur.execute("INSERT INTO public.products (org_id, sku, name, updated_at) "
+                        "VALUES (%s, %s, %s, now() - make_interval(hours => %s)) RETURNING id",
+                        (org_id, sku, f"Product {sku}", 10 - i))
+            ids[sku] = cur.fetchone()[0]
+        # A stock change makes the oldest product the newest; D has no stock row at all.
+        for sku, hours in [("A", 1), ("B", 20), ("C", 20)]:
+            cur.execute("INSERT INTO public.stock (product_id, qty, updated_at) "
+                        "VALUES (%s, 1, now() - make_interval(hours => %s))", (ids[sku], hours))
+        cur.execute("INSERT INTO public.products (org_id, sku, name) VALUES (%s, 'X', 'Other')", (other_org,))
+        cur.execute("SELECT public.latest_stock_changes(%s, 2)", (org_id,))
+        got = cur.fetchone()[0]
+
+    assert [r["sku"] for r in got] == ["A", "D"]
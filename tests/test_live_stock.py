@@ -0,0 +1,54 @@
+"""live_stock: one full load, then deltas patched into the same frame."""
+from conftest import ORG_ID
+
+
+def row(pid, **changes):
+    base = {"id": pid, "sku": pid.upper(), "name": f"Product {pid}", "unit": "pcs", "category": "Tools",
+            "min_stock": 5, "price": 10, "unit_cost": 4, "qty": 3,
+            "updated_at": "2024-04-11T00:00:00+00:00", "stock_updated_at": "2024-04-11T00:00:00+00:00"}
+    return {**base, **changes}
+
+
+def test_fractional_delta_after_whole_number_load(app, rest):
+    responses = [
+        {"cursor": "1000", "rows": [row("a"), row("b")], "deleted": []},
+        {"cursor": "1003", "deleted": ["b"],
+         "rows": [row("a", qty=1.25, unit_cost=4.5, price=9.99), row("c", qty=0.5, min_stock=None)]},
+    ]
+    rest.rpcs["stock_changes"] = lambda body: responses.pop(0)
+
+    assert app.live_stock(ORG_ID)["qty"].tolist() == [3, 3]
+    app.invalidate(ORG_ID, "stock")  # next read asks for a delta
+    df = app.live_stock(ORG_ID)
+
+    assert df.index.tolist() == ["a", "c"]
+    assert df.loc["a", ["qty", "unit_cost", "price"]].tolist() == [1.25, 4.5, 9.99]
+    assert df.loc["c", "qty"] == 0.5
+    assert all(df[c].dtype == "float64" for c in app.LIVE_STOCK_NUMERIC)
+    assert [b["p_since"] for b in rest.rpc_calls("stock_changes")] == [None, "1000"]
+
+
+def test_rpc_cursor_catches_a_late_commit(pg):
+    """A writer that started before a read but commits after it shows up in the next delta."""
+    import os
+    import psycopg
+
+    with psycopg.connect(os.environ["SUPABASE_DB_URL"], autocommit=True) as setup:
+        org_id = setup.execute("INSERT INTO public.orgs (name) VALUES ('cursor test') RETURNING id").fetchone()[0]
+        pid = setup.execute("INSERT INTO public.products (org_id, sku, name) VALUES (%s, 'LATE', 'Late') "
+                            "RETURNING id", (org_id,)).fetchone()[0]
+        setup.execute("INSERT INTO public.stock (product_id, qty) VALUES (%s, 1)", (pid,))
+    try:
+        with psycopg.connect(os.environ["SUPABASE_DB_URL"]) as writer:
+            writer.execute("UPDATE public.stock SET qty = 7 WHERE product_id = %s", (pid,))
+            pg.autocommit = True
+            cursor = pg.execute("SELECT public.stock_changes(%s)", (org_id,)).fetchone()[0]["cursor"]
+            writer.commit()
+        delta = pg.execute("SELECT public.stock_changes(%s, %s::xid8)", (org_id, cursor)).fetchone()[0]
+        assert [(r["sku"], float(r["qty"])) for r in delta["rows"]] == [("LATE", 7.0)]
+    finally:
+        with psycopg.connect(os.environ["SUPABASE_DB_URL"], autocommit=True) as cleanup:
+            cleanup.execute("DELETE FROM public.stock WHERE product_id = %s", (pid,))
+            cleanup.execute("DELETE FROM public.products WHERE id = %s", (pid,))
+            cleanup.execute("DELETE FROM public.product_tombstones WHERE org_id = %s", (org_id,))
+            cleanup.execute("DELETE FROM public.orgs WHERE id = %s", (org_id,))
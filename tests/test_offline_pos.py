@@ -0,0 +1,93 @@
+"""The till keeps working when Supabase is unreachable."""
+import httpx
+import pytest
+
+from conftest import ORG_ID, USER_ID
+
+OTHER_USER_ID = "00000000-0000-0000-0000-0000000000cc"
+
+PRODUCTS = [
+    {"id": "p1", "sku": "APL", "name": "Apple", "category": "Fruit", "unit": "pcs", "unit_cost": 0.2,
+     "price": 0.5, "min_stock": 10, "qty": 40},
+    {"id": "p2", "sku": "BAN", "name": "Banana", "category": "Fruit", "unit": "pcs", "unit_cost": 0.1,
+     "price": 0.3, "min_stock": 10, "qty": 25},
+    {"id": "p3", "sku": "CHA", "name": "Chair", "category": "Furniture", "unit": "pcs", "unit_cost": 20,
+     "price": 45, "min_stock": 1, "qty": 3},
+]
+
+
+def test_picker_falls_back_to_products_seen_this_session(app, rest):
+    rest.rpcs["search_products"] = lambda body: PRODUCTS
+    app.search_products(ORG_ID, "")
+
+    rest.offline = True
+    assert app.product_picker(ORG_ID, "sell") is None  # nothing selected yet, but no traceback
+
+    found = app.offline_products(ORG_ID, "fru")
+    assert found["sku"].tolist() == ["APL", "BAN"]
+    assert app.offline_products(ORG_ID, "ch")["sku"].tolist() == ["CHA"]
+
+
+def test_offline_search_without_cached_products_is_empty(app, rest):
+    rest.offline = True
+    assert app.product_picker(ORG_ID, "sell") is None
+    assert app.offline_products(ORG_ID, "").empty
+
+
+def test_sales_queue_while_offline_and_sync_later(app, rest, monkeypatch):
+    worker = app.SyncWorker(app.pos_queue(), ORG_ID, None)
+    monkeypatch.setattr(app, "sync_worker", lambda org_id: worker)
+    rest.offline = True
+
+    key = app.sell_items(ORG_ID, [{"product_id": "p1", "qty": 2, "unit_price": 0.5}], "offline")
+    worker.set_sender(app._sync_sender(app.db()), USER_ID)
+    with pytest.raises(httpx.TransportError):
+        worker.flush()
+    assert key in [op["key"] for op in app.pos_queue().pending(ORG_ID)]
+
+    rest.offline = False
+    rest.rpcs["sync_pos_ops"] = lambda body: {"applied": [op["key"] for op in body["p_ops"]], "failed": []}
+    worker.flush()
+    assert key not in [op["key"] for op in app.pos_queue().pending(ORG_ID)]
+    assert key in [op["key"] for op in rest.rpc_calls("sync_pos_ops")[-1]["p_ops"]]
+
+
+def test_one_sync_worker_per_org_across_sessions(app, rest):
+    first = app.sync_worker(ORG_ID)
+    first_send = app.st.session_state["_sync_send"]
+
+    app.st.session_state = {**app.st.session_state, "_db": None, "_sync_send": None}  # another tab
+    second = app.sync_worker(ORG_ID)
+
+    assert second is first
+    assert first.is_alive()
+    # The first tab logging out does not take the second tab's credentials away.
+    first.release_sender(first_send, USER_ID)
+    assert first.sender(USER_ID) is app.st.session_state["_sync_send"]
+
+
+def test_queued_writes_are_sent_as_the_user_who_made_them(app, rest):
+    rest.rpcs["sync_pos_ops"] = lambda body: {"applied": [op["key"] for op in body["p_ops"]], "failed": []}
+    session_a = app.st.session_state
+    worker = app.sync_worker(ORG_ID)
+    key_a = app.sell_items(ORG_ID, [{"product_id": "p1", "qty": 1, "unit_price": 0.5}], "a")
+
+    # Another user reruns their tab before the worker has flushed A's sale.
+    app.st.session_state = {**session_a, "user": {"id": OTHER_USER_ID, "email": "b@example.com"},
+                            "membership_user": OTHER_USER_ID, "jwt": "jwt-b", "_db": None}
+    assert app.sync_worker(ORG_ID) is worker
+    key_b = app.receive_stock(ORG_ID, "p2", 5, 0.1)
+    worker.flush()
+
+    sent_by = {op["key"]: auth for auth, body in rest.rpc_calls_with_auth("sync_pos_ops") for op in body["p_ops"]}
+    assert sent_by[key_a] == "Bearer test-jwt"
+    assert sent_by[key_b] == "Bearer jwt-b"
+
+    # After B logs out, B's next write waits for B instead of going out as A.
+    app.st.session_state["org_id"] = ORG_ID
+    worker.release_sender(app.st.session_state["_sync_send"], OTHER_USER_ID)
+    later = app.pos_queue().enqueue(ORG_ID, "receive", {"product_id": "p2", "qty": 1, "unit_cost": 0.1}, OTHER_USER_ID)
+    app.st.session_state = session_a
+    app.sync_worker(ORG_ID)
+    worker.flush()
+    assert later in [op["key"] for op in app.pos_queue().pending(ORG_ID)]
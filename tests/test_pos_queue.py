@@ -0,0 +1,187 @@
+"""WriteQueue and SyncWorker against a stub sender; no Supabase involved."""
+import threading
+import time
+
+import pytest
+
+from pos_queue import FAILED, PENDING, SyncWorker, WriteQueue
+
+ORG = "org-1"
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WriteQueue(str(tmp_path / "queue.sqlite3"))
+
+
+class Server:
+    """Records batches and answers with applied / failed / unmentioned keys."""
+
+    def __init__(self, reject=(), ignore=(), down=False):
+        self.reject, self.ignore, self.down = set(reject), set(ignore), down
+        self.batches = []
+
+    def __call__(self, org_id, ops):
+        if self.down:
+            raise ConnectionError("network unreachable")
+        self.batches.append([op["payload"]["n"] for op in ops])
+        applied, failed = [], []
+        for op in ops:
+            n = op["payload"]["n"]
+            if n in self.reject:
+                failed.append({"key": op["key"], "error": "product not found"})
+            elif n not in self.ignore:
+                applied.append(op["key"])
+        return {"applied": applied, "failed": failed}
+
+
+def enqueue(queue, *ns, org=ORG):
+    return [queue.enqueue(org, "sale", {"n": n}) for n in ns]
+
+
+def test_queue_is_durable_and_ordered_per_org(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    q = WriteQueue(path)
+    enqueue(q, 1, 2, 3)
+    enqueue(q, 9, org="other")
+
+    reopened = WriteQueue(path)
+    assert [op["payload"]["n"] for op in reopened.pending(ORG)] == [1, 2, 3]
+    assert reopened.counts(ORG) == {PENDING: 3, FAILED: 0}
+    assert reopened.counts("other") == {PENDING: 1, FAILED: 0}
+
+
+def test_flush_sends_in_batches_until_empty(queue):
+    enqueue(queue, *range(7))
+    server = Server()
+    worker = SyncWorker(queue, ORG, server, batch_size=3)
+
+    assert worker.flush() == 7
+    assert server.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert queue.counts(ORG) == {PENDING: 0, FAILED: 0}
+    assert worker.applied_total == 7
+
+
+def test_network_error_keeps_ops_pending(queue):
+    enqueue(queue, 1, 2)
+    worker = SyncWorker(queue, ORG, Server(down=True))
+
+    with pytest.raises(ConnectionError):
+        worker.flush()
+    assert queue.counts(ORG) == {PENDING: 2, FAILED: 0}
+    assert worker.last_error == "network unreachable"
+
+    # Retrying with a working connection applies them once.
+    server = Server()
+    worker.set_sender(server)
+    assert worker.flush() == 2
+    assert server.batches == [[1, 2]]
+    assert worker.last_error is None
+
+
+def test_rejected_ops_are_parked_for_review(queue):
+    enqueue(queue, 1, 2, 3)
+    worker = SyncWorker(queue, ORG, Server(reject={2}))
+
+    assert worker.flush() == 2
+    failed = queue.failed(ORG)
+    assert [(f["payload"]["n"], f["error"]) for f in failed] == [(2, "product not found")]
+    assert queue.counts(ORG) == {PENDING: 0, FAILED: 1}
+
+    queue.requeue_failed(ORG)
+    assert [op["payload"]["n"] for op in queue.pending(ORG)] == [2]
+    queue.mark_failed([queue.pending(ORG)[0]["key"]], "still wrong")
+    queue.discard_failed(ORG)
+    assert queue.counts(ORG) == {PENDING: 0, FAILED: 0}
+
+
+def test_unanswered_keys_are_retried(queue):
+    enqueue(queue, 1, 2, 3)
+    server = Server(ignore={3})
+    worker = SyncWorker(queue, ORG, server, batch_size=3)
+
+    assert worker.flush() == 2
+    assert [op["payload"]["n"] for op in queue.pending(ORG)] == [3]
+    # The full batch is followed by one more try; a batch with no answer at all ends the flush.
+    assert server.batches == [[1, 2, 3], [3]]
+
+    server.ignore = set()
+    assert worker.flush() == 1
+    assert queue.counts(ORG)[PENDING] == 0
+
+
+def test_without_sender_nothing_is_sent(queue):
+    enqueue(queue, 1)
+    server = Server()
+    worker = SyncWorker(queue, ORG, server)
+
+    worker.release_sender(lambda org_id, ops: {})  # not the current sender: kept
+    worker.release_sender(server)
+    assert worker.flush() == 0
+    assert queue.counts(ORG)[PENDING] == 1
+
+    worker.set_sender(server)
+    assert worker.flush() == 1
+
+
+def test_each_users_ops_go_through_their_own_sender(queue):
+    a, b = Server(), Server()
+    queue.enqueue(ORG, "sale", {"n": 1}, "user-a")
+    queue.enqueue(ORG, "sale", {"n": 2}, "user-b")
+    queue.enqueue(ORG, "sale", {"n": 3}, "user-a")
+    worker = SyncWorker(queue, ORG)
+
+    worker.set_sender(b, "user-b")
+    assert worker.flush() == 1
+    assert b.batches == [[2]]
+    assert [op["payload"]["n"] for op in queue.pending(ORG)] == [1, 3]  # A is not signed in
+
+    worker.set_sender(a, "user-a")
+    worker.release_sender(b, "user-a")  # someone else's sender: ignored
+    assert worker.flush() == 2
+    assert a.batches == [[1, 3]] and b.batches == [[2]]
+
+
+def test_queue_from_before_user_ids_still_opens(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "queue.sqlite3")
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE ops (key TEXT PRIMARY KEY, org_id TEXT NOT NULL, kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                "last_error TEXT, created_at REAL NOT NULL)")
+    old.execute("INSERT INTO ops (key, org_id, kind, payload, created_at) VALUES ('k', ?, 'sale', '{\"n\": 1}', 0)",
+                (ORG,))
+    old.commit()
+    old.close()
+
+    q = WriteQueue(path)
+    server = Server()
+    worker = SyncWorker(q, ORG)
+    worker.set_sender(server, "user-a")  # ops without a user go with whoever syncs
+    assert worker.flush() == 1
+    assert server.batches == [[1]]
+
+
+def test_background_thread_flushes_on_wake(queue):
+    done = threading.Event()
+    server = Server()
+
+    def send(org_id, ops):
+        result = server(org_id, ops)
+        done.set()
+        return result
+
+    worker = SyncWorker(queue, ORG, send, interval=60)
+    worker.start()
+    try:
+        enqueue(queue, 1)
+        worker.wake()
+        assert done.wait(5)
+        deadline = time.monotonic() + 5
+        while queue.counts(ORG)[PENDING] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert queue.counts(ORG)[PENDING] == 0
+    finally:
+        worker.stop()
+        worker.join(5)
+    assert not worker.is_alive()
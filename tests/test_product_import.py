@@ -0,0 +1,78 @@
+"""Bulk product import must not overwrite what a sheet leaves out or blank."""
+import io
+import json
+
+import pandas as pd
+
+from conftest import ORG_ID
+
+
+def sheet(text: str) -> pd.DataFrame:
+    return pd.read_csv(io.StringIO(text), dtype=str)
+
+
+def test_missing_columns_and_blank_cells_stay_null(app):
+    valid, errors = app.validate_product_import(sheet("sku,name,price\nA,Apple,1.5\nB,Banana,\n"))
+
+    assert errors.empty
+    assert valid[["unit_cost", "min_stock", "category", "unit"]].isna().all().all()
+    assert valid["price"].tolist()[0] == 1.5
+    assert pd.isna(valid["price"].tolist()[1])
+
+
+def test_bad_rows_are_reported_with_sheet_row(app):
+    valid, errors = app.validate_product_import(sheet("sku,name,price\nA,Apple,abc\n,NoSku,1\nC,Cherry,-1\n"))
+
+    assert valid.empty
+    assert errors["row"].tolist() == [2, 3, 4]
+
+
+def test_upsert_sends_nulls_not_defaults(app, rest):
+    rest.rpcs["import_products"] = lambda body: {"inserted": 0, "updated": len(body["p_rows"])}
+    valid, _ = app.validate_product_import(sheet("sku,name,price,min_stock\nA,Apple,1.5,\nB,Banana,2,3\nC,Cherry,,\n"))
+
+    failed = app.bulk_upsert_products(ORG_ID, valid, chunk_size=2)
+
+    assert failed.empty
+    calls = rest.rpc_calls("import_products")
+    assert [len(c["p_rows"]) for c in calls] == [2, 1]
+    rows = {r["sku"]: r for c in calls for r in c["p_rows"]}
+    assert rows["A"] == {"sku": "A", "name": "Apple", "category": None, "unit": None,
+                         "unit_cost": None, "price": 1.5, "min_stock": None}
+    assert rows["B"]["min_stock"] == 3
+    assert rows["C"]["price"] is None
+
+
+def test_failed_chunk_is_reported(app, rest):
+    valid, _ = app.validate_product_import(sheet("sku,name\nA,Apple\nB,Banana\n"))
+
+    failed = app.bulk_upsert_products(ORG_ID, valid)  # no RPC stub: the call fails
+
+    assert failed["sku"].tolist() == ["A", "B"]
+
+
+def test_rpc_keeps_existing_values(pg):
+    with pg.cursor() as cur:
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('import test') RETURNING id")
+        org_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO public.products (org_id, sku, name, category, unit, unit_cost, price, min_stock) "
+                    "VALUES (%s, 'A', 'Apple', 'Fruit', 'kg', 4.5, 9.99, 5)", (org_id,))
+        cur.execute("SELECT public.import_products(%s, %s::jsonb)", (org_id, json.dumps([
+            {"sku": "A", "name": "Green apple", "price": 11},
+            {"sku": "N", "name": "New", "category": None, "unit": None, "unit_cost": None, "price": None,
+             "min_stock": None},
+        ])))
+        assert cur.fetchone()[0] == {"inserted": 1, "updated": 1}
+        cur.execute("SELECT sku, name, category, unit, unit_cost::float8, price::float8, min_stock::float8 "
+                    "FROM public.products "
+                    "WHERE org_id = %s ORDER BY sku", (org_id,))
+        rows = cur.fetchall()
+        cur.execute("SELECT count(*) FROM public.stock s JOIN public.products p ON p.id = s.product_id "
+                    "WHERE p.org_id = %s AND p.sku = 'N' AND s.qty = 0", (org_id,))
+        seeded = cur.fetchone()[0]
+
+    assert rows == [
+        ("A", "Green apple", "Fruit", "kg", 4.5, 11.0, 5.0),
+        ("N", "New", None, "pcs", 0.0, 0.0, 0.0),
+    ]
+    assert seeded == 1
@@ -0,0 +1,32 @@
+"""search_products: empty queries list by (name, id); others rank prefix matches first."""
+from conftest import ORG_ID
+
+
+def test_app_sends_normalised_query_once(app, rest):
+    rest.rpcs["search_products"] = lambda body: [{"id": "1", "sku": "A", "name": "Apple", "qty": 3}]
+
+    app.search_products(ORG_ID, "  ")
+    app.search_products(ORG_ID, "")
+    app.search_products(ORG_ID, " APP ")
+
+    assert rest.rpc_calls("search_products") == [
+        {"p_org_id": ORG_ID, "p_query": "", "p_limit": app.SEARCH_LIMIT},
+        {"p_org_id": ORG_ID, "p_query": "app", "p_limit": app.SEARCH_LIMIT},
+    ]
+
+
+def test_rpc_empty_query_pages_by_name(pg):
+    with pg.cursor() as cur:
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('search test') RETURNING id")
+        org_id = cur.fetchone()[0]
+        for i in range(30):
+            cur.execute("INSERT INTO public.products (org_id, sku, name) VALUES (%s, %s, %s)",
+                        (org_id, f"S{i:02d}", f"Item {29 - i:02d}"))
+        cur.execute("INSERT INTO public.products (org_id, sku, name) VALUES (%s, 'ZZ', 'Bolt')", (org_id,))
+        cur.execute("SELECT name FROM public.search_products(%s, '', 5)", (org_id,))
+        first = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT name FROM public.search_products(%s, 'bol', 5)", (org_id,))
+        matched = [r[0] for r in cur.fetchall()]
+
+    assert first == ["Bolt", "Item 00", "Item 01", "Item 02", "Item 03"]
+    assert matched == ["Bolt"]
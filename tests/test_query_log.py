@@ -0,0 +1,46 @@
+"""The Settings page's N+1 warning only counts one rerun's own foreground calls."""
+import threading
+
+from conftest import ORG_ID
+from query_log import summarize
+
+LATEST = (ORG_ID, "stock", ("latest", 20))
+
+
+def flagged(app):
+    return [(r["label"], g["table"]) for r in app.query_log().reruns()
+            for g in summarize(r["calls"]) if g["n_plus_one"]]
+
+
+def test_dashboard_polling_is_not_an_n_plus_one(app, rest):
+    rest.rpcs["dashboard_metrics"] = lambda body: {"recent_stock": []}
+    rest.rpcs["latest_stock_changes"] = lambda body: []
+    app.query_log().begin("Dashboard")
+    app.page_dashboard()
+
+    # About 40 s of timed fragment runs. Bare mode skips fragment bodies, so run it directly.
+    for _ in range(8):
+        app.st.session_state["_data_cache"].pop(LATEST, None)
+        app.live_stock_panel.__wrapped__(ORG_ID)
+
+    assert len(rest.rpc_calls("latest_stock_changes")) == 8
+    assert flagged(app) == []
+    runs = [r for r in app.query_log().reruns() if r["calls"]]
+    assert max(len(r["calls"]) for r in runs) == 1
+
+
+def test_background_calls_are_tagged_and_not_counted(app, rest):
+    rest.rpcs["sync_pos_ops"] = lambda body: {"applied": [], "failed": []}
+    app.query_log().begin("Sell")
+    send = app._sync_sender(app.db())
+    worker = threading.Thread(target=lambda: [send(ORG_ID, []) for _ in range(6)])
+    worker.start()
+    worker.join()
+
+    calls = app.query_log().reruns()[-1]["calls"]
+    assert len(calls) == 6 and all(c.background for c in calls)
+    assert flagged(app) == []
+
+    for _ in range(5):  # the same calls made by the page itself are still flagged
+        send(ORG_ID, [])
+    assert flagged(app) == [("Sell", "rpc:sync_pos_ops")]
@@ -0,0 +1,132 @@
+"""DemandHistory.merge and reorder_plan on small hand-built histories."""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from reorder import PLAN_COLUMNS, DemandHistory, reorder_plan
+
+TODAY = date(2024, 4, 14)
+
+
+def payload(since, today, sales):
+    """daily_units payload from {(product_id, day): units}."""
+    ids = sorted({pid for pid, _ in sales})
+    return {
+        "since": since.isoformat(),
+        "today": today.isoformat(),
+        "product_ids": ids,
+        "p": [ids.index(pid) for pid, _ in sales],
+        "d": [(day - since).days for _, day in sales],
+        "u": list(sales.values()),
+    }
+
+
+def series(history, pid):
+    return dict(zip((history.start + timedelta(days=i) for i in range(history.units.shape[1])),
+                    history.units[history.product_ids.get_loc(pid)].tolist()))
+
+
+def day(n):
+    return TODAY - timedelta(days=n)
+
+
+def test_first_load_fills_the_window_and_leaves_gaps_zero():
+    h = DemandHistory.empty(TODAY, 10).merge(payload(day(9), TODAY, {("a", day(9)): 2, ("a", day(0)): 1,
+                                                                      ("b", day(4)): 5}))
+    assert (h.start, h.end) == (day(9), TODAY)
+    assert list(h.product_ids) == ["a", "b"]
+    assert series(h, "a")[day(9)] == 2 and series(h, "a")[TODAY] == 1
+    assert series(h, "b")[day(4)] == 5
+    assert h.units.sum() == 8  # every other day is a zero-sale day
+
+
+def test_refetched_days_are_replaced_including_sales_that_dropped_to_zero():
+    h = DemandHistory.empty(TODAY, 10).merge(payload(day(9), TODAY, {("a", day(1)): 3, ("a", day(0)): 1,
+                                                                      ("b", day(0)): 4}))
+    # Today's partial figures are fetched again: a sold more, b's sale was refunded.
+    h.merge(payload(TODAY, TODAY, {("a", TODAY): 6}))
+    assert series(h, "a")[day(1)] == 3 and series(h, "a")[TODAY] == 6
+    assert series(h, "b")[TODAY] == 0
+
+
+def test_window_rolls_over_to_the_new_day():
+    h = DemandHistory.empty(TODAY, 10).merge(payload(day(9), TODAY, {("a", day(9)): 1, ("a", day(5)): 2,
+                                                                      ("a", day(0)): 3}))
+    later = TODAY + timedelta(days=2)
+    h.merge(payload(TODAY, later, {("a", later): 7}))
+
+    assert (h.start, h.end) == (day(7), later)
+    a = series(h, "a")
+    assert day(9) not in a  # fell out of the window
+    assert (a[day(5)], a[TODAY], a[later]) == (2, 0, 7)  # today re-read with no sales left
+    assert h.units.shape == (1, 10)
+
+
+def test_a_roll_over_longer_than_the_window_clears_it():
+    h = DemandHistory.empty(TODAY, 5).merge(payload(day(4), TODAY, {("a", day(1)): 9}))
+    much_later = TODAY + timedelta(days=30)
+    h.merge(payload(much_later, much_later, {}))
+    assert h.end == much_later and h.units.sum() == 0
+
+
+def test_new_product_mid_window_is_appended():
+    h = DemandHistory.empty(TODAY, 10).merge(payload(day(9), TODAY, {("b", day(3)): 2}))
+    rows = h.units.copy()
+    h.merge(payload(TODAY, TODAY, {("a", TODAY): 4, ("b", TODAY): 1}))
+
+    assert list(h.product_ids) == ["b", "a"]  # existing rows keep their position
+    assert np.array_equal(h.units[0, :-1], rows[0, :-1])
+    assert series(h, "a") == {**{d: 0 for d in series(h, "a")}, TODAY: 4}
+
+
+def history(sales_by_product, days=30):
+    """History ending today; sales_by_product maps id -> units per day, oldest first."""
+    ids = list(sales_by_product)
+    units = np.array([sales_by_product[i] for i in ids], dtype=np.float32).reshape(len(ids), days)
+    return DemandHistory(TODAY - timedelta(days=days - 1), pd.Index(ids, dtype=object), units)
+
+
+def stock(rows):
+    return pd.DataFrame(rows, columns=["id", "qty", "min_stock"]).set_index("id")
+
+
+def test_lead_time_and_safety_stock():
+    steady = [2.0] * 29 + [50.0]  # today's partial figure is ignored
+    lumpy = [0.0, 4.0] * 14 + [2.0, 50.0]
+    plan = reorder_plan(history({"steady": steady, "lumpy": lumpy}),
+                        stock([("steady", 10, 0), ("lumpy", 40, 0)]),
+                        window_days=28, lead_time_days=7, review_days=7, service_z=1.65)
+
+    s = plan.loc["steady"]
+    assert (s.velocity, s.velocity_7d, s.days_of_cover) == (2, 2, 5)
+    assert (s.reorder_point, s.order_up_to) == (14, 28)  # no variability: no safety stock
+    assert s.reorder and s.suggested_qty == 18
+
+    window = np.array(lumpy[-29:-1])
+    safety = 1.65 * window.std() * np.sqrt(7)
+    lp = plan.loc["lumpy"]
+    assert lp.velocity == pytest.approx(window.mean())
+    assert lp.velocity_7d == pytest.approx(window[-7:].mean())
+    assert lp.reorder_point == pytest.approx(window.mean() * 7 + safety)
+    assert lp.order_up_to == pytest.approx(window.mean() * 14 + safety)
+    assert not lp.reorder and lp.suggested_qty == 0  # 40 on hand is above the reorder point
+
+
+def test_products_without_history_fall_back_to_min_stock():
+    plan = reorder_plan(history({"sold": [1.0] * 30}),
+                        stock([("new", 2, 5), ("idle", 9, 5), ("untracked", 0, None)]))
+
+    assert (plan["velocity"] == 0).all() and np.isinf(plan["days_of_cover"]).all()
+    assert plan.loc["new", "reorder"] and plan.loc["new", "suggested_qty"] == 3
+    assert not plan.loc["idle", "reorder"]
+    assert not plan.loc["untracked", "reorder"]  # nothing sells and no minimum: never suggested
+
+
+def test_empty_frames():
+    plan = reorder_plan(DemandHistory.empty(TODAY, 30), stock([]))
+    assert plan.empty and list(plan.columns) == PLAN_COLUMNS
+
+    plan = reorder_plan(DemandHistory.empty(TODAY, 30), stock([("a", 1, 2)]))
+    assert plan.loc["a", "reorder_point"] == 2 and plan.loc["a", "suggested_qty"] == 1
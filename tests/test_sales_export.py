@@ -0,0 +1,64 @@
+"""Sales export files: size limit and cleanup when the session lets go of them."""
+import gc
+import os
+from datetime import date
+
+import pytest
+
+from conftest import ORG_ID
+
+SALES = [
+    {"id": "s1", "created_at": "2024-04-01T10:00:00+00:00", "ref": "R1", "total": 3.0,
+     "sale_items": [{"product_id": "p1", "qty": 2, "unit_price": 1.5, "products": {"sku": "A", "name": "Apple"}}]},
+    {"id": "s2", "created_at": "2024-04-02T10:00:00+00:00", "ref": "R2", "total": 0.0, "sale_items": []},
+]
+
+
+@pytest.fixture
+def sales(rest):
+    rest.tables["sales"] = lambda method, params, body: SALES
+    return rest
+
+
+def test_csv_export_has_one_row_per_line(app, sales):
+    path = app.write_sales_export(ORG_ID, date(2024, 4, 1), date(2024, 4, 30))
+    try:
+        with open(path) as fh:
+            lines = fh.read().splitlines()
+    finally:
+        os.remove(path)
+
+    assert lines[0] == ",".join(app.EXPORT_COLUMNS)
+    assert lines[1:] == ["s1,2024-04-01T10:00:00+00:00,R1,3.0,p1,A,Apple,2.0,1.5,3.0",
+                         "s2,2024-04-02T10:00:00+00:00,R2,0.0,,,,,,"]
+
+
+def test_export_over_the_limit_is_refused_and_removed(app, sales, tmp_path, monkeypatch):
+    monkeypatch.setattr(app.tempfile, "tempdir", str(tmp_path))
+
+    with pytest.raises(ValueError, match="shorter date range"):
+        app.write_sales_export(ORG_ID, date(2024, 4, 1), date(2024, 4, 30), max_mb=100 / 1024 / 1024)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_file_is_removed_with_the_session_state(app, tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("x")
+    app.st.session_state["sales_export"] = app.SalesExport(str(path), "sales.csv")
+
+    app.st.session_state.clear()  # the session ended
+    gc.collect()
+
+    assert not path.exists()
+
+
+def test_logout_removes_the_file(app, tmp_path, monkeypatch):
+    path = tmp_path / "export.csv"
+    path.write_text("x")
+    app.st.session_state["sales_export"] = app.SalesExport(str(path), "sales.csv")
+    monkeypatch.setattr(app.st, "rerun", lambda: None)
+
+    app.logout()
+
+    assert not path.exists()
@@ -0,0 +1,153 @@
+"""Matching a count sheet to the snapshot, and committing it in chunks."""
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import ORG_ID
+
+T0 = "2024-04-13T08:00:00+00:00"
+
+
+def snapshot(app) -> pd.DataFrame:
+    """A stocktake sheet as stocktake_sheet returns it."""
+    return pd.DataFrame([
+        ("p1", "A", "Apple", "kg", "Fruit", 2.0, 10.0, T0),
+        ("p2", "B", "Banana", "kg", "Fruit", None, 5.0, T0),
+        ("p3", "C", "Cherry", "box", "Fruit", 4.5, 0.0, None),
+        ("p4", "D", "Date", "box", "Dried", 1.0, 7.0, T0),
+    ], columns=app.STOCKTAKE_COLUMNS).assign(counted=float("nan"))
+
+
+def counts(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["sku", "counted"], dtype=object)
+
+
+def test_bad_rows_are_reported_with_sheet_row(app):
+    variances, errors = app.diff_stocktake(snapshot(app), counts([
+        ("A", "9"),
+        ("ZZ", "1"),     # not in the snapshot
+        ("B", "abc"),
+        ("C", "-2"),
+        ("D", "3"),
+        ("D", "4"),
+    ]))
+
+    assert errors["row"].tolist() == [3, 4, 5, 6, 7]
+    assert errors["sku"].tolist() == ["ZZ", "B", "C", "D", "D"]
+    assert errors["error"].tolist() == [
+        "SKU not in this stocktake",
+        "counted is not a number",
+        "counted must be >= 0",
+        "SKU appears more than once in the file",
+        "SKU appears more than once in the file",
+    ]
+    assert variances["sku"].tolist() == ["A"]
+
+
+def test_column_names_are_matched_loosely_and_required(app):
+    variances, errors = app.diff_stocktake(snapshot(app), pd.DataFrame({" SKU ": ["A"], "Counted": [12]}))
+    assert errors.empty and variances["counted"].tolist() == [12]
+
+    with pytest.raises(ValueError, match="counted"):
+        app.diff_stocktake(snapshot(app), pd.DataFrame({"sku": ["A"], "qty": [1]}))
+
+
+def test_variance_and_value(app):
+    variances, errors = app.diff_stocktake(snapshot(app), counts([
+        ("A", "7.5"),    # 2.5 short at 2.00
+        ("B", "8"),      # 3 over, no unit cost
+        ("C", "2"),      # first count of a product without a stock row
+        ("D", "7"),      # matches the snapshot: not a variance
+    ]))
+
+    assert errors.empty
+    got = variances.set_index("sku")
+    assert got.index.tolist() == ["A", "B", "C"]
+    assert got["variance"].tolist() == [-2.5, 3.0, 2.0]
+    assert got["value_variance"].tolist() == [-5.0, 0.0, 9.0]
+    assert got.loc["A", "id"] == "p1" and got.loc["A", "stock_updated_at"] == T0
+
+
+def test_apply_sends_chunks_with_the_snapshot_timestamps(app, rest):
+    rest.rpcs["apply_stocktake"] = lambda body: {"applied": len(body["p_counts"]), "conflicts": []}
+    variances, _ = app.diff_stocktake(snapshot(app), counts([("A", "1"), ("B", "2"), ("C", "3")]))
+
+    applied, conflicts = app.apply_stocktake(ORG_ID, variances, note="April", chunk_size=2)
+
+    assert applied == 3 and conflicts.empty
+    calls = rest.rpc_calls("apply_stocktake")
+    assert [len(c["p_counts"]) for c in calls] == [2, 1]
+    assert {c["p_note"] for c in calls} == {"April"}
+    assert [r for c in calls for r in c["p_counts"]] == [
+        {"product_id": "p1", "qty": 1.0, "expected_updated_at": T0},
+        {"product_id": "p2", "qty": 2.0, "expected_updated_at": T0},
+        {"product_id": "p3", "qty": 3.0, "expected_updated_at": None},
+    ]
+
+
+def test_conflicts_from_every_chunk_are_returned(app, rest):
+    moved = "2024-04-13T09:30:00+00:00"
+
+    def apply(body):
+        stale = [r for r in body["p_counts"] if r["product_id"] in ("p1", "p3")]
+        return {"applied": len(body["p_counts"]) - len(stale),
+                "conflicts": [{"product_id": r["product_id"], "qty": 6, "stock_updated_at": moved}
+                              for r in stale]}
+
+    rest.rpcs["apply_stocktake"] = apply
+    variances, _ = app.diff_stocktake(snapshot(app), counts([("A", "1"), ("B", "2"), ("C", "3")]))
+
+    applied, conflicts = app.apply_stocktake(ORG_ID, variances, chunk_size=2)
+
+    assert applied == 1
+    assert conflicts.to_dict("records") == [
+        {"product_id": "p1", "qty": 6, "stock_updated_at": moved},
+        {"product_id": "p3", "qty": 6, "stock_updated_at": moved},
+    ]
+
+
+def test_failed_chunk_still_drops_cached_stock(app, rest):
+    calls = []
+    app.cached(ORG_ID, "stock", lambda: calls.append(1) or pd.DataFrame())
+    variances, _ = app.diff_stocktake(snapshot(app), counts([("A", "1")]))
+
+    with pytest.raises(Exception):
+        app.apply_stocktake(ORG_ID, variances)  # no RPC stub: the call fails
+
+    app.cached(ORG_ID, "stock", lambda: calls.append(1) or pd.DataFrame())
+    assert calls == [1, 1]
+
+
+def test_rpc_skips_rows_changed_since_the_snapshot(pg):
+    with pg.cursor() as cur:
+        # Stamp updated_at by hand; within one transaction the touch trigger's
+        # now() would give the count and the later sale the same timestamp.
+        cur.execute("ALTER TABLE public.stock DISABLE TRIGGER stock_touch_updated_at")
+        cur.execute("INSERT INTO public.orgs (name) VALUES ('stocktake test') RETURNING id")
+        org_id = cur.fetchone()[0]
+        ids = {}
+        for sku in ["A", "B", "C"]:
+            cur.execute("INSERT INTO public.products (org_id, sku, name) VALUES (%s, %s, %s) RETURNING id",
+                        (org_id, sku, f"Product {sku}"))
+            ids[sku] = cur.fetchone()[0]
+        cur.execute("INSERT INTO public.stock (product_id, qty, updated_at) VALUES "
+                    "(%s, 10, '2024-04-13 08:00+00'), (%s, 5, '2024-04-13 08:00+00')", (ids["A"], ids["B"]))
+        cur.execute("SELECT updated_at FROM public.stock WHERE product_id = %s", (ids["A"],))
+        seen = cur.fetchone()[0].isoformat()
+        # B was sold from after the count started; C never had a stock row.
+        cur.execute("UPDATE public.stock SET qty = 4, updated_at = '2024-04-13 09:30+00' WHERE product_id = %s",
+                    (ids["B"],))
+        cur.execute("SELECT public.apply_stocktake(%s, %s::jsonb, 'test')", (org_id, json.dumps([
+            {"product_id": str(ids["A"]), "qty": 8, "expected_updated_at": seen},
+            {"product_id": str(ids["B"]), "qty": 6, "expected_updated_at": seen},
+            {"product_id": str(ids["C"]), "qty": 3, "expected_updated_at": None},
+        ])))
+        res = cur.fetchone()[0]
+        cur.execute("SELECT p.sku, s.qty FROM public.stock s JOIN public.products p ON p.id = s.product_id "
+                    "WHERE p.org_id = %s ORDER BY p.sku", (org_id,))
+        stock = {sku: float(qty) for sku, qty in cur.fetchall()}
+
+    assert res["applied"] == 2
+    assert [(c["product_id"], c["qty"]) for c in res["conflicts"]] == [(str(ids["B"]), 4)]
+    assert stock == {"A": 8, "B": 4, "C": 3}
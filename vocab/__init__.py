@@ -0,0 +1,45 @@
+"""
+German vocabulary lists (A1, A2) as plain data.
+
+Importing this package has no side effects: no Streamlit, no network, and the
+CSV is only read when entries are requested. Each row of vocab.csv is
+`level,word,translation`.
+
+    from vocab import iter_vocab
+    for entry in iter_vocab(levels=["A1"]):
+        print(entry.word, entry.translation)
+"""
+import csv
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+DATA_FILE = Path(__file__).with_name("vocab.csv")
+LEVELS = ("A1", "A2")
+
+
+class VocabEntry(NamedTuple):
+    level: str
+    word: str
+    translation: str
+
+
+def iter_vocab(levels: Optional[Iterable[str]] = None, path: Path = DATA_FILE) -> Iterator[VocabEntry]:
+    """Stream entries from the CSV, optionally only for the given levels (case-insensitive)."""
+    wanted = {lvl.strip().upper() for lvl in levels} if levels else None
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            level = (row.get("level") or "").strip().upper()
+            if wanted is None or level in wanted:
+                yield VocabEntry(level, (row.get("word") or "").strip(), (row.get("translation") or "").strip())
+
+
+def load_vocab(levels: Optional[Iterable[str]] = None) -> List[VocabEntry]:
+    return list(iter_vocab(levels))
+
+
+def __getattr__(name: str) -> List[Tuple[str, str]]:
+    """`a1_vocab`, `a2_vocab`: (word, translation) pairs, built lazily on first access."""
+    level = name[:-len("_vocab")].upper() if name.endswith("_vocab") else ""
+    if level in LEVELS:
+        return [(e.word, e.translation) for e in iter_vocab([level])]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")